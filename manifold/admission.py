@@ -0,0 +1,289 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import asyncio
+import collections
+import functools
+import inspect
+import threading
+import time
+
+from thriftpy.thrift import TApplicationException
+
+OVERLOADED_MESSAGE = 'Server is overloaded, call rejected.'
+
+
+class AdmissionController:  # pylint: disable=too-many-instance-attributes
+    """Limits how many calls run at once.
+
+    A call that arrives while `max_in_flight` calls are running waits up to
+    `max_queue_wait` seconds for one of them to finish, and is rejected if
+    none does. Rejecting calls early keeps the calls that were admitted fast,
+    instead of letting every call slow down until all of them time out.
+
+    A `max_queue_wait` of None waits as long as it takes. When `max_queue` is
+    set, calls are rejected right away once that many are already waiting.
+    """
+
+    def __init__(self, max_in_flight, max_queue_wait=0, max_queue=None):
+        if max_in_flight < 1:
+            raise ValueError('max_in_flight must be at least 1.')
+
+        self.max_in_flight = max_in_flight
+        self.max_queue_wait = max_queue_wait
+        self.max_queue = max_queue
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._condition = threading.Condition()
+        # Calls waiting on an event loop, handed slots before threads are
+        self._async_waiters = collections.deque()
+
+    def acquire(self):
+        """Waits for a free slot to run a call in
+        :return: True if the call was admitted, False if it was rejected
+        """
+        with self._condition:
+            if self.in_flight >= self.max_in_flight and self._can_wait():
+                deadline = None
+                if self.max_queue_wait is not None:
+                    deadline = time.monotonic() + self.max_queue_wait
+                self.waiting += 1
+                try:
+                    while self.in_flight >= self.max_in_flight:
+                        remaining = None
+                        if deadline is not None:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                break
+                        self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+
+            if self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                return False
+
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def _can_wait(self):
+        if self.max_queue is not None and self.waiting >= self.max_queue:
+            return False
+        return self.max_queue_wait is None or self.max_queue_wait > 0
+
+    async def acquire_async(self):
+        """Waits for a free slot to run a call in, without blocking the
+        event loop
+        :return: True if the call was admitted, False if it was rejected
+        """
+        with self._condition:
+            if self.in_flight < self.max_in_flight:
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            if not self._can_wait():
+                self.rejected += 1
+                return False
+
+            waiter = _AsyncWaiter(asyncio.get_event_loop())
+            self._async_waiters.append(waiter)
+            self.waiting += 1
+
+        try:
+            await asyncio.wait_for(waiter.future, self.max_queue_wait)
+        except asyncio.TimeoutError:
+            with self._condition:
+                # The slot may have been handed over just as time ran out
+                if waiter.admitted:
+                    return True
+                self._async_waiters.remove(waiter)
+                self.waiting -= 1
+                self.rejected += 1
+            return False
+        except asyncio.CancelledError:
+            with self._condition:
+                admitted = waiter.admitted
+                if not admitted:
+                    self._async_waiters.remove(waiter)
+                    self.waiting -= 1
+            if admitted:
+                self.release()
+            raise
+        return True
+
+    def try_acquire(self):
+        """Takes a free slot without waiting for one
+        :return: True if a slot was free
+        """
+        with self._condition:
+            if self.in_flight >= self.max_in_flight:
+                return False
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        """Frees the slot of an admitted call once it finishes
+        """
+        with self._condition:
+            if self._async_waiters:
+                # Hand the slot straight to the longest waiting call
+                self._async_waiters.popleft().admit()
+                self.waiting -= 1
+                self.admitted += 1
+                return
+            self.in_flight -= 1
+            self._condition.notify()
+
+    @property
+    def stats(self):
+        """Current usage and counts of admitted and rejected calls
+        :return: dict
+        """
+        with self._condition:
+            return {
+                'max_in_flight': self.max_in_flight,
+                'max_queue': self.max_queue,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+            }
+
+
+class _AsyncWaiter:
+    """Call waiting for an `AdmissionController` slot on an event loop
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.admitted = False
+
+    def admit(self):
+        """Wakes the call up with a slot, from any thread
+        """
+        self.admitted = True
+        self.loop.call_soon_threadsafe(self._set_result)
+
+    def _set_result(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+def _reject_call(name):
+    return TApplicationException(
+        TApplicationException.INTERNAL_ERROR,
+        f'Too many concurrent calls to "{name}", call rejected.'
+    )
+
+
+def limit_concurrency(func, name, controller):
+    """Wraps a handler function so it only runs when `controller` admits it.
+    Rejected calls raise a TApplicationException.
+
+    :param func: Handler function, or `async def` handler function
+    :param name: RPC function name, for the rejection message
+    :param controller: AdmissionController for the function
+    :return: Wrapped function
+    """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if not await controller.acquire_async():
+                raise _reject_call(name)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                controller.release()
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not controller.acquire():
+            raise _reject_call(name)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            controller.release()
+
+    return wrapper
+
+
+class TAdmissionProcessor:
+    """Wraps a Thrift processor to only run the calls an
+    `AdmissionController` admits.
+
+    Rejected calls are answered right away with `rejection_exception`, if the
+    function declares it in its `throws`, or a TApplicationException if not.
+    """
+
+    def __init__(self, processor, controller, rejection_exception=None):
+        self.processor = processor
+        self.controller = controller
+        self.rejection_exception = rejection_exception
+
+    def __getattr__(self, name):
+        return getattr(self.processor, name)
+
+    @property
+    def stats(self):
+        return self.controller.stats
+
+    def reject(self, oprot, api, result, seqid):
+        """Answers a call that was not admitted
+        """
+        if result.oneway:
+            return
+        if self.rejection_exception is not None:
+            exc = self.rejection_exception()
+            if self.processor.handle_exception(exc, result):
+                self.processor.send_result(oprot, api, result, seqid)
+                return
+        exc = TApplicationException(
+            TApplicationException.INTERNAL_ERROR, OVERLOADED_MESSAGE
+        )
+        self.processor.send_exception(oprot, api, exc, seqid)
+
+    def process(self, iprot, oprot):
+        api, seqid, result, call = self.processor.process_in(iprot)
+
+        if isinstance(result, TApplicationException):
+            self.processor.send_exception(oprot, api, result, seqid)
+            return
+
+        if not self.controller.acquire():
+            self.reject(oprot, api, result, seqid)
+            return
+
+        try:
+            result.success = call()
+        except TApplicationException as exc:
+            self.processor.send_exception(oprot, api, exc, seqid)
+            return
+        except Exception as exc:  # pylint: disable=broad-except
+            # Raise if the function does not declare the exception
+            if not self.processor.handle_exception(exc, result):
+                raise
+        finally:
+            self.controller.release()
+
+        if not result.oneway:
+            self.processor.send_result(oprot, api, result, seqid)
@@ -0,0 +1,505 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import asyncio
+import collections
+import functools
+import inspect
+import logging
+import struct
+import time
+
+from thriftpy.protocol.binary import TBinaryProtocolFactory
+from thriftpy.thrift import (
+    TApplicationException,
+    TMessageType,
+    TMultiplexedProcessor,
+    TType,
+)
+
+from manifold.handler import read_iterator_async
+from manifold.pool import is_connection_error
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct('!i')
+
+
+class _IncompleteMessage(Exception):
+    """Raised when a buffer ends before the whole message could be read
+    """
+
+
+class _ReadBuffer:
+    """Minimal transport that reads a message out of received bytes
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    def read(self, size):
+        end = self.position + size
+        if end > len(self.data):
+            raise _IncompleteMessage()
+        chunk = bytes(self.data[self.position:end])
+        self.position = end
+        return chunk
+
+
+class _WriteBuffer:
+    """Minimal transport that collects a written message
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data.extend(data)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return bytes(self.data)
+
+
+def _skip_message(protocol):
+    """Reads past one whole message, without decoding it
+    """
+    protocol.read_message_begin()
+    protocol.skip(TType.STRUCT)
+    protocol.read_message_end()
+
+
+async def read_message(reader, buffer, proto_factory, framed=False,
+                       timeout=None):
+    """Reads the next whole Thrift message from a stream
+    :param reader: asyncio StreamReader for the connection
+    :param buffer: bytearray of bytes received but not yet read
+    :param proto_factory: Protocol factory the message is encoded with
+    :param framed: If the message is sent with the framed transport
+    :param timeout: Seconds to wait for data, or None to wait forever
+    :return: bytes of the message
+    """
+    if framed:
+        header = await asyncio.wait_for(
+            reader.readexactly(FRAME_HEADER.size), timeout
+        )
+        size, = FRAME_HEADER.unpack(header)
+        return await reader.readexactly(size)
+
+    while True:
+        if buffer:
+            message = _ReadBuffer(buffer)
+            try:
+                _skip_message(proto_factory.get_protocol(message))
+            except _IncompleteMessage:
+                pass
+            else:
+                data = bytes(buffer[:message.position])
+                del buffer[:message.position]
+                return data
+
+        chunk = await asyncio.wait_for(reader.read(65536), timeout)
+        if not chunk:
+            raise asyncio.IncompleteReadError(bytes(buffer), None)
+        buffer.extend(chunk)
+
+
+def get_service_processor(processor, proto_factory, data):
+    """Finds the processor that serves a message. For a multiplexed
+    processor, this is the one registered for the message's service name.
+
+    :param processor: TProcessor or TMultiplexedProcessor
+    :param proto_factory: Protocol factory to decode the message with
+    :param data: bytes of the message
+    :return: TProcessor, or None if no service matches
+    """
+    if not isinstance(processor, TMultiplexedProcessor):
+        return processor
+    iprot = proto_factory.get_protocol(_ReadBuffer(data))
+    name, _, _ = iprot.read_message_begin()
+    service_name, _, _ = name.partition(TMultiplexedProcessor.SEPARATOR)
+    return processor.processors.get(service_name)
+
+
+def is_coroutine_handler(processor, api):
+    """Checks if the handler function for `api` is an `async def`
+    :param processor: TProcessor the function is served from
+    :param api: Name of the RPC function
+    :return: bool
+    """
+    if processor is None:
+        return False
+    # pylint: disable=protected-access
+    func = getattr(processor._handler, api, None)
+    return inspect.iscoroutinefunction(func)
+
+
+class TAsyncServer:  # pylint: disable=too-many-instance-attributes
+    """Thrift server that runs on an asyncio event loop.
+
+    Handler functions defined with `async def` are awaited on the loop,
+    while regular handler functions are run in an executor so they do
+    not block it. Requests on the same connection are processed
+    concurrently, and responses are sent back as they complete.
+    """
+
+    def __init__(self, processor, *, host=None, port=None, unix_socket=None,
+                 proto_factory=None, framed=False, executor=None,
+                 client_timeout=None, loop=None):
+        # pylint: disable=too-many-arguments
+        self.processor = processor
+        self.host = host
+        self.port = port
+        self.unix_socket = unix_socket
+        self.proto_factory = proto_factory or TBinaryProtocolFactory()
+        self.framed = framed
+        self.executor = executor
+        self.client_timeout = client_timeout / 1000 if client_timeout else None
+        self.loop = loop or asyncio.new_event_loop()
+        self.server = None
+        self._connections = set()
+
+    async def start(self):
+        """Starts listening for connections on the event loop
+        """
+        if self.unix_socket:
+            self.server = await asyncio.start_unix_server(
+                self._accept, path=self.unix_socket
+            )
+        else:
+            self.server = await asyncio.start_server(
+                self._accept, host=self.host, port=self.port
+            )
+        return self.server
+
+    def serve(self):
+        """Starts the server and runs the event loop until closed
+        """
+        self.loop.run_until_complete(self.start())
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(self._shutdown())
+            self.loop.close()
+
+    def close(self):
+        """Stops the server, and the event loop if it is serving
+        """
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def _shutdown(self):
+        """Stops listening, and cancels every open connection
+        """
+        if self.server:
+            self.server.close()
+        connections = list(self._connections)
+        for task in connections:
+            task.cancel()
+        if connections:
+            await asyncio.wait(connections)
+        if self.server:
+            await self.server.wait_closed()
+
+    def _accept(self, reader, writer):
+        """Starts handling a new connection, and tracks it until it closes
+        """
+        task = asyncio.ensure_future(self._handle_connection(reader, writer))
+        self._connections.add(task)
+        task.add_done_callback(self._connections.discard)
+
+    async def _handle_connection(self, reader, writer):
+        """Reads messages off of a connection until it is closed
+        """
+        buffer = bytearray()
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            try:
+                while True:
+                    data = await read_message(
+                        reader, buffer, self.proto_factory, self.framed,
+                        self.client_timeout
+                    )
+                    task = asyncio.ensure_future(
+                        self._process(data, writer, lock)
+                    )
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            except (asyncio.IncompleteReadError, asyncio.TimeoutError,
+                    ConnectionError):
+                pass
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception(exc)
+
+            if tasks:
+                await asyncio.wait(tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _call(self, data, api, call):
+        """Awaits the handler function of a message if it is an
+        `async def`, or runs it in the executor if not
+        """
+        service_processor = get_service_processor(
+            self.processor, self.proto_factory, data
+        )
+        if is_coroutine_handler(service_processor, api):
+            result = await call()
+        else:
+            result = await asyncio.get_event_loop().run_in_executor(
+                self.executor, call
+            )
+        return await read_iterator_async(result, self.executor)
+
+    async def _process(self, data, writer, lock):
+        """Calls the handler function for a single message and writes
+        back the response
+        """
+        iprot = self.proto_factory.get_protocol(_ReadBuffer(data))
+        output = _WriteBuffer()
+        oprot = self.proto_factory.get_protocol(output)
+
+        try:
+            api, seqid, result, call = self.processor.process_in(iprot)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.exception(exc)
+            writer.close()
+            return
+
+        if isinstance(result, TApplicationException):
+            self.processor.send_exception(oprot, api, result, seqid)
+        else:
+            try:
+                result.success = await self._call(data, api, call)
+            except TApplicationException as exc:
+                self.processor.send_exception(oprot, api, exc, seqid)
+            except Exception as exc:  # pylint: disable=broad-except
+                if not self.processor.handle_exception(exc, result):
+                    logger.exception(exc)
+                    writer.close()
+                    return
+            if not output.data:
+                if result.oneway:
+                    return
+                self.processor.send_result(oprot, api, result, seqid)
+
+        response = output.getvalue()
+        async with lock:
+            if self.framed:
+                writer.write(FRAME_HEADER.pack(len(response)))
+            writer.write(response)
+            await writer.drain()
+
+
+def encode_call(service, api, seqid, proto_factory, *, args=(),
+                kwargs=None):
+    """Encodes a call to an RPC function as a Thrift message
+    :return: bytes of the message
+    """
+    # pylint: disable=too-many-arguments
+    args_struct = getattr(service, f'{api}_args')()
+    names = [
+        args_struct.thrift_spec[index][1]
+        for index in sorted(args_struct.thrift_spec)
+    ]
+    if len(args) > len(names):
+        raise TypeError(
+            f'{api}() takes {len(names)} arguments but {len(args)} were given'
+        )
+    kwargs = dict(zip(names, args), **(kwargs or {}))
+    for name, value in kwargs.items():
+        if name not in names:
+            raise TypeError(f"{api}() got an unexpected argument '{name}'")
+        setattr(args_struct, name, value)
+
+    result_struct = getattr(service, f'{api}_result')
+    message_type = TMessageType.ONEWAY if result_struct.oneway \
+        else TMessageType.CALL
+
+    output = _WriteBuffer()
+    oprot = proto_factory.get_protocol(output)
+    oprot.write_message_begin(api, message_type, seqid)
+    args_struct.write(oprot)
+    oprot.write_message_end()
+    return output.getvalue()
+
+
+def decode_reply(service, api, data, proto_factory):
+    """Decodes the reply to an RPC function call, raising any
+    exception the server sent back
+    :return: Return value of the RPC function
+    """
+    iprot = proto_factory.get_protocol(_ReadBuffer(data))
+    _, message_type, _ = iprot.read_message_begin()
+    if message_type == TMessageType.EXCEPTION:
+        exc = TApplicationException()
+        exc.read(iprot)
+        iprot.read_message_end()
+        raise exc
+
+    result = getattr(service, f'{api}_result')()
+    result.read(iprot)
+    iprot.read_message_end()
+
+    if getattr(result, 'success', None) is not None:
+        return result.success
+
+    for name, value in result.__dict__.items():
+        if name != 'success' and value is not None:
+            raise value
+
+    if hasattr(result, 'success'):
+        raise TApplicationException(TApplicationException.MISSING_RESULT)
+    return None
+
+
+class _AsyncConnection:
+    """An open asyncio stream to the server
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.buffer = bytearray()
+        self.last_used = time.time()
+
+    def is_stale(self, idle_timeout):
+        if idle_timeout and time.time() - self.last_used > idle_timeout:
+            return True
+        return self.reader.at_eof() or bool(self.buffer)
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncClient:  # pylint: disable=too-many-instance-attributes
+    """Awaitable client with the RPC functions of a Thrift service.
+
+    Connections are reused between calls, and at most `max_connections`
+    calls are in flight at once. Each call is given `timeout` seconds
+    unless a different timeout is passed to `call`. A client should only
+    be used from the event loop it was first called on.
+    """
+
+    def __init__(self, service, *, host='127.0.0.1', port=9090,
+                 proto_factory=None, framed=False, max_connections=10,
+                 idle_timeout=60, timeout=3):
+        # pylint: disable=too-many-arguments
+        if max_connections < 1:
+            raise ValueError('max_connections must be at least 1.')
+
+        self.service = service
+        self.host = host
+        self.port = port
+        self.proto_factory = proto_factory or TBinaryProtocolFactory()
+        self.framed = framed
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        self._idle = collections.deque()
+        self._seqid = 0
+        # Created on first use, so it belongs to the loop that calls it
+        self._semaphore = None
+
+    async def _acquire(self):
+        while self._idle:
+            connection = self._idle.pop()
+            if not connection.is_stale(self.idle_timeout):
+                return connection
+            connection.close()
+
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        return _AsyncConnection(reader, writer)
+
+    def _release(self, connection):
+        connection.last_used = time.time()
+        self._idle.append(connection)
+
+    async def _request(self, connection, api, data):
+        if self.framed:
+            connection.writer.write(FRAME_HEADER.pack(len(data)))
+        connection.writer.write(data)
+        await connection.writer.drain()
+
+        if getattr(self.service, f'{api}_result').oneway:
+            return None
+
+        reply = await read_message(
+            connection.reader, connection.buffer, self.proto_factory,
+            self.framed
+        )
+        return decode_reply(self.service, api, reply, self.proto_factory)
+
+    async def call(self, api, *args, timeout=None, **kwargs):
+        """Calls an RPC function by name
+        :param api: Name of the RPC function
+        :param timeout: Seconds to wait for a connection and the reply,
+                        instead of `timeout`
+        :return: Return value of the RPC function
+        """
+        if api not in self.service.thrift_services:
+            raise AttributeError(f"Unknown RPC function '{api}'")
+
+        self._seqid += 1
+        data = encode_call(
+            self.service, api, self._seqid, self.proto_factory, args=args,
+            kwargs=kwargs
+        )
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+
+        timeout = self.timeout if timeout is None else timeout
+        async with self._semaphore:
+            # Connecting counts against the timeout of the call
+            start = time.monotonic()
+            connection = await asyncio.wait_for(self._acquire(), timeout)
+            if timeout is not None:
+                timeout = max(timeout - (time.monotonic() - start), 0)
+            try:
+                result = await asyncio.wait_for(
+                    self._request(connection, api, data), timeout
+                )
+            except BaseException as exc:
+                if is_connection_error(exc):
+                    connection.close()
+                else:
+                    self._release(connection)
+                raise
+            self._release(connection)
+            return result
+
+    def __getattr__(self, name):
+        if name not in self.service.thrift_services:
+            raise AttributeError(
+                f"'{type(self).__name__}' object has no attribute '{name}'"
+            )
+        return functools.partial(self.call, name)
+
+    def __dir__(self):
+        return list(self.service.thrift_services)
+
+    def close(self):
+        """Closes every idle connection
+        """
+        while self._idle:
+            self._idle.pop().close()
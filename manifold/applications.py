@@ -0,0 +1,298 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import inspect
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core import signals
+from django.utils.module_loading import import_string
+
+from manifold.handler import handler
+from manifold.http import (
+    call_thrift_function, call_thrift_function_async, encode_body,
+    get_functions, get_media_type, import_views, load_body,
+    make_async_batch_caller, make_batch_caller, negotiate_codecs,
+    unsupported_media_type,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _RPCApplication:
+    """Base for the applications that call RPC functions straight from the
+    request, without Django's URL resolving, middleware, or response
+    classes.
+
+    Requests go to `/<function name>`, or the batch path, and get the same
+    responses as the Django views. Each of `hooks` is called with the
+    request and function name before the call is made, and can stop it by
+    returning a tuple of an HTTP status line and a response dict.
+
+    Subclasses pass `batch_caller_factory`, which creates the function that
+    runs batch calls from the dictionary of `get_functions` and the
+    `default` settings.
+    """
+
+    def __init__(self, batch_caller_factory, hooks=None):
+        self._batch_caller_factory = batch_caller_factory
+        self._hooks = hooks
+        self._functions = None
+        self._batch_path = None
+        self._call_batch = None
+
+    def _setup(self):
+        import_views()
+        thrift_settings = settings.MANIFOLD['default']
+
+        hooks = self._hooks
+        if hooks is None:
+            hooks = thrift_settings.get('http_hooks', [])
+        self._hooks = [
+            import_string(hook) if isinstance(hook, str) else hook
+            for hook in hooks
+        ]
+
+        functions = get_functions(handler.get_current_mappings())
+        self._batch_path = thrift_settings.get('http_batch_path')
+        self._call_batch = self._batch_caller_factory(
+            functions, thrift_settings
+        )
+        self._functions = functions
+
+    def _route(self, method, name, content_type, request_codec):
+        """Checks that a request calls an RPC function
+        :return: Tuple of the status and response to stop the call with,
+                 or None if the call can go ahead
+        """
+        if method != 'POST':
+            return '405 Method Not Allowed', {
+                'response': 'error',
+                'error': 'RPC functions are called with POST.'
+            }
+
+        if name not in self._functions and name != self._batch_path:
+            return '404 Not Found', {
+                'response': 'error',
+                'error': f'Unknown RPC function "{name}".'
+            }
+
+        if request_codec is None:
+            return '415 Unsupported Media Type', unsupported_media_type(
+                content_type
+            )
+        return None
+
+    @staticmethod
+    def _server_error(exc):
+        logger.exception(exc)
+        return '500 Internal Server Error', {
+            'response': 'error',
+            'error': 'Internal server error.'
+        }
+
+
+class WSGIApplication(_RPCApplication):
+    """WSGI application that calls RPC functions straight from the request.
+    Hooks are called with the WSGI environ.
+    """
+
+    def __init__(self, hooks=None):
+        super().__init__(self._make_batch_caller, hooks=hooks)
+
+    @staticmethod
+    def _make_batch_caller(functions, thrift_settings):
+        return make_batch_caller(
+            functions, thrift_settings.get('http_batch_workers', 1)
+        )
+
+    @staticmethod
+    def _respond(start_response, status, data, codec, accept_encoding):
+        body, headers = encode_body(data, codec, accept_encoding)
+        start_response(status, headers)
+        return [body]
+
+    def _read_body(self, environ):
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        return environ['wsgi.input'].read(length) if length > 0 else b''
+
+    def _call(self, environ, name, content_type, codec):
+        stopped = self._route(
+            environ['REQUEST_METHOD'], name, content_type, codec
+        )
+        if stopped is not None:
+            return stopped
+
+        for hook in self._hooks:
+            stopped = hook(environ, name)
+            if stopped is not None:
+                return stopped
+
+        if name not in self._functions:
+            body = self._read_body(environ)
+            return '200 OK', self._call_batch(load_body(body, codec))
+
+        handler_function, thrift_args = self._functions[name]
+        data = None
+        if thrift_args:
+            data = load_body(self._read_body(environ), codec)
+        return '200 OK', call_thrift_function(
+            name, handler_function, thrift_args, data
+        )
+
+    def __call__(self, environ, start_response):
+        if self._functions is None:
+            self._setup()
+
+        signals.request_started.send(sender=type(self), environ=environ)
+        try:
+            name = environ.get('PATH_INFO', '').strip('/')
+            content_type = get_media_type(environ.get('CONTENT_TYPE'))
+            request_codec, response_codec = negotiate_codecs(
+                content_type, environ.get('HTTP_ACCEPT')
+            )
+            try:
+                status, data = self._call(
+                    environ, name, content_type, request_codec
+                )
+            except Exception as exc:  # pylint: disable=broad-except
+                status, data = self._server_error(exc)
+            return self._respond(
+                start_response, status, data, response_codec,
+                environ.get('HTTP_ACCEPT_ENCODING')
+            )
+        finally:
+            signals.request_finished.send(sender=type(self))
+
+
+class ASGIApplication(_RPCApplication):
+    """ASGI application that calls RPC functions straight from the request.
+    `async def` handler functions are awaited on the event loop, and other
+    handler functions run in a thread pool of `workers` threads, or the
+    event loop's default executor. Hooks are called with the ASGI scope,
+    and may be `async def` functions.
+    """
+
+    def __init__(self, hooks=None, workers=None):
+        super().__init__(self._make_batch_caller, hooks=hooks)
+        self._workers = workers
+        self._executor = None
+
+    def _make_batch_caller(self, functions, thrift_settings):
+        workers = self._workers
+        if workers is None:
+            workers = thrift_settings.get('http_async_workers')
+        if workers:
+            self._executor = ThreadPoolExecutor(max_workers=workers)
+        return make_async_batch_caller(functions, self._executor)
+
+    @staticmethod
+    async def _respond(send, status, data, codec, accept_encoding):
+        body, headers = encode_body(data, codec, accept_encoding)
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    async def _read_body(receive):
+        body = b''
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            body += message.get('body', b'')
+            if not message.get('more_body', False):
+                break
+        return body
+
+    async def _call(self, scope, receive, name, content_type, codec):
+        stopped = self._route(scope['method'], name, content_type, codec)
+        if stopped is not None:
+            return stopped
+
+        for hook in self._hooks:
+            stopped = hook(scope, name)
+            if inspect.isawaitable(stopped):
+                stopped = await stopped
+            if stopped is not None:
+                return stopped
+
+        body = await self._read_body(receive)
+        if name not in self._functions:
+            return '200 OK', await self._call_batch(load_body(body, codec))
+
+        handler_function, thrift_args = self._functions[name]
+        data = load_body(body, codec) if thrift_args else None
+        return '200 OK', await call_thrift_function_async(
+            name, handler_function, thrift_args, data, self._executor
+        )
+
+    @staticmethod
+    async def _lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(
+                f'ASGI application cannot handle "{scope["type"]}" scopes.'
+            )
+
+        if self._functions is None:
+            self._setup()
+
+        name = scope['path'].strip('/')
+        headers = dict(scope.get('headers', []))
+        content_type = get_media_type(
+            headers.get(b'content-type', b'').decode('latin-1')
+        )
+        request_codec, response_codec = negotiate_codecs(
+            content_type, headers.get(b'accept', b'').decode('latin-1')
+        )
+        try:
+            status, data = await self._call(
+                scope, receive, name, content_type, request_codec
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            status, data = self._server_error(exc)
+        await self._respond(
+            send, status, data, response_codec,
+            headers.get(b'accept-encoding', b'').decode('latin-1')
+        )
+
+
+# Lightweight WSGI application that skips Django's request handling
+rpc_application = WSGIApplication()
+
+# ASGI application for handler functions that are `async def`
+asgi_application = ASGIApplication()
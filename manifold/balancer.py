@@ -0,0 +1,295 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import logging
+import random
+import threading
+import time
+from concurrent import futures
+
+from manifold.pool import ClientPoolExhausted, is_connection_error
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('p2c', 'least_requests')
+
+
+def parse_endpoint(endpoint):
+    """Parses an endpoint setting into a host and port
+    :param endpoint: "host:port" string, or dict with `host` and `port`
+    :return: Tuple of host and port
+    """
+    if isinstance(endpoint, dict):
+        return endpoint.get('host', '127.0.0.1'), endpoint.get('port', 9090)
+    host, _, port = endpoint.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f'Endpoint "{endpoint}" must be "host:port".')
+    return host, int(port)
+
+
+class Endpoint:
+    """A single service host, with the stats used to balance calls to it
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = 0
+
+    @property
+    def address(self):
+        return f'{self.pool.host}:{self.pool.port}'
+
+    def is_available(self, now):
+        return self.ejected_until <= now
+
+    def __repr__(self):
+        return f'<Endpoint {self.address} outstanding={self.outstanding}>'
+
+
+class LoadBalancer:  # pylint: disable=too-many-instance-attributes
+    """Spreads calls over a set of endpoints serving the same service.
+
+    Calls go to the endpoint with the fewest outstanding requests, either
+    out of every endpoint (`least_requests`), or out of two picked at random
+    (`p2c`). An endpoint that fails `max_failures` calls in a row with a
+    connection error is ejected for `ejection_time` seconds, after which it
+    is tried again. If every endpoint is ejected, all of them are used.
+
+    Calls to the idempotent `hedge_functions` that have not been answered
+    after `hedge_delay` seconds are sent again to another endpoint, and
+    whichever reply arrives first is used. Hedges are only sent when
+    another endpoint has a connection free. `hedge_stats` counts how many
+    calls were hedged, and how many of those the hedge won.
+    """
+
+    def __init__(self, pools, *, policy='p2c', max_failures=1,
+                 ejection_time=30, hedge_functions=(), hedge_delay=0.05):
+        # pylint: disable=too-many-arguments
+        if not pools:
+            raise ValueError('At least one endpoint is required.')
+        if policy not in POLICIES:
+            raise ValueError(
+                f'Unknown load balancing policy "{policy}", '
+                f'expected one of {POLICIES}.'
+            )
+
+        self.endpoints = [Endpoint(pool) for pool in pools]
+        self.service = pools[0].service
+        self.policy = policy
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self.hedge_functions = frozenset(hedge_functions)
+        self.hedge_delay = hedge_delay
+        self.hedge_stats = {'calls': 0, 'hedged': 0, 'hedge_wins': 0}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def choose(self, exclude=()):
+        """Picks the endpoint to send the next call to, and counts the call
+        as outstanding on it. Every choice must be paired with a `record`.
+
+        :param exclude: Endpoints that should not be picked if possible
+        :return: Endpoint
+        """
+        now = time.time()
+        with self._lock:
+            candidates = [
+                endpoint for endpoint in self.endpoints
+                if endpoint not in exclude and endpoint.is_available(now)
+            ]
+            if not candidates:
+                candidates = [
+                    endpoint for endpoint in self.endpoints
+                    if endpoint not in exclude
+                ] or self.endpoints
+
+            if self.policy == 'p2c' and len(candidates) > 2:
+                candidates = random.sample(candidates, 2)
+            else:
+                random.shuffle(candidates)
+
+            endpoint = min(candidates, key=lambda item: item.outstanding)
+            endpoint.outstanding += 1
+            return endpoint
+
+    def record(self, endpoint, exc=None):
+        """Records the outcome of a call to an endpoint
+        :param endpoint: Endpoint returned from `choose`
+        :param exc: Exception the call raised, if any
+        """
+        with self._lock:
+            endpoint.outstanding -= 1
+            if exc is None or not is_connection_error(exc):
+                endpoint.failures = 0
+                return
+
+            endpoint.failures += 1
+            if endpoint.failures >= self.max_failures:
+                endpoint.ejected_until = time.time() + self.ejection_time
+                logger.warning(
+                    'Ejecting RPC endpoint %s for %ss after %s failures: %s',
+                    endpoint.address, self.ejection_time, endpoint.failures,
+                    exc
+                )
+
+    def acquire(self, exclude=(), block=True):
+        """Picks an endpoint and checks a connection out of its pool. When
+        an endpoint can not be connected to, the next best one is tried,
+        since no request has reached the server yet.
+
+        :param exclude: Endpoints that should not be picked if possible
+        :param block: Whether to wait for a connection to become free
+        :return: Tuple of Endpoint and _PooledConnection
+        """
+        tried = list(exclude)
+        while True:
+            endpoint = self.choose(exclude=tried)
+            try:
+                return endpoint, endpoint.pool.acquire(block=block)
+            except ClientPoolExhausted:
+                # A busy endpoint is not an unhealthy one
+                self.record(endpoint)
+                tried.append(endpoint)
+                if all(item in tried for item in self.endpoints):
+                    raise
+            except Exception as exc:
+                self.record(endpoint, exc)
+                tried.append(endpoint)
+                if all(item in tried for item in self.endpoints):
+                    raise
+
+    def release(self, endpoint, connection, exc=None):
+        """Returns a connection from `acquire` after a call
+        :param exc: Exception the call raised, if any
+        """
+        endpoint.pool.finish(connection, exc)
+        self.record(endpoint, exc)
+
+    def _call_connection(self, endpoint, connection, api, args, kwargs):
+        try:
+            result = getattr(connection.client, api)(*args, **kwargs)
+        except BaseException as exc:
+            self.release(endpoint, connection, exc)
+            raise
+        self.release(endpoint, connection)
+        return result
+
+    def _count(self, stat):
+        with self._lock:
+            self.hedge_stats[stat] += 1
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                workers = sum(item.pool.max_size for item in self.endpoints)
+                self._executor = futures.ThreadPoolExecutor(
+                    max_workers=workers * 2
+                )
+            return self._executor
+
+    def _hedge(self, first, endpoint, api, args, kwargs):
+        """Sends the hedge of a call to any endpoint but the original's,
+        if one has a connection free right away
+        """
+        hedge_endpoint, connection = self.acquire(
+            exclude=[endpoint], block=False
+        )
+        if first.done():
+            # The original call was answered while connecting
+            self.release(hedge_endpoint, connection)
+            raise futures.CancelledError()
+        return self._call_connection(
+            hedge_endpoint, connection, api, args, kwargs
+        )
+
+    def _hedged_call(self, api, args, kwargs):
+        """Sends a call, and a second copy to another endpoint if the first
+        has not been answered within `hedge_delay`
+        """
+        self._count('calls')
+        executor = self._get_executor()
+
+        endpoint, connection = self.acquire()
+        first = executor.submit(
+            self._call_connection, endpoint, connection, api, args, kwargs
+        )
+        try:
+            return first.result(timeout=self.hedge_delay)
+        except futures.TimeoutError:
+            pass
+
+        if len(self.endpoints) < 2:
+            return first.result()
+
+        self._count('hedged')
+        hedge = executor.submit(
+            self._hedge, first, endpoint, api, args, kwargs
+        )
+
+        pending = {first, hedge}
+        while pending:
+            done, pending = futures.wait(
+                pending, return_when=futures.FIRST_COMPLETED
+            )
+            # The original reply is used as soon as it arrives
+            if first in done and first.exception() is None:
+                break
+            if hedge in done and hedge.exception() is None:
+                self._count('hedge_wins')
+                return hedge.result()
+        # The original reply, or its error if the hedge failed too
+        return first.result()
+
+    def call(self, api, *args, **kwargs):
+        """Calls an RPC function on the best available endpoint
+        """
+        if api in self.hedge_functions:
+            return self._hedged_call(api, args, kwargs)
+
+        endpoint, connection = self.acquire()
+        return self._call_connection(endpoint, connection, api, args, kwargs)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        for endpoint in self.endpoints:
+            endpoint.pool.close()
+
+
+class BalancedClient:
+    """Client with the RPC functions of a service, that sends each call to
+    an endpoint picked by a `LoadBalancer`. Safe to share between threads.
+    """
+
+    def __init__(self, balancer):
+        self.balancer = balancer
+
+    def __getattr__(self, name):
+        if name not in self.balancer.service.thrift_services:
+            raise AttributeError(
+                f"'{type(self).__name__}' object has no attribute '{name}'"
+            )
+
+        def call(*args, **kwargs):
+            return self.balancer.call(name, *args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+    def __dir__(self):
+        return list(self.balancer.service.thrift_services)
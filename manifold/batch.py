@@ -0,0 +1,174 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import asyncio
+import functools
+import inspect
+import threading
+from concurrent import futures
+
+
+class _Batch:
+    """Calls gathered to be run together
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.full = threading.Event()
+
+
+def _fail(calls, exc):
+    for _, future in calls:
+        # Callers of async batches may have been cancelled
+        if not future.done():
+            future.set_exception(exc)
+
+
+def _check_results(calls, results):
+    """Lists the results of a batch function, and checks there is one for
+    each call
+    :raises TypeError: If the results are not iterable
+    :raises ValueError: If there are too many or too few results
+    """
+    results = list(results)
+    if len(results) != len(calls):
+        raise ValueError(
+            f'Batch function returned {len(results)} results '
+            f'for {len(calls)} calls.'
+        )
+    return results
+
+
+def _resolve(calls, results):
+    """Hands each caller its own result. Exceptions in the results only
+    fail the call they belong to.
+    """
+    for (_, future), result in zip(calls, results):
+        if future.done():
+            continue
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+
+
+class Batcher:  # pylint: disable=too-many-instance-attributes
+    """Gathers concurrent calls to an RPC function into a single call to a
+    batch function.
+
+    The batch function takes a list of argument tuples, one per call, and
+    returns a list of results in the same order. Calls are gathered for up
+    to `window` seconds after the first one arrives, or until there are
+    `max_batch_size` of them.
+    """
+
+    def __init__(self, func, max_batch_size=100, window=0.005):
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size must be at least 1.')
+
+        self.func = func
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self.batches = 0
+
+        self._batch = None
+        self._lock = threading.Lock()
+        self._async_batch = None
+        self._async_timer = None
+
+    def call(self, args):
+        """Adds a call to the current batch, and waits for its result. The
+        first call of a batch waits out the window and runs the batch.
+
+        :param args: Tuple of the call's arguments
+        :return: Result of the call
+        """
+        future = futures.Future()
+        with self._lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = _Batch()
+            batch.calls.append((args, future))
+            if len(batch.calls) >= self.max_batch_size:
+                self._batch = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._batch is batch:
+                    self._batch = None
+                self.batches += 1
+            self._run(batch.calls)
+
+        return future.result()
+
+    def _run(self, calls):
+        try:
+            results = _check_results(
+                calls, self.func([args for args, _ in calls])
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            _fail(calls, exc)
+            return
+        _resolve(calls, results)
+
+    async def call_async(self, args):
+        """Adds a call to the current batch of an `async def` batch
+        function, and waits for its result
+        """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        if self._async_batch is None:
+            self._async_batch = []
+            self._async_timer = loop.call_later(self.window, self._flush)
+        self._async_batch.append((args, future))
+        if len(self._async_batch) >= self.max_batch_size:
+            self._async_timer.cancel()
+            self._flush()
+        return await future
+
+    def _flush(self):
+        calls, self._async_batch = self._async_batch, None
+        self.batches += 1
+        asyncio.ensure_future(self._run_async(calls))
+
+    async def _run_async(self, calls):
+        try:
+            results = _check_results(
+                calls, await self.func([args for args, _ in calls])
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            _fail(calls, exc)
+            return
+        _resolve(calls, results)
+
+    def wrap(self):
+        """Creates the function that serves each single call
+        :return: Function, or `async def` function for async batch functions
+        """
+        if inspect.iscoroutinefunction(self.func):
+            @functools.wraps(self.func)
+            async def async_wrapper(*args):
+                return await self.call_async(args)
+
+            return async_wrapper
+
+        @functools.wraps(self.func)
+        def wrapper(*args):
+            return self.call(args)
+
+        return wrapper
@@ -0,0 +1,213 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import collections
+import functools
+import hashlib
+import inspect
+import json
+import threading
+import time
+
+from django.core.cache import caches
+
+from manifold.serialize import serialize
+
+BACKENDS = ('local', 'django')
+
+_MISSING = object()
+
+
+def make_cache_key(signature, args, kwargs):
+    """Builds a cache key from the arguments of an RPC call. Arguments given
+    by position or by keyword give the same key, and Thrift structs are
+    compared by their fields.
+
+    :param signature: inspect.Signature of the handler function
+    :param args: Positional arguments of the call
+    :param kwargs: Keyword arguments of the call
+    :return: str
+    """
+    bound = signature.bind(*args, **kwargs)
+    data = json.dumps(
+        serialize(dict(bound.arguments)), sort_keys=True, default=repr
+    )
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class LocalCache:
+    """Thread-safe in-process cache that evicts the least recently used
+    entry once it holds `max_size` entries
+    """
+
+    def __init__(self, max_size=1024):
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1.')
+
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoCache:
+    """Cache stored in one of Django's configured `CACHES`, so results are
+    shared between processes. Size limits are up to the cache backend.
+    """
+
+    def __init__(self, name, alias='default'):
+        self.name = name
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _generation_key(self):
+        return f'manifold:{self.name}:generation'
+
+    def _key(self, key):
+        # Clearing bumps the generation, which orphans every older entry
+        generation = self.cache.get(self._generation_key(), 0)
+        return f'manifold:{self.name}:{generation}:{key}'
+
+    def get(self, key):
+        return self.cache.get(self._key(key), _MISSING)
+
+    def set(self, key, value, ttl):
+        self.cache.set(self._key(key), value, ttl)
+
+    def delete(self, key):
+        self.cache.delete(self._key(key))
+
+    def clear(self):
+        try:
+            self.cache.incr(self._generation_key())
+        except ValueError:
+            self.cache.set(self._generation_key(), 1, None)
+
+
+class ResultCache:
+    """Caches the results of a handler function by its arguments for `ttl`
+    seconds. Calls that raise are not cached.
+
+    Cached results are shared between calls, so they must not be modified.
+    """
+
+    def __init__(self, name, ttl=60, max_size=1024, backend='local',
+                 alias='default'):
+        if backend not in BACKENDS:
+            raise ValueError(
+                f'Unknown cache backend "{backend}", '
+                f'expected one of {BACKENDS}.'
+            )
+
+        self.name = name
+        self.ttl = ttl
+        if backend == 'django':
+            self.backend = DjangoCache(name, alias=alias)
+        else:
+            self.backend = LocalCache(max_size=max_size)
+
+        self.hits = 0
+        self.misses = 0
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def key(self, *args, **kwargs):
+        return make_cache_key(self._signature, args, kwargs)
+
+    def wrap(self, func):
+        """Wraps a handler function to look its results up in the cache
+        :param func: Handler function, or `async def` handler function
+        :return: Wrapped function
+        """
+        self._signature = inspect.signature(func)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key = self.key(*args, **kwargs)
+                value = self._get(key)
+                if value is _MISSING:
+                    value = await func(*args, **kwargs)
+                    self.backend.set(key, value, self.ttl)
+                return value
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = self.key(*args, **kwargs)
+            value = self._get(key)
+            if value is _MISSING:
+                value = func(*args, **kwargs)
+                self.backend.set(key, value, self.ttl)
+            return value
+
+        return wrapper
+
+    def _get(self, key):
+        value = self.backend.get(key)
+        with self._lock:
+            if value is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def invalidate(self, *args, **kwargs):
+        """Removes the cached result of a call with the given arguments
+        """
+        self.backend.delete(self.key(*args, **kwargs))
+
+    def clear(self):
+        """Removes every cached result of the function
+        """
+        self.backend.clear()
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
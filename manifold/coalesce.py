@@ -0,0 +1,109 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import asyncio
+import functools
+import inspect
+import threading
+
+from manifold.cache import make_cache_key
+
+
+class _Flight:
+    """A call in progress, that identical calls wait on
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc = None
+
+
+class SingleFlight:
+    """Runs identical concurrent calls to a handler function only once.
+
+    While a call is running, other calls with equal arguments wait for it
+    and get its result, or raise its exception, instead of running the
+    function again. Calls that arrive after it finished run as usual.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.coalesced = 0
+        self._flights = {}
+        self._futures = {}
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def wrap(self, func):
+        """Wraps a handler function to share the execution of identical
+        concurrent calls
+        :param func: Handler function, or `async def` handler function
+        :return: Wrapped function
+        """
+        self._signature = inspect.signature(func)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key = make_cache_key(self._signature, args, kwargs)
+                future = self._futures.get(key)
+                if future is None:
+                    future = asyncio.ensure_future(func(*args, **kwargs))
+                    self._futures[key] = future
+                    future.add_done_callback(
+                        lambda _: self._futures.pop(key, None)
+                    )
+                else:
+                    self._count()
+                # Shielded, so one caller being cancelled leaves the
+                # call running for the others
+                return await asyncio.shield(future)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = make_cache_key(self._signature, args, kwargs)
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                else:
+                    self.coalesced += 1
+
+            if not leader:
+                flight.done.wait()
+                if flight.exc is not None:
+                    raise flight.exc
+                return flight.result
+
+            try:
+                flight.result = func(*args, **kwargs)
+            except BaseException as exc:
+                flight.exc = exc
+                raise
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+            return flight.result
+
+        return wrapper
+
+    def _count(self):
+        with self._lock:
+            self.coalesced += 1
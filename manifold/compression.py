@@ -0,0 +1,110 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import gzip
+import zlib
+
+from manifold.encoding import parse_qualities
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+def _gzip(body, level):
+    return gzip.compress(body, compresslevel=level)
+
+
+def _deflate(body, level):
+    # HTTP's "deflate" is the zlib format, not a raw deflate stream
+    return zlib.compress(body, level)
+
+
+def _zstd(body, level):
+    # Compressors can not be shared between threads
+    return zstandard.ZstdCompressor(level=level).compress(body)
+
+
+# Content codings, to the function that compresses with them and the
+# library it needs
+ENCODINGS = {
+    'zstd': (_zstd, zstandard),
+    'gzip': (_gzip, gzip),
+    'deflate': (_deflate, zlib),
+}
+
+
+class Compressor:
+    """Compresses HTTP response bodies with the content coding a client
+    accepts. Bodies smaller than `min_size` bytes are sent as they are.
+
+    Codings are picked by their quality in the client's `Accept-Encoding`,
+    with ties broken by the order of `encodings`. Codings whose library is not
+    installed are skipped.
+    """
+
+    def __init__(self, min_size=1024, level=6,
+                 encodings=('zstd', 'gzip', 'deflate')):
+        if not 1 <= level <= 9:
+            raise ValueError('Compression level must be from 1 to 9.')
+        for encoding in encodings:
+            if encoding not in ENCODINGS:
+                raise ValueError(
+                    f'Unknown content coding "{encoding}", '
+                    f'expected one of: {", ".join(ENCODINGS)}.'
+                )
+
+        self.min_size = min_size
+        self.level = level
+        self.encodings = [
+            encoding for encoding in encodings
+            if ENCODINGS[encoding][1] is not None
+        ]
+
+    def negotiate(self, accept_encoding):
+        """Picks the content coding to compress a response with
+        :param accept_encoding: Value of the `Accept-Encoding` header
+        :return: Name of the content coding, or None to not compress
+        """
+        qualities = dict(reversed(parse_qualities(accept_encoding)))
+        best, best_quality = None, 0
+        for encoding in self.encodings:
+            # Codings the client does not name get the quality of "*"
+            quality = qualities.get(encoding, qualities.get('*', 0))
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compress(self, body, accept_encoding):
+        """Compresses a response body, if it is large enough and the client
+        accepts a supported content coding
+
+        :param body: bytes of the response body
+        :param accept_encoding: Value of the `Accept-Encoding` header
+        :return: Tuple of the body to send and its content coding, which is
+                 None if the body was not compressed
+        """
+        if len(body) < self.min_size:
+            return body, None
+
+        encoding = self.negotiate(accept_encoding)
+        if encoding is None:
+            return body, None
+
+        compressed = ENCODINGS[encoding][0](body, self.level)
+        if len(compressed) >= len(body):
+            return body, None
+        return compressed, encoding
@@ -0,0 +1,217 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import functools
+import importlib
+import json
+import logging
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover
+    cbor2 = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+JSON_BACKENDS = ('json', 'orjson', 'ujson', 'rapidjson')
+
+# Encodes the types Django's JsonResponse does, for the faster backends
+_encode_default = DjangoJSONEncoder().default
+
+
+class JSONCodec:
+    """Encodes and decodes the JSON bodies of HTTP calls with one of the
+    `JSON_BACKENDS`. Both work on bytes, so request bodies are parsed
+    without decoding them to a string first.
+    """
+
+    media_type = 'application/json'
+
+    def __init__(self, backend='json'):
+        if backend not in JSON_BACKENDS:
+            raise ValueError(
+                f'Unknown JSON backend "{backend}", '
+                f'expected one of: {", ".join(JSON_BACKENDS)}.'
+            )
+
+        module = None
+        if backend != 'json':
+            try:
+                module = importlib.import_module(backend)
+            except ImportError:
+                logger.warning(
+                    'JSON backend "%s" is not installed, '
+                    'using the json module instead.', backend
+                )
+                backend = 'json'
+
+        self.backend = backend
+        self._module = module
+
+    def loads(self, body):
+        """Parses JSON
+        :param body: bytes of JSON
+        :return: Parsed data
+        :raises ValueError: If the body is not valid JSON
+        """
+        if self._module is None:
+            return json.loads(body)
+        return self._module.loads(body)
+
+    def dumps(self, data):
+        """Encodes data as JSON
+        :param data: Data to encode, such as a serialized response
+        :return: bytes of JSON
+        """
+        if self.backend == 'orjson':
+            return self._module.dumps(
+                data, default=_encode_default,
+                option=self._module.OPT_NON_STR_KEYS
+            )
+        if self._module is not None:  # ujson and rapidjson
+            return self._module.dumps(
+                data, ensure_ascii=False, default=_encode_default
+            ).encode('utf-8')
+        return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+
+
+@functools.lru_cache(maxsize=None)
+def get_json_codec(backend='json'):
+    """Gets the shared codec of a JSON backend
+    :param backend: One of `JSON_BACKENDS`
+    :return: JSONCodec
+    """
+    return JSONCodec(backend)
+
+
+class MessagePackCodec:
+    """Encodes and decodes MessagePack bodies with `msgpack`
+    """
+
+    media_type = 'application/msgpack'
+
+    @staticmethod
+    def loads(body):
+        """Parses MessagePack
+        :param body: bytes of MessagePack
+        :return: Parsed data
+        :raises ValueError: If the body is not valid MessagePack
+        """
+        try:
+            return msgpack.unpackb(body, raw=False, strict_map_key=False)
+        except (msgpack.UnpackException, TypeError) as exc:
+            raise ValueError(str(exc)) from exc
+
+    @staticmethod
+    def dumps(data):
+        """Encodes data as MessagePack
+        :param data: Data to encode, such as a serialized response
+        :return: bytes of MessagePack
+        """
+        return msgpack.packb(data, default=_encode_default, use_bin_type=True)
+
+
+class CBORCodec:
+    """Encodes and decodes CBOR bodies with `cbor2`
+    """
+
+    media_type = 'application/cbor'
+
+    @staticmethod
+    def loads(body):
+        """Parses CBOR
+        :param body: bytes of CBOR
+        :return: Parsed data
+        :raises ValueError: If the body is not valid CBOR
+        """
+        try:
+            return cbor2.loads(body)
+        except cbor2.CBORDecodeError as exc:
+            raise ValueError(str(exc)) from exc
+
+    @staticmethod
+    def dumps(data):
+        """Encodes data as CBOR
+        :param data: Data to encode, such as a serialized response
+        :return: bytes of CBOR
+        """
+        return cbor2.dumps(
+            data,
+            default=lambda encoder, value: encoder.encode(
+                _encode_default(value)
+            )
+        )
+
+
+# Media types besides JSON that HTTP calls can be sent and answered in, to
+# their codec and the library it needs
+BINARY_CODECS = {
+    'application/msgpack': (MessagePackCodec, msgpack),
+    'application/x-msgpack': (MessagePackCodec, msgpack),
+    'application/cbor': (CBORCodec, cbor2),
+}
+
+
+def get_binary_codec(media_type):
+    """Gets the codec of a media type in `BINARY_CODECS`
+    :param media_type: Media type, such as "application/msgpack"
+    :return: Codec, or None if its library is not installed
+    """
+    codec, module = BINARY_CODECS[media_type]
+    return codec() if module is not None else None
+
+
+def parse_qualities(header):
+    """Parses an HTTP header of values with qualities, such as `Accept` or
+    `Accept-Encoding`
+
+    :param header: Value of the header
+    :return: List of tuples of each value and its quality, most preferred
+             first
+    """
+    values = []
+    for index, item in enumerate((header or '').split(',')):
+        value, *params = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, number = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        if value:
+            values.append((-quality, index, value.lower()))
+    return [(value, -quality) for quality, _, value in sorted(values)]
+
+
+def parse_accept(accept):
+    """Lists the media types of an HTTP `Accept` header, most preferred
+    first. Types with a quality of 0 are left out.
+
+    :param accept: Value of the `Accept` header
+    :return: List of media types
+    """
+    return [
+        media_type for media_type, quality in parse_qualities(accept)
+        if quality > 0
+    ]
@@ -13,7 +13,20 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import asyncio
+import collections.abc
+import functools
+import inspect
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django import db
+
+from manifold.admission import AdmissionController, limit_concurrency
+from manifold.batch import Batcher
+from manifold.cache import ResultCache
+from manifold.coalesce import SingleFlight
 
 try:
     from newrelic import agent
@@ -21,10 +34,117 @@ except ImportError: # pragma: no cover
     agent = None
 
 
+def _set_transaction_name(name):
+    try:
+        agent.set_transaction_name(name)
+    except: # pylint: disable=all
+        logging.warning(
+            'Could not set New Relic transaction name. '
+            'Is it installed and configured?'
+        )
+
+
+def name_transaction(func, name):
+    """Wraps a handler function to name the New Relic transaction of each
+    call after the RPC function
+    :param func: Handler function, or `async def` handler function
+    :param name: RPC function name
+    :return: Wrapped function
+    """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            _set_transaction_name(name)
+            return await func(*args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _set_transaction_name(name)
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def read_iterator(result):
+    """Reads an iterator, such as a generator, returned by a handler
+    function into a list. Other results are returned as they are.
+    """
+    if isinstance(result, collections.abc.Iterator):
+        return list(result)
+    return result
+
+
+# Reads iterators when no executor is given, apart from the event loop's
+# default executor that runs regular handler functions
+_iterator_executor = None
+_iterator_executor_lock = threading.Lock()
+
+
+def _get_iterator_executor():
+    global _iterator_executor
+    with _iterator_executor_lock:
+        if _iterator_executor is None:
+            _iterator_executor = ThreadPoolExecutor(
+                thread_name_prefix='manifold-iterators'
+            )
+        return _iterator_executor
+
+
+def _read_in_thread(result):
+    try:
+        return list(result)
+    finally:
+        # Worker threads outlive the request, so tidy up after them
+        db.close_old_connections()
+
+
+async def read_iterator_async(result, executor=None):
+    """Reads an iterator returned by a handler function into a list in a
+    worker thread, so that an iterator that blocks does not hold up the
+    event loop. Other results are returned as they are.
+
+    :param result: Return value of the handler function
+    :param executor: Executor to read the iterator in, or None for a
+                     thread pool of its own
+    :return: list, or the result as it was
+    """
+    if not isinstance(result, collections.abc.Iterator):
+        return result
+    return await asyncio.get_event_loop().run_in_executor(
+        executor or _get_iterator_executor(), _read_in_thread, result
+    )
+
+
+def read_iterators(func):
+    """Wraps a handler function to read iterators it returns into lists,
+    so that wrappers holding on to its results get every item
+    :param func: Handler function, or `async def` handler function
+    :return: Wrapped function
+    """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            return await read_iterator_async(await func(*args, **kwargs))
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return read_iterator(func(*args, **kwargs))
+
+    return wrapper
+
+
 class ServiceHandler:
     """
     The Service Handler maps functions to Thrift functions, and is responsible
     for serving them once the server starts.
+
+    Mapped functions are wrapped with any limits and instrumentation once,
+    when they are mapped, and set as attributes of the handler. Looking up a
+    function for each call is a plain attribute access.
     """
 
     instance = None
@@ -34,12 +154,53 @@ class ServiceHandler:
     def __new__(cls, *args, **kwargs):
         instance = super(ServiceHandler, cls).__new__(cls)
         instance.__mapped_names = set()
+        instance.__service_handlers = {}
+        instance.__concurrency_limits = {}
+        instance.__caches = {}
+        instance.__http_caches = {}
         return instance
 
-    def map_function(self, name):
+    def map_function(self, name, key='default', max_concurrency=None,
+                     max_queue=0, queue_timeout=None, cache=None,
+                     coalesce=False, http_cache=None):
         """Map a Python function to a Thrift function
         :param name: The name to map the decorated function to
+        :param key: The MANIFOLD settings key of the service the function
+                    belongs to, for serving multiple services on one port
+        :param max_concurrency: Number of calls to the function that can run
+                                at once. Unlimited if not set.
+        :param max_queue: Number of calls that can wait for a running call to
+                          finish once `max_concurrency` is reached. Any more
+                          are rejected right away.
+        :param queue_timeout: Milliseconds a queued call waits before it is
+                              rejected. Waits until it can run if not set.
+        :param cache: Options to cache the function's results with, as a dict
+                      of `ttl` (seconds), `max_size`, `backend` (`local` or
+                      `django`), and `alias` of the Django cache
+        :param coalesce: Whether identical concurrent calls share a single
+                         execution of the function
+        :param http_cache: Marks the function as read-only over HTTP, so its
+                           responses get an ETag and can be revalidated.
+                           True, or a dict of `max_age` (seconds) to also
+                           send a Cache-Control header with.
         """
+        if key != 'default':
+            return self.get_service_handler(key).map_function(
+                name, max_concurrency=max_concurrency, max_queue=max_queue,
+                queue_timeout=queue_timeout, cache=cache, coalesce=coalesce,
+                http_cache=http_cache
+            )
+
+        if http_cache is True:
+            http_cache = {}
+        elif http_cache is False:
+            http_cache = None
+        if http_cache and set(http_cache) - {'max_age'}:
+            raise ValueError(
+                f'Unknown http_cache options for "{name}": '
+                f'{", ".join(sorted(set(http_cache) - {"max_age"}))}.'
+            )
+
         def decorator(func):
 
             # Check if the Thrift function was already assigned
@@ -50,11 +211,78 @@ class ServiceHandler:
 
             self.__mapped_names.add(name)
 
-            setattr(self, name, func)
+            mapped = func
+            if max_concurrency or coalesce or cache is not None:
+                # Slots, shared calls, and cached results last until the
+                # function returns, which must be with every item
+                mapped = read_iterators(mapped)
+            if max_concurrency:
+                controller = AdmissionController(
+                    max_concurrency,
+                    max_queue_wait=None if queue_timeout is None
+                    else queue_timeout / 1000,
+                    max_queue=max_queue
+                )
+                self.__concurrency_limits[name] = controller
+                mapped = limit_concurrency(mapped, name, controller)
+            if coalesce:
+                # Calls waiting on an identical one do not take a slot
+                mapped = SingleFlight(name).wrap(mapped)
+            if cache is not None:
+                # Cached results are returned without taking a slot
+                result_cache = ResultCache(name, **cache)
+                self.__caches[name] = result_cache
+                mapped = result_cache.wrap(mapped)
+            if agent:
+                mapped = name_transaction(mapped, name)
+            if http_cache is not None:
+                self.__http_caches[name] = http_cache
+
+            setattr(self, name, mapped)
             return func
 
         return decorator
 
+    def map_batch_function(self, name, key='default', max_batch_size=100,
+                           window=5):
+        """Map a Python batch function to a Thrift function. Concurrent
+        calls are gathered, and the batch function is called once with a
+        list of every call's argument tuple. It must return a list with a
+        result, or an exception to raise, for each call in the same order.
+
+        :param name: The name to map the decorated function to
+        :param key: The MANIFOLD settings key of the service the function
+                    belongs to
+        :param max_batch_size: Number of calls that are run in one batch
+        :param window: Milliseconds to gather calls for after the first one
+        """
+        def decorator(func):
+            batcher = Batcher(
+                func, max_batch_size=max_batch_size, window=window / 1000
+            )
+            self.get_service_handler(key).map_function(name)(batcher.wrap())
+            return func
+
+        return decorator
+
+    def get_service_handler(self, key):
+        """Returns the handler for functions of another MANIFOLD service key,
+        creating it on first use
+        :param key: The MANIFOLD settings key of the service
+        :return: ServiceHandler
+        """
+        if key == 'default':
+            return self
+        if key not in self.__service_handlers:
+            self.__service_handlers[key] = ServiceHandler()
+        return self.__service_handlers[key]
+
+    def get_service_keys(self):
+        """Returns the MANIFOLD settings keys with functions mapped to them
+        :return: list of keys, `default` first
+        """
+        return ['default'] + list(self.__service_handlers)
+
     def print_current_mappings(self):
         """Pretty prints RPC function to Python function mappings
         """
@@ -63,25 +291,45 @@ class ServiceHandler:
             name = f'{func.__module__}.{func.__name__}'
             print(f'* {mapped_name} -- {name}')
 
+        for key, service_handler in self.__service_handlers.items():
+            mappings = service_handler.get_current_mappings()
+            for mapped_name, func in mappings.items():
+                name = f'{func.__module__}.{func.__name__}'
+                print(f'* {key}:{mapped_name} -- {name}')
+
     def get_current_mappings(self):
         """Returns the current RPC to Python mappings as dict
         :return:
         """
         return {name: getattr(self, name) for name in self.__mapped_names}
 
-    def __getattribute__(self, name):
-        """Overridden to set the New Relic transaction name if handler.
+    def get_concurrency_limits(self):
+        """Returns the concurrency limit and current usage of every function
+        mapped with `max_concurrency`
+        :return: dict of RPC function name to usage stats
         """
-        if agent and '__mapped_names' not in name and name in self.__mapped_names:
-            try:
-                agent.set_transaction_name(name)
-            except: # pylint: disable=all
-                logging.warning(
-                    'Could not set New Relic transaction name. '
-                    'Is it installed and configured?'
-                )
+        return {
+            name: controller.stats
+            for name, controller in self.__concurrency_limits.items()
+        }
 
-        return object.__getattribute__(self, name)
+    def get_cache(self, name):
+        """Returns the result cache of a function mapped with `cache`, to
+        invalidate its results with
+        :param name: RPC function name
+        :return: ResultCache
+        """
+        if name not in self.__caches:
+            raise KeyError(f'Thrift Function "{name}" is not cached.')
+        return self.__caches[name]
+
+    def get_http_cache(self, name):
+        """Returns the HTTP caching options of a function mapped with
+        `http_cache`
+        :param name: RPC function name
+        :return: dict of options, or None if the function is not cacheable
+        """
+        return self.__http_caches.get(name)
 
 
 def __create_handler():
@@ -1,16 +1,37 @@
+import asyncio
+import collections.abc
+import functools
+import hashlib
 import importlib
-import json
+import inspect
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
-import thriftpy
+from thriftpy.protocol import binary, compact
+from thriftpy.thrift import TApplicationException, TException, TProcessor
+from thriftpy.transport.memory import TMemoryBuffer
+from django import db
 from django.conf import settings
 from django.core.wsgi import get_wsgi_application
-from django.http import JsonResponse
+from django.http import (
+    HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+)
 from django.urls import path
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
 from django.views.decorators.csrf import csrf_exempt
 
+from manifold.compression import Compressor
+from manifold.encoding import (
+    BINARY_CODECS, JSONCodec, get_binary_codec, get_json_codec, parse_accept
+)
 from manifold.file import load_service
-from manifold.handler import handler
+from manifold.handler import handler, read_iterator, read_iterator_async
+from manifold.message import InvalidMessage, check_message
+from manifold.responses import (
+    CALL_ERRORS, ResponseStream, error_response, stream_json, stream_ndjson
+)
+from manifold.rpc import get_memory_protocol_factory
 from manifold.serialize import serialize, deserialize
 
 logger = logging.getLogger(__name__)
@@ -59,90 +80,590 @@ def _parse_json_args_to_list(thrift_spec, json_data):
     return arg_list
 
 
-def _handle_arg_function(handler_func, request, thrift_args):
-    """Parse, deserialize, and call RPC handler from Django request
-    :param handler_func: Thrift handler function (the decorated function)
-    :param request: Django request with body
-    :param thrift_args: Thrift function arguments from the service.thrift_spec
-    :return: Dictionary serialized response from RPC function
+def _get_json_codec():
+    """Gets the codec of the `json_backend` setting
+    :return: manifold.encoding.JSONCodec
     """
-    try:
-        body = request.body.decode('utf-8')
-    except (UnicodeDecodeError, UnicodeError):
-        body = request.body
+    backend = settings.MANIFOLD['default'].get('json_backend', 'json')
+    return get_json_codec(backend)
+
+
+# Accepted to stream list responses as newline delimited JSON
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+
+def negotiate_codecs(content_type, accept):
+    """Picks the codecs of an HTTP call from its headers. The body is parsed
+    as JSON, unless its `Content-Type` is one of the `BINARY_CODECS`. The
+    response is encoded in the first type of `Accept` that it can be, or
+    in the same format as the body otherwise.
 
+    :param content_type: Media type of the request body, without parameters
+    :param accept: Value of the `Accept` header
+    :return: Tuple of the request and response codecs. The request codec
+             is None if the library for its media type is not installed.
+    """
+    request_codec = _get_json_codec()
+    if content_type in BINARY_CODECS:
+        request_codec = get_binary_codec(content_type)
+
+    for media_type in parse_accept(accept):
+        if media_type == JSONCodec.media_type:
+            return request_codec, _get_json_codec()
+        if media_type in BINARY_CODECS:
+            codec = get_binary_codec(media_type)
+            if codec is not None:
+                return request_codec, codec
+    return request_codec, request_codec or _get_json_codec()
+
+
+def get_media_type(content_type):
+    """Strips the parameters from a `Content-Type` header
+    """
+    return (content_type or '').split(';', 1)[0].strip().lower()
+
+
+def unsupported_media_type(content_type):
+    return {
+        'response': 'error',
+        'error': f'Unsupported content type "{content_type}".'
+    }
+
+
+def load_body(body, codec):
+    """Parses a request body
+    :param body: bytes of the request body
+    :param codec: Codec from `negotiate_codecs` to parse the body with
+    :return: Parsed data, or None if the body is not valid
+    """
     try:  # Try to load any params given
-        data = json.loads(body)
+        return codec.loads(body)
     except ValueError as exc:
-        logger.warning(f'Could not parse JSON content "{body}": {str(exc)}')
-        data = None
+        logger.warning(
+            f'Could not parse {codec.media_type} content {body!r}: {str(exc)}'
+        )
+        return None
+
+
+def _encoded_response(data, codec, status=200):
+    """Builds a Django response with encoded data
+    :param data: Response to send back
+    :param codec: Codec from `negotiate_codecs` to encode the data with
+    :param status: HTTP status code
+    :return: Django HttpResponse
+    """
+    return HttpResponse(
+        codec.dumps(data), content_type=codec.media_type, status=status
+    )
+
+
+def _get_compressor():
+    """Creates the compressor of the `http_compression` setting
+    :return: manifold.compression.Compressor, or None if responses are not
+             compressed
+    """
+    options = settings.MANIFOLD['default'].get('http_compression')
+    if options is None:
+        return None
+    return Compressor(**options)
+
+
+def encode_body(data, codec, accept_encoding):
+    """Encodes a response, compressed if the `http_compression` setting is
+    on and the client accepts it
+
+    :param data: Response to send back
+    :param codec: Codec from `negotiate_codecs` to encode the data with
+    :param accept_encoding: Value of the `Accept-Encoding` header
+    :return: Tuple of the bytes of the body, and a list of its headers
+    """
+    body = codec.dumps(data)
+    headers = [('Content-Type', codec.media_type)]
+
+    compressor = _get_compressor()
+    if compressor is not None:
+        body, encoding = compressor.compress(body, accept_encoding)
+        headers.append(('Vary', 'Accept-Encoding'))
+        if encoding is not None:
+            headers.append(('Content-Encoding', encoding))
+
+    headers.append(('Content-Length', str(len(body))))
+    return body, headers
+
+
+def compress_view(view):
+    """Wraps a Django view to compress its responses with the
+    `http_compression` setting, without needing Django's GZipMiddleware
+    :param view: Django view
+    :return: Wrapped Django view
+    """
+    @functools.wraps(view)
+    def compressed_view(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        compressor = _get_compressor()
+        if compressor is None or response.streaming \
+                or response.has_header('Content-Encoding'):
+            return response
+
+        response.content, encoding = compressor.compress(
+            response.content, request.META.get('HTTP_ACCEPT_ENCODING')
+        )
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if encoding is not None:
+            response['Content-Encoding'] = encoding
+            if response.has_header('ETag'):
+                # The ETag was computed from the uncompressed body
+                response['ETag'] = 'W/' + _strip_weak(response['ETag'])
+        return response
+
+    return compressed_view
+
+
+def _strip_weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def _conditional_response(request, response, max_age=None):
+    """Tags the response of a cacheable function with an ETag of its body,
+    and answers with 304 Not Modified if the client already has that body
+
+    :param request: Django request
+    :param response: Django HttpResponse of a successful call
+    :param max_age: Seconds the client can reuse the response for without
+                    asking again. No Cache-Control header is set if None.
+    :return: Django HttpResponse
+    """
+    etag = quote_etag(hashlib.sha1(response.content).hexdigest())
+    response['ETag'] = etag
+    # The body depends on the codec negotiated from the Accept header
+    patch_vary_headers(response, ('Accept',))
+    if max_age is not None:
+        patch_cache_control(response, max_age=max_age)
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return response
+
+    # If-None-Match compares ETags weakly, which lets compressed responses
+    # be revalidated too
+    etags = [_strip_weak(tag) for tag in parse_etags(if_none_match)]
+    if etag not in etags and '*' not in etags:
+        return response
+
+    not_modified = HttpResponseNotModified()
+    for header in ('ETag', 'Cache-Control', 'Vary'):
+        if response.has_header(header):
+            not_modified[header] = response[header]
+    return not_modified
+
+
+def _respond_negotiated(request, call, parse_body=True, http_cache=None):
+    """Parses the body of a Django request and encodes the response of a
+    call in the codecs negotiated from its headers
+
+    :param request: Django request
+    :param call: Function that takes the parsed body, and whether list
+                 responses can be streamed, and returns the response data
+    :param parse_body: If the body holds arguments to parse
+    :param http_cache: Options of `_conditional_response` for successful
+                       responses, or None if they are not cacheable
+    :return: Django HttpResponse
+    """
+    content_type = get_media_type(request.content_type)
+    accept = request.META.get('HTTP_ACCEPT')
+    request_codec, response_codec = negotiate_codecs(content_type, accept)
+    if request_codec is None:
+        return _encoded_response(
+            unsupported_media_type(content_type), response_codec, status=415
+        )
+
+    data = load_body(request.body, request_codec) if parse_body else None
+    ndjson = NDJSON_MEDIA_TYPE in parse_accept(accept)
+    if ndjson:
+        response_codec = _get_json_codec()
+    result = call(data, isinstance(response_codec, JSONCodec))
+
+    stream = result.get('return') if isinstance(result, dict) else None
+    if isinstance(stream, ResponseStream):
+        if ndjson:
+            return StreamingHttpResponse(
+                stream_ndjson(stream, response_codec),
+                content_type=NDJSON_MEDIA_TYPE
+            )
+        return StreamingHttpResponse(
+            stream_json(stream, response_codec),
+            content_type=response_codec.media_type
+        )
+
+    response = _encoded_response(result, response_codec)
+    if http_cache is not None and result.get('response') == 'ok':
+        return _conditional_response(request, response, **http_cache)
+    return response
+
+
+def _serialize_result(name, result, stream=False):
+    """Serializes what a handler function returned. Iterators are read
+    into a list, or left to be streamed.
+    """
+    if isinstance(result, collections.abc.Iterator):
+        if stream:
+            return ResponseStream(name, result)
+        result = list(result)
+    return serialize(result)
+
+
+def call_thrift_function(name, handler_function, thrift_args, data,
+                         stream=False):
+    """Calls an RPC handler with JSON arguments, and builds the response
+    :param name: The RPC function name that was called
+    :param handler_function: Thrift handler function (the decorated function)
+    :param thrift_args: Thrift function arguments from the service.thrift_spec
+    :param data: Dictionary of arguments parsed from JSON
+    :param stream: Whether an iterator returned by the handler is returned
+                   as a ResponseStream, instead of being read into a list
+    :return: Dictionary of the response to send back as JSON
+    """
+    try:  # Run the thrift handler function with JSON kwargs
+        if thrift_args:
+            arguments = _parse_json_args_to_list(thrift_args, data)
+            result = handler_function(*arguments)
+        else:
+            result = handler_function()
+        response = _serialize_result(name, result, stream=stream)
+    except CALL_ERRORS as exc:
+        return error_response(name, exc)
+
+    return {'return': response, 'response': 'ok'}
+
+
+async def call_thrift_function_async(name, handler_function, thrift_args,
+                                     data, executor=None):
+    """Calls an RPC handler with JSON arguments from asyncio code, and builds
+    the same response as `call_thrift_function`. `async def` handlers are
+    awaited, and other handlers run in `executor`.
+
+    :param executor: Executor for regular handlers, or None for the event
+                     loop's default executor
+    """
+    try:
+        arguments = _parse_json_args_to_list(thrift_args, data) \
+            if thrift_args else []
+        if inspect.iscoroutinefunction(handler_function):
+            result = await read_iterator_async(
+                await handler_function(*arguments), executor
+            )
+        else:
+            result = await asyncio.get_event_loop().run_in_executor(
+                executor, _call_in_thread, handler_function, arguments
+            )
+        response = _serialize_result(name, result)
+    except CALL_ERRORS as exc:
+        return error_response(name, exc)
+
+    return {'return': response, 'response': 'ok'}
+
+
+def _call_in_thread(func, arguments):
+    """Calls a function in a worker thread, reading any iterator it
+    returns there too
+    """
+    try:
+        return read_iterator(func(*arguments))
+    finally:
+        # Worker threads outlive the request, so tidy up after them
+        db.close_old_connections()
+
+
+class _FunctionProcessor(TProcessor):
+    """Processes Thrift messages that call one RPC function
+    """
+
+    def __init__(self, service, name, handler_function):
+        super().__init__(service, _FunctionHandler(name, handler_function))
+        self._name = name
+
+    def process_in(self, iprot):
+        try:
+            api, seqid, result, call = super().process_in(iprot)
+        except Exception as exc:
+            # Protocols raise all sorts of errors on bad input
+            raise InvalidMessage(str(exc)) from exc
+        if call is not None and api != self._name:
+            return api, seqid, TApplicationException(
+                TApplicationException.UNKNOWN_METHOD,
+                f'RPC function "{api}" is not served at "{self._name}".'
+            ), None
+        return api, seqid, result, call
+
+
+class _FunctionHandler:
+    """Handler object with a single RPC function, which sends exceptions
+    the function does not declare back as a TApplicationException, and
+    reads iterators it returns into lists
+    """
 
-    arguments = _parse_json_args_to_list(thrift_args, data)
+    def __init__(self, name, handler_function):
+        def call(*args):
+            try:
+                return read_iterator(handler_function(*args))
+            except TException:
+                raise
+            except Exception as exc:
+                logger.exception(exc)
+                raise TApplicationException(
+                    TApplicationException.INTERNAL_ERROR, str(exc)
+                ) from exc
 
-    return serialize(handler_func(*arguments))
+        setattr(self, name, call)
 
 
-def wrap_thrift_function(name, handler_function):
+# Content types of Thrift messages, to the protocol they are encoded with.
+# Bodies come from any HTTP client, so they are checked with
+# `check_message` and then decoded with the pure Python protocols.
+THRIFT_CONTENT_TYPES = {
+    'application/x-thrift': get_memory_protocol_factory,
+    'application/vnd.apache.thrift.binary': binary.TBinaryProtocolFactory,
+    'application/vnd.apache.thrift.compact': compact.TCompactProtocolFactory,
+}
+
+THRIFT_LIMITS = {
+    'max_size': 1024 * 1024,
+    'max_string_length': None,
+    'max_container_length': None,
+    'max_depth': 64,
+}
+
+
+def _get_thrift_limits():
+    """Reads the `http_thrift_limits` setting over the `THRIFT_LIMITS`
+    defaults
+    :return: dict of limits
+    """
+    limits = dict(THRIFT_LIMITS)
+    limits.update(settings.MANIFOLD['default'].get('http_thrift_limits', {}))
+    return limits
+
+
+def call_thrift_message(processor, proto_factory, body, limits=None):
+    """Processes an RPC call from an encoded Thrift message
+    :param processor: TProcessor to call the function with
+    :param proto_factory: Protocol factory the message is encoded with
+    :param body: bytes of the Thrift message
+    :param limits: dict of any of the limits in `THRIFT_LIMITS` to check
+                   the message against, or None for the `http_thrift_limits`
+                   setting
+    :return: bytes of the Thrift reply, empty for `oneway` functions
+    :raises InvalidMessage: If the message is malformed or over a limit
+    """
+    limits = dict(THRIFT_LIMITS, **limits) if limits is not None \
+        else _get_thrift_limits()
+    max_size = limits['max_size']
+    if max_size is not None and len(body) > max_size:
+        raise InvalidMessage(
+            f'Message of {len(body)} bytes is over the limit of {max_size}.'
+        )
+    protocol = 'compact' \
+        if isinstance(proto_factory, compact.TCompactProtocolFactory) \
+        else 'binary'
+    check_message(
+        body, protocol,
+        max_string_length=limits['max_string_length'],
+        max_container_length=limits['max_container_length'],
+        max_depth=limits['max_depth']
+    )
+
+    otrans = TMemoryBuffer()
+    processor.process(
+        proto_factory.get_protocol(TMemoryBuffer(body)),
+        proto_factory.get_protocol(otrans)
+    )
+    return otrans.getvalue()
+
+
+def wrap_thrift_function(name, handler_function, http_cache=None):
     """Wraps a Thrift handler function in a Django
     :param name: The RPC function name that was called
     :param handler_function: Thrift function to handle RPC
+    :param http_cache: HTTP caching options the function was mapped with,
+                       to give its responses an ETag
     :return: Function that can be called with path()
     """
     service = load_service()
     thrift_args = getattr(service, f'{name}_args').thrift_spec
+    processor = _FunctionProcessor(service, name, handler_function)
+
+    def thrift_handler(request, proto_factory):
+        limits = _get_thrift_limits()
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        max_size = limits['max_size']
+        # Checked before the body is read, and again for requests without
+        # a Content-Length
+        if max_size is not None and (
+                length > max_size or len(request.body) > max_size):
+            return HttpResponse(status=413)
+
+        try:
+            reply = call_thrift_message(
+                processor, proto_factory(), request.body, limits
+            )
+        except InvalidMessage as exc:
+            logger.warning(
+                f"Invalid Thrift message to '{name}': {str(exc)}"
+            )
+            return HttpResponse(status=400)
+        return HttpResponse(reply, content_type=request.content_type)
 
     @csrf_exempt
+    @compress_view
     def request_handler(request):
         """The request handler Django uses for each call
         :param request: Django request
-        :return: Django JsonResponse
+        :return: Django HttpResponse
         """
-        try:  # Run the thrift handler function with JSON kwargs
-            if thrift_args:
-                response = _handle_arg_function(
-                    handler_function,
-                    request,
-                    thrift_args
-                )
-            else:
-                response = serialize(handler_function())
-
-        except KeyError as exc:
-            logger.error(
-                f"Invalid HTTP args to '{name}': {str(exc)}"
+        if request.content_type in THRIFT_CONTENT_TYPES:
+            return thrift_handler(
+                request, THRIFT_CONTENT_TYPES[request.content_type]
             )
-            return JsonResponse({
-                'response': 'error',
-                'error': str(exc)
-            })
-
-        except TypeError as exc:
-            logger.error(
-                f"Invalid HTTP args to '{name}', check JSON: {str(exc)}"
-            )
-            error = 'Invalid Thrift request.'
-            if 'unexpected' in str(exc):
-                error = 'Unable to coerce keywords into handler.'
-            elif 'required' in str(exc):
-                error = 'Missing Thrift keys.'
-            return JsonResponse({'response': 'error', 'error': error})
-
-        except thriftpy.thrift.TException as exc:  # Handle Thrift Exceptions
-            return JsonResponse({
-                'response': 'error',
-                'exception': serialize(exc),
-                'exceptionType': str(type(exc).__name__)
-            })
 
-        return JsonResponse({'return': response, 'response': 'ok'}, safe=False)
+        return _respond_negotiated(
+            request,
+            lambda data, stream: call_thrift_function(
+                name, handler_function, thrift_args, data, stream=stream
+            ),
+            parse_body=bool(thrift_args),
+            http_cache=http_cache
+        )
 
     return request_handler
 
 
-def build_urls():
-    """Builds `urlpatterns` for Django to serve using the Manifold
-    ServiceHandler. This loads any apps it can and adds their routes
-    :return: List of Django paths()
+def get_functions(mappings):
+    """Looks up the Thrift arguments of each mapped RPC function
+    :param mappings: Dictionary of RPC function names to handler functions
+    :return: Dictionary of RPC function names to tuples of the handler
+             function and its Thrift arguments
+    """
+    service = load_service()
+    return {
+        name: (handler_function, getattr(service, f'{name}_args').thrift_spec)
+        for name, handler_function in mappings.items()
+    }
+
+
+def _get_batch_call(functions, entry):
+    """Looks up the function of one call in a batch
+    :param functions: Dictionary from `get_functions`
+    :param entry: Call parsed from the batch
+    :return: Tuple of the name, handler function, Thrift arguments, and
+             arguments of the call, or None if it names no RPC function
+    """
+    name = entry.get('function') if isinstance(entry, dict) else None
+    # Names parsed from the body can be of any type, even unhashable ones
+    if not isinstance(name, str) or name not in functions:
+        return None
+    handler_function, thrift_args = functions[name]
+    return name, handler_function, thrift_args, entry.get('args', {})
+
+
+_BATCH_CALL_ERROR = {
+    'response': 'error',
+    'error': 'Expected a "function" mapped to an RPC call.'
+}
+
+_BATCH_ERROR = {
+    'response': 'error',
+    'error': 'Expected a JSON array of calls.'
+}
+
+
+def make_batch_caller(functions, workers=1):
+    """Creates a function that runs a batch of RPC calls, as parsed from a
+    JSON array of `{"function": name, "args": {...}}` calls
+
+    :param functions: Dictionary from `get_functions`
+    :param workers: Number of threads to run the calls in. With 1, calls
+                    run one after another in the caller's thread.
+    :return: Function that returns a list of responses for a list of calls,
+             or an error response if it is not given a list
+    """
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 \
+        else None
+
+    def call(entry):
+        batch_call = _get_batch_call(functions, entry)
+        if batch_call is None:
+            return dict(_BATCH_CALL_ERROR)
+        return call_thrift_function(*batch_call)
+
+    def call_batch(calls):
+        if not isinstance(calls, list):
+            return dict(_BATCH_ERROR)
+        if executor is None or len(calls) < 2:
+            return [call(entry) for entry in calls]
+        return list(executor.map(
+            _call_in_thread, [call] * len(calls), [[entry] for entry in calls]
+        ))
+
+    return call_batch
+
+
+def make_async_batch_caller(functions, executor=None):
+    """Creates an `async def` function that runs a batch of RPC calls
+    concurrently, like the function from `make_batch_caller`
+
+    :param functions: Dictionary from `get_functions`
+    :param executor: Executor for regular handlers, or None for the event
+                     loop's default executor
+    """
+    async def call(entry):
+        batch_call = _get_batch_call(functions, entry)
+        if batch_call is None:
+            return dict(_BATCH_CALL_ERROR)
+        return await call_thrift_function_async(*batch_call, executor)
+
+    async def call_batch(calls):
+        if not isinstance(calls, list):
+            return dict(_BATCH_ERROR)
+        return list(await asyncio.gather(*[call(entry) for entry in calls]))
+
+    return call_batch
+
+
+def wrap_batch_function(mappings, workers=1):
+    """Creates a Django view that runs many RPC functions from one request.
+
+    The request body is a JSON array of `{"function": name, "args": {...}}`
+    calls, and the response is an array with the response of each call, in
+    the same order and with the same keys as a call to the function's own
+    route.
+
+    :param mappings: Dictionary of RPC function names to handler functions
+    :param workers: Number of threads to run the calls in. With 1, calls
+                    run one after another in the request's thread.
+    :return: Function that can be called with path()
+    """
+    call_batch = make_batch_caller(get_functions(mappings), workers)
+
+    @csrf_exempt
+    @compress_view
+    def batch_handler(request):
+        """The request handler Django uses for each batch of calls
+        :param request: Django request
+        :return: Django HttpResponse
+        """
+        return _respond_negotiated(
+            request, lambda data, _: call_batch(data)
+        )
+
+    return batch_handler
+
+
+def import_views():
+    """Imports the `views` module of each installed app, which maps their
+    RPC functions
     """
     for i_app in settings.INSTALLED_APPS:
         if i_app.startswith('django') or 'manifold' in i_app:
@@ -155,16 +676,75 @@ def build_urls():
                 i_app
             )
 
-    patterns = []
-    mappings = handler.get_current_mappings()
-    for name, handler_function in mappings.items():
-        patterns.append(
-            path(
-                name,
-                wrap_thrift_function(name, handler_function),
-                name="name"
+
+def wrap_dispatcher(views):
+    """Creates a Django view that serves every RPC function from one route,
+    by looking up the function's view by name
+    :param views: Dictionary of RPC function names to their views
+    :return: Function that can be called with path()
+    """
+    @csrf_exempt
+    def dispatch_handler(request, function):
+        """The request handler Django uses for every call
+        :param request: Django request
+        :param function: The RPC function name from the URL
+        :return: Django HttpResponse
+        """
+        view = views.get(function)
+        if view is None:
+            _, codec = negotiate_codecs(
+                get_media_type(request.content_type),
+                request.META.get('HTTP_ACCEPT')
             )
+            return _encoded_response({
+                'response': 'error',
+                'error': f'Unknown RPC function "{function}".'
+            }, codec, status=404)
+        return view(request)
+
+    return dispatch_handler
+
+
+def build_urls():
+    """Builds `urlpatterns` for Django to serve using the Manifold
+    ServiceHandler. This loads any apps it can and adds their routes, and a
+    batch route if `http_batch_path` is set.
+
+    With `http_dispatcher` set, a single route serves every function instead
+    of a route per function, so resolving a URL does not get slower as more
+    functions are added.
+    :return: List of Django paths()
+    """
+    import_views()
+
+    mappings = handler.get_current_mappings()
+    views = {
+        name: wrap_thrift_function(
+            name, handler_function, http_cache=handler.get_http_cache(name)
         )
+        for name, handler_function in mappings.items()
+    }
+
+    thrift_settings = settings.MANIFOLD['default']
+    if thrift_settings.get('http_dispatcher'):
+        patterns = [
+            path('<str:function>', wrap_dispatcher(views), name="dispatch")
+        ]
+    else:
+        patterns = [
+            path(name, view, name="name") for name, view in views.items()
+        ]
+
+    batch_path = thrift_settings.get('http_batch_path')
+    if batch_path:
+        # Ahead of the dispatcher, which matches every path
+        patterns.insert(0, path(
+            batch_path,
+            wrap_batch_function(
+                mappings, thrift_settings.get('http_batch_workers', 1)
+            ),
+            name="batch"
+        ))
     return patterns
 
 
@@ -172,3 +752,20 @@ urlpatterns = build_urls()
 
 # Create the WSGI application
 application = get_wsgi_application()
+
+# Served from `manifold.applications`, which imports this module
+_APPLICATIONS = (
+    'WSGIApplication', 'ASGIApplication', 'rpc_application',
+    'asgi_application',
+)
+
+
+def __getattr__(name):
+    """Looks up the lightweight WSGI and ASGI applications, such as
+    `rpc_application` and `asgi_application`, the first time they are used
+    """
+    if name in _APPLICATIONS:
+        # pylint: disable=import-outside-toplevel,cyclic-import
+        from manifold import applications
+        return getattr(applications, name)
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
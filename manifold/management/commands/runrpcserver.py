@@ -20,6 +20,7 @@ from django.core.management.base import BaseCommand
 from django.utils import autoreload
 
 from manifold import rpc
+from manifold.server import TPreforkServer
 
 
 def get_manifold_version():
@@ -38,11 +39,17 @@ class Command(BaseCommand):
         """
         parser.add_argument('host', type=str, nargs='?', default='127.0.0.1')
         parser.add_argument('port', type=int, nargs='?', default=9090)
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of pre-forked worker processes to serve with. '
+                 'Using more than one disables autoreloading.'
+        )
 
-    def run_server(self, host, port):
+    def run_server(self, host, port, workers=1):
         """Runs the RPC server locally
         :param host: str Host to use
         :param port: int port to use
+        :param workers: int number of worker processes to fork
         """
         autoreload.raise_last_exception()
         quit_command = 'CTRL-BREAK' if sys.platform == 'win32' else 'CONTROL-C'
@@ -55,7 +62,10 @@ class Command(BaseCommand):
             f"Quit the server with {quit_command}.\n"
         )
 
-        server = rpc.make_server()
+        server = rpc.make_server(host=host, port=port)
+        if workers > 1:
+            self.stdout.write(f"Forking {workers} worker processes.\n")
+            server = TPreforkServer(server, workers=workers)
         server.serve()
 
     def handle(self, *args, **options):
@@ -63,7 +73,12 @@ class Command(BaseCommand):
         """
         host = options.get('host', '127.0.0.1')
         port = options.get('port', 9090)
+        workers = options.get('workers', 1)
 
-        # self.run_server(host, port)
+        # Forking needs to happen from the main thread, which the
+        # autoreloader runs the server outside of
+        if workers > 1:
+            self.run_server(host, port, workers)
+            return
 
         autoreload.main(self.run_server, args=(host, port), kwargs=None)
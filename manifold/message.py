@@ -0,0 +1,264 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import struct
+
+# Types of values in binary encoded messages, to the bytes of their
+# fixed size values. Strings (11, and 18 for binary) are read with their
+# length, and structs and containers by walking their contents.
+_BINARY_SIZES = {2: 1, 3: 1, 4: 8, 6: 2, 8: 4, 10: 8}
+_BINARY_STRINGS = (11, 18)
+_BINARY_STRUCT, _BINARY_MAP, _BINARY_SET, _BINARY_LIST = 12, 13, 14, 15
+_BINARY_VERSION_1 = 0x80010000
+
+# Types of values in compact encoded messages
+_COMPACT_TRUE, _COMPACT_FALSE, _COMPACT_BYTE = 1, 2, 3
+_COMPACT_INTS = (4, 5, 6)
+_COMPACT_DOUBLE, _COMPACT_BINARY = 7, 8
+_COMPACT_LIST, _COMPACT_SET, _COMPACT_MAP, _COMPACT_STRUCT = 9, 10, 11, 12
+_COMPACT_PROTOCOL_ID = 0x82
+
+# Longest varint of a 64 bit integer
+_MAX_VARINT_BYTES = 10
+
+
+class InvalidMessage(ValueError):
+    """Raised when an encoded Thrift message is malformed, or over one of
+    the limits it is checked against
+    """
+
+
+class _MessageChecker:
+    """Walks an encoded Thrift message without decoding its values.
+
+    Every value takes up at least one byte, so a string or container can be
+    no longer than the bytes left in the message. Checking that before
+    reading it keeps the work of decoding a message in proportion to its
+    size, however the lengths in it were crafted.
+    """
+
+    def __init__(self, body, max_string_length=None,
+                 max_container_length=None, max_depth=64):
+        self.body = body
+        self.position = 0
+        self.max_string_length = max_string_length
+        self.max_container_length = max_container_length
+        self.max_depth = max_depth
+
+    @property
+    def remaining(self):
+        return len(self.body) - self.position
+
+    def read(self, size):
+        if size > self.remaining:
+            raise InvalidMessage('Message ended unexpectedly.')
+        data = self.body[self.position:self.position + size]
+        self.position += size
+        return data
+
+    def unpack(self, fmt):
+        return struct.unpack(fmt, self.read(struct.calcsize(fmt)))[0]
+
+    def check_string_length(self, length):
+        if length < 0 or length > self.remaining:
+            raise InvalidMessage(f'Invalid string length {length}.')
+        if self.max_string_length is not None \
+                and length > self.max_string_length:
+            raise InvalidMessage(
+                f'String of {length} bytes is over the limit of '
+                f'{self.max_string_length}.'
+            )
+
+    def check_container_length(self, length):
+        if length < 0 or length > self.remaining:
+            raise InvalidMessage(f'Invalid container length {length}.')
+        if self.max_container_length is not None \
+                and length > self.max_container_length:
+            raise InvalidMessage(
+                f'Container of {length} items is over the limit of '
+                f'{self.max_container_length}.'
+            )
+
+    def check_depth(self, depth):
+        if depth > self.max_depth:
+            raise InvalidMessage(
+                f'Message nests deeper than {self.max_depth} levels.'
+            )
+
+    def read_name(self, length):
+        self.check_string_length(length)
+        try:
+            return self.read(length).decode('utf-8')
+        except UnicodeDecodeError:
+            raise InvalidMessage('Function name is not UTF-8.') from None
+
+
+class _BinaryChecker(_MessageChecker):
+
+    def check(self):
+        size = self.unpack('!i')
+        if size < 0:
+            if size & 0xffff0000 != _BINARY_VERSION_1:
+                raise InvalidMessage('Bad protocol version.')
+            self.read_name(self.unpack('!i'))
+        else:
+            self.read_name(size)
+            self.read(1)
+        self.read(4)
+        self.skip(_BINARY_STRUCT, 1)
+
+    def skip(self, ttype, depth):
+        if ttype in _BINARY_SIZES:
+            self.read(_BINARY_SIZES[ttype])
+        elif ttype in _BINARY_STRINGS:
+            length = self.unpack('!i')
+            self.check_string_length(length)
+            self.read(length)
+        elif _BINARY_STRUCT <= ttype <= _BINARY_LIST:
+            self.check_depth(depth)
+            self.skip_container(ttype, depth + 1)
+        else:
+            raise InvalidMessage(f'Invalid type {ttype}.')
+
+    def skip_container(self, ttype, depth):
+        if ttype == _BINARY_STRUCT:
+            while True:
+                field_type = self.unpack('!b')
+                if field_type == 0:
+                    return
+                self.read(2)
+                self.skip(field_type, depth)
+
+        if ttype == _BINARY_MAP:
+            item_types = (self.unpack('!b'), self.unpack('!b'))
+        else:
+            item_types = (self.unpack('!b'),)
+        self.check_types(*item_types)
+        length = self.unpack('!i')
+        self.check_container_length(length)
+        for _ in range(length):
+            for item_type in item_types:
+                self.skip(item_type, depth)
+
+    @staticmethod
+    def check_types(*ttypes):
+        for ttype in ttypes:
+            if ttype not in _BINARY_SIZES and ttype not in _BINARY_STRINGS \
+                    and not _BINARY_STRUCT <= ttype <= _BINARY_LIST:
+                raise InvalidMessage(f'Invalid type {ttype}.')
+
+
+class _CompactChecker(_MessageChecker):
+
+    def read_varint(self):
+        result = shift = 0
+        for _ in range(_MAX_VARINT_BYTES):
+            byte = self.unpack('!B')
+            result |= (byte & 0x7f) << shift
+            if not byte & 0x80:
+                return result
+            shift += 7
+        raise InvalidMessage('Varint is too long.')
+
+    def check(self):
+        if self.unpack('!B') != _COMPACT_PROTOCOL_ID:
+            raise InvalidMessage('Bad protocol id.')
+        if self.unpack('!B') & 0x1f != 1:
+            raise InvalidMessage('Bad protocol version.')
+        self.read_varint()
+        self.read_name(self.read_varint())
+        self.skip(_COMPACT_STRUCT, 1)
+
+    def skip(self, ctype, depth, field=False):
+        if ctype in (_COMPACT_TRUE, _COMPACT_FALSE):
+            # Fields hold bools in their type, items take a byte each
+            if not field:
+                self.read(1)
+        elif ctype == _COMPACT_BYTE:
+            self.read(1)
+        elif ctype in _COMPACT_INTS:
+            self.read_varint()
+        elif ctype == _COMPACT_DOUBLE:
+            self.read(8)
+        elif ctype == _COMPACT_BINARY:
+            length = self.read_varint()
+            self.check_string_length(length)
+            self.read(length)
+        elif _COMPACT_LIST <= ctype <= _COMPACT_STRUCT:
+            self.check_depth(depth)
+            self.skip_container(ctype, depth + 1)
+        else:
+            raise InvalidMessage(f'Invalid type {ctype}.')
+
+    def skip_container(self, ctype, depth):
+        if ctype == _COMPACT_STRUCT:
+            while True:
+                header = self.unpack('!B')
+                if header & 0x0f == 0:
+                    return
+                if header >> 4 == 0:
+                    self.read_varint()
+                self.skip(header & 0x0f, depth, field=True)
+
+        if ctype == _COMPACT_MAP:
+            length = self.read_varint()
+            if not length:
+                # Empty maps leave out their types
+                return
+            types = self.unpack('!B')
+            item_types = (types >> 4, types & 0x0f)
+        else:
+            header = self.unpack('!B')
+            item_types = (header & 0x0f,)
+            length = header >> 4
+            if length == 15:
+                length = self.read_varint()
+        self.check_types(*item_types)
+        self.check_container_length(length)
+        for _ in range(length):
+            for item_type in item_types:
+                self.skip(item_type, depth)
+
+    @staticmethod
+    def check_types(*ctypes):
+        for ctype in ctypes:
+            if not _COMPACT_TRUE <= ctype <= _COMPACT_STRUCT:
+                raise InvalidMessage(f'Invalid type {ctype}.')
+
+
+_CHECKERS = {
+    'binary': _BinaryChecker,
+    'compact': _CompactChecker,
+}
+
+
+def check_message(body, protocol='binary', max_string_length=None,
+                  max_container_length=None, max_depth=64):
+    """Checks that an encoded Thrift message is well formed, and within
+    limits that keep decoding it cheap, before it is decoded
+
+    :param body: bytes of the message
+    :param protocol: "binary" or "compact", the protocol it is encoded with
+    :param max_string_length: Most bytes in a string, or None for no limit
+                              besides the size of the message
+    :param max_container_length: Most items in a list, set, or map, or None
+                                 for no limit besides the size of the message
+    :param max_depth: Most levels of structs and containers, counting the
+                      arguments of the call
+    :raises InvalidMessage: If the message is malformed or over a limit
+    """
+    _CHECKERS[protocol](
+        body, max_string_length, max_container_length, max_depth
+    ).check()
@@ -0,0 +1,239 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import collections
+import contextlib
+import select
+import threading
+import time
+
+from thriftpy.protocol import TBinaryProtocolFactory
+from thriftpy.protocol.exc import TProtocolException
+from thriftpy.thrift import TClient, TDecodeException, TException
+from thriftpy.transport import (
+    TBufferedTransportFactory,
+    TSocket,
+    TTransportException,
+)
+
+
+class ClientPoolExhausted(Exception):
+    """Raised when no pooled connection became free in time
+    """
+
+
+def is_connection_error(exc):
+    """Checks if an exception raised during a call means the connection
+    can no longer be trusted. Exceptions defined in the Thrift service
+    are sent back over a healthy connection, so they do not count.
+
+    :param exc: Exception raised from a client call
+    :return: bool
+    """
+    if not isinstance(exc, TException):
+        return True
+    return isinstance(
+        exc, (TTransportException, TProtocolException, TDecodeException)
+    )
+
+
+class _PooledConnection:
+    """An open client and the socket underneath it
+    """
+
+    def __init__(self, client, sock):
+        self.client = client
+        self.sock = sock
+        self.last_used = time.time()
+
+    def is_stale(self, idle_timeout):
+        """Checks if the connection sat idle for too long, or if the server
+        closed it while it was idle
+        """
+        if idle_timeout and time.time() - self.last_used > idle_timeout:
+            return True
+        if self.sock.sock is None:
+            return True
+        # An idle connection should have nothing to read. If it does, it is
+        # either closed by the server, or holding a stray response.
+        readable, _, _ = select.select([self.sock.sock], [], [], 0)
+        return bool(readable)
+
+    def close(self):
+        self.client.close()
+
+
+class ClientPool:  # pylint: disable=too-many-instance-attributes
+    """Thread-safe pool of client connections to a single Thrift service.
+
+    At most `max_size` connections are open at once. Idle connections are
+    reused most recently used first, and are checked for staleness before
+    they are handed out. Connections that raise a connection error during a
+    call are closed instead of being returned to the pool.
+    """
+
+    def __init__(self, service, *, host='127.0.0.1', port=9090,
+                 proto_factory=None, trans_factory=None, max_size=10,
+                 idle_timeout=60, checkout_timeout=None, timeout=3000):
+        # pylint: disable=too-many-arguments
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1.')
+
+        self.service = service
+        self.host = host
+        self.port = port
+        self.proto_factory = proto_factory or TBinaryProtocolFactory()
+        self.trans_factory = trans_factory or TBufferedTransportFactory()
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.timeout = timeout
+
+        self.size = 0
+        self._idle = collections.deque()
+        self._condition = threading.Condition()
+
+    def _connect(self):
+        sock = TSocket(self.host, self.port, socket_timeout=self.timeout)
+        transport = self.trans_factory.get_transport(sock)
+        protocol = self.proto_factory.get_protocol(transport)
+        transport.open()
+        return _PooledConnection(TClient(self.service, protocol), sock)
+
+    def _remove(self, connection):
+        """Closes a connection and frees up its slot in the pool
+        """
+        try:
+            connection.close()
+        finally:
+            with self._condition:
+                self.size -= 1
+                self._condition.notify()
+
+    def acquire(self, block=True):
+        """Checks out a connection, opening a new one if there is room
+        :param block: Whether to wait for a connection to become free
+        :return: _PooledConnection
+        :raises ClientPoolExhausted: If no connection became free in time
+        """
+        deadline = None
+        if not block:
+            deadline = time.time()
+        elif self.checkout_timeout is not None:
+            deadline = time.time() + self.checkout_timeout
+
+        with self._condition:
+            while True:
+                while self._idle:
+                    connection = self._idle.pop()
+                    if not connection.is_stale(self.idle_timeout):
+                        return connection
+                    connection.close()
+                    self.size -= 1
+
+                if self.size < self.max_size:
+                    self.size += 1
+                    break
+
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise ClientPoolExhausted(
+                            f'No connection to {self.host}:{self.port} '
+                            f'became free within '
+                            f'{self.checkout_timeout if block else 0}s.'
+                        )
+                self._condition.wait(remaining)
+
+        try:
+            return self._connect()
+        except BaseException:
+            with self._condition:
+                self.size -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, connection):
+        """Returns a healthy connection to the pool
+        """
+        connection.last_used = time.time()
+        with self._condition:
+            self._idle.append(connection)
+            self._condition.notify()
+
+    def discard(self, connection):
+        """Closes a connection that should not be used again
+        """
+        self._remove(connection)
+
+    def finish(self, connection, exc=None):
+        """Returns a connection to the pool after a call, or closes it if
+        the call raised a connection error
+        :param connection: _PooledConnection returned from `acquire`
+        :param exc: Exception the call raised, if any
+        """
+        if exc is not None and is_connection_error(exc):
+            self.discard(connection)
+        else:
+            self.release(connection)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Checks out a client for the duration of the `with` block
+
+        :return: Thriftpy client
+        """
+        connection = self.acquire()
+        try:
+            yield connection.client
+        except BaseException as exc:
+            self.finish(connection, exc)
+            raise
+        self.finish(connection)
+
+    def close(self):
+        """Closes every idle connection in the pool
+        """
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+        for connection in idle:
+            self._remove(connection)
+
+
+class PooledClient:
+    """Client with the RPC functions of a service, that checks a connection
+    out of a `ClientPool` for each call. Safe to share between threads.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __getattr__(self, name):
+        if name not in self.pool.service.thrift_services:
+            raise AttributeError(
+                f"'{type(self).__name__}' object has no attribute '{name}'"
+            )
+
+        def call(*args, **kwargs):
+            with self.pool.connection() as client:
+                return getattr(client, name)(*args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+    def __dir__(self):
+        return list(self.pool.service.thrift_services)
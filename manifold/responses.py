@@ -0,0 +1,115 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import logging
+
+from thriftpy.thrift import TException
+
+from manifold.serialize import serialize
+
+logger = logging.getLogger(__name__)
+
+
+def error_response(name, exc):
+    """Builds the response for an exception raised by an RPC call
+    :param name: The RPC function name that was called
+    :param exc: KeyError, TypeError, or Thrift exception that was raised
+    :return: Dictionary of the response to send back as JSON
+    """
+    if isinstance(exc, KeyError):
+        logger.error(
+            f"Invalid HTTP args to '{name}': {str(exc)}"
+        )
+        return {
+            'response': 'error',
+            'error': str(exc)
+        }
+
+    if isinstance(exc, TypeError):
+        logger.error(
+            f"Invalid HTTP args to '{name}', check JSON: {str(exc)}"
+        )
+        error = 'Invalid Thrift request.'
+        if 'unexpected' in str(exc):
+            error = 'Unable to coerce keywords into handler.'
+        elif 'required' in str(exc):
+            error = 'Missing Thrift keys.'
+        return {'response': 'error', 'error': error}
+
+    # Handle Thrift Exceptions
+    return {
+        'response': 'error',
+        'exception': serialize(exc),
+        'exceptionType': str(type(exc).__name__)
+    }
+
+
+CALL_ERRORS = (KeyError, TypeError, TException)
+
+
+class ResponseStream:
+    """Items of a list response that a handler function returned as an
+    iterator, such as a generator, serialized one at a time as they are
+    streamed
+    """
+
+    def __init__(self, name, items):
+        self.name = name
+        self.items = items
+
+    def __iter__(self):
+        for item in self.items:
+            yield serialize(item)
+
+    def error(self, exc):
+        """Builds the error response for an exception raised mid-stream
+        :param exc: Exception raised while iterating
+        :return: Dictionary of the error response
+        """
+        if isinstance(exc, CALL_ERRORS):
+            return error_response(self.name, exc)
+        logger.exception(exc)
+        return {'response': 'error', 'error': 'Internal server error.'}
+
+
+def stream_json(stream, codec):
+    """Encodes the response of a ResponseStream as a JSON object, one item
+    at a time. An exception while streaming ends the `return` list, and
+    gives the object the keys of the error response instead.
+    """
+    yield b'{"return": ['
+    try:
+        for index, item in enumerate(stream):
+            yield codec.dumps(item) if index == 0 \
+                else b', ' + codec.dumps(item)
+        end = {'response': 'ok'}
+    except Exception as exc:  # pylint: disable=broad-except
+        end = stream.error(exc)
+    # The rest of the object, after its opening brace
+    yield b'], ' + codec.dumps(end)[1:]
+
+
+def stream_ndjson(stream, codec):
+    """Encodes the response of a ResponseStream as newline delimited JSON,
+    with a line for each item and a last line of the response without its
+    `return` key
+    """
+    try:
+        for item in stream:
+            yield codec.dumps(item) + b'\n'
+        end = {'response': 'ok'}
+    except Exception as exc:  # pylint: disable=broad-except
+        end = stream.error(exc)
+    yield codec.dumps(end) + b'\n'
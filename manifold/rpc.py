@@ -15,6 +15,8 @@ limitations under the License.
 """
 import importlib
 import logging
+import random
+import threading
 
 import django
 from django.apps import apps
@@ -23,18 +25,67 @@ try:
     from newrelic import agent
 except ImportError:
     agent = None
-from thriftpy.protocol import TBinaryProtocolFactory
+from thriftpy.protocol import TBinaryProtocolFactory, TCompactProtocolFactory
+from thriftpy.protocol import binary as py_binary, compact as py_compact
+from thriftpy.protocol.multiplex import TMultiplexedProtocolFactory
 from thriftpy.rpc import make_client as thrift_client
 from thriftpy.server import TThreadedServer
-from thriftpy.thrift import TProcessor
+from thriftpy.thrift import TMultiplexedProcessor, TProcessor
 from thriftpy.transport import (
     TBufferedTransportFactory,
+    TFramedTransportFactory,
     TServerSocket,
     TSSLServerSocket,
 )
+try:
+    from thriftpy.protocol import TCyBinaryProtocolFactory
+    from thriftpy.transport import (
+        TCyBufferedTransportFactory,
+        TCyFramedTransportFactory,
+    )
+except ImportError:  # pragma: no cover
+    TCyBinaryProtocolFactory = TBinaryProtocolFactory
+    TCyBufferedTransportFactory = TBufferedTransportFactory
+    TCyFramedTransportFactory = TFramedTransportFactory
+
+from manifold.admission import AdmissionController, TAdmissionProcessor
+from manifold.aio import AsyncClient, TAsyncServer
+from manifold.balancer import BalancedClient, LoadBalancer, parse_endpoint
+from manifold.handler import handler, read_iterator
+from manifold.file import load_module, load_service
+from manifold.pool import ClientPool, PooledClient
+from manifold.server import TPooledServer
+
+SERVER_MODES = ('threaded', 'pooled')
+
+PROTOCOLS = {
+    'binary': TBinaryProtocolFactory,
+    'compact': TCompactProtocolFactory,
+    'accelerated': TCyBinaryProtocolFactory,
+}
+
+# The asyncio server decodes messages from memory, which the
+# C accelerated protocol can not do
+ASYNC_PROTOCOLS = {
+    'binary': py_binary.TBinaryProtocolFactory,
+    'compact': py_compact.TCompactProtocolFactory,
+    'accelerated': py_binary.TBinaryProtocolFactory,
+}
+
+TRANSPORTS = {
+    'buffered': TBufferedTransportFactory,
+    'framed': TFramedTransportFactory,
+}
+
+ACCELERATED_TRANSPORTS = {
+    'buffered': TCyBufferedTransportFactory,
+    'framed': TCyFramedTransportFactory,
+}
 
-from manifold.handler import handler
-from manifold.file import load_service
+# Caches client pools and load balancers so each settings key shares one
+_client_pools = {}
+_load_balancers = {}
+_client_pools_lock = threading.Lock()
 
 
 def _init_django():
@@ -43,6 +94,74 @@ def _init_django():
         django.setup()
 
 
+def _get_choice(key, name, choices, default):
+    """Reads a setting that must be one of `choices` from MANIFOLD settings
+    """
+    value = settings.MANIFOLD[key].get(name, default)
+    if value not in choices:
+        raise ValueError(
+            f'Unknown {name} "{value}" for MANIFOLD key "{key}", '
+            f'expected one of {tuple(choices)}.'
+        )
+    return value
+
+
+def get_protocol_factory(key='default'):
+    """Creates the Thrift protocol factory set by the `protocol` setting
+
+    :param key: Settings key to read the protocol from
+    :return: Thriftpy protocol factory
+    """
+    protocol = _get_choice(key, 'protocol', PROTOCOLS, 'binary')
+    return PROTOCOLS[protocol]()
+
+
+def get_memory_protocol_factory(key='default'):
+    """Creates a pure Python protocol factory for the `protocol` setting,
+    for decoding messages that are already in memory
+
+    :param key: Settings key to read the protocol from
+    :return: Thriftpy protocol factory
+    """
+    protocol = _get_choice(key, 'protocol', PROTOCOLS, 'binary')
+    return ASYNC_PROTOCOLS[protocol]()
+
+
+def get_transport_factory(key='default'):
+    """Creates the Thrift transport factory set by the `transport` setting
+
+    :param key: Settings key to read the transport from
+    :return: Thriftpy transport factory
+    """
+    transport = _get_choice(key, 'transport', TRANSPORTS, 'buffered')
+    if settings.MANIFOLD[key].get('protocol') == 'accelerated':
+        return ACCELERATED_TRANSPORTS[transport]()
+    return TRANSPORTS[transport]()
+
+
+def get_multiplexed_name(key='default'):
+    """Reads the name a service is registered under on a multiplexed server
+    from the `multiplexed` setting. `True` uses the settings key itself.
+
+    :param key: Settings key to read the name from
+    :return: Service name, or None if the key is not multiplexed
+    """
+    multiplexed = settings.MANIFOLD[key].get('multiplexed')
+    if not multiplexed:
+        return None
+    return key if multiplexed is True else multiplexed
+
+
+def _get_client_protocol_factory(key, proto_factory):
+    """Wraps a protocol factory to prefix calls with the service name, if
+    the key is served from a multiplexed server
+    """
+    name = get_multiplexed_name(key)
+    if name is None:
+        return proto_factory
+    return TMultiplexedProtocolFactory(proto_factory, name)
+
+
 __new_relic = False
 
 
@@ -57,8 +176,44 @@ def _print_rpc_config():
     handler.configured = True
 
 
+def _read_call(call):
+    """Wraps the call of a processed message, so an iterator returned by
+    the handler function is read into a list that can be encoded
+    """
+    if call is None:
+        return None
+
+    def read_call():
+        return read_iterator(call())
+
+    return read_call
+
+
+class TListProcessor(TProcessor):
+    """TProcessor that reads iterators returned by handler functions into
+    lists. Coroutines of `async def` handler functions are left as they are.
+    """
+
+    def process_in(self, iprot):
+        api, seqid, result, call = super().process_in(iprot)
+        return api, seqid, result, _read_call(call)
+
+
+class TMultiplexedListProcessor(TMultiplexedProcessor):
+    """TMultiplexedProcessor that reads iterators returned by handler
+    functions into lists
+    """
+
+    def process_in(self, iprot):
+        api, seqid, result, call = super().process_in(iprot)
+        return api, seqid, result, _read_call(call)
+
+
 def get_rpc_application():
     """Creates a Gunicorn Thrift compatible TProcessor and initializes NewRelic
+
+    If the `default` key is `multiplexed`, a TMultiplexedProcessor is created
+    instead, serving the functions mapped to every MANIFOLD key.
     """
     global __new_relic
 
@@ -88,19 +243,60 @@ def get_rpc_application():
 
     _print_rpc_config()
 
-    return TProcessor(load_service(), handler)
+    if get_multiplexed_name() is None:
+        return TListProcessor(load_service(), handler)
+
+    # Serve every service key with mapped functions from the one processor
+    processor = TMultiplexedListProcessor()
+    for key in handler.get_service_keys():
+        processor.register_processor(
+            get_multiplexed_name(key) or key,
+            TListProcessor(load_service(key), handler.get_service_handler(key))
+        )
+    return processor
 
 
 def make_server(host="localhost", port=9090, unix_socket=None,
-                proto_factory=TBinaryProtocolFactory(),
-                trans_factory=TBufferedTransportFactory(),
-                client_timeout=3000, certfile=None):
+                proto_factory=None, trans_factory=None,
+                client_timeout=3000, certfile=None,
+                server_mode=None, pool_size=None, queue_size=None,
+                max_in_flight=None, max_queue_wait=None):
     """Creates a Thrift RPC server and serves it with configuration
+
+    Any of `proto_factory`, `trans_factory`, `server_mode`, `pool_size`,
+    `queue_size`, `max_in_flight`, and `max_queue_wait` that are not given
+    are read from the `default` MANIFOLD settings.
+
+    :param server_mode: `threaded` for a thread per connection (default), or
+                        `pooled` for a fixed pool of worker threads
+    :param pool_size: Number of worker threads for the `pooled` mode
+    :param queue_size: Number of ready connections that can wait for a
+                       worker in the `pooled` mode
+    :param max_in_flight: Number of calls that can run at once, after which
+                          calls are rejected. Unlimited if not set.
+    :param max_queue_wait: Milliseconds a call waits for a running call to
+                           finish before it is rejected
     """
     _init_django()
 
+    thrift_settings = settings.MANIFOLD['default']
+    server_mode = server_mode or thrift_settings.get('server_mode', 'threaded')
+    if server_mode not in SERVER_MODES:
+        raise ValueError(
+            f'Unknown server mode "{server_mode}", '
+            f'expected one of {SERVER_MODES}.'
+        )
+    proto_factory = proto_factory or get_protocol_factory()
+    trans_factory = trans_factory or get_transport_factory()
+
     processor = get_rpc_application()
 
+    max_in_flight = max_in_flight or thrift_settings.get('max_in_flight')
+    if max_in_flight:
+        processor = get_admission_processor(
+            processor, max_in_flight, max_queue_wait
+        )
+
     if unix_socket:
         server_socket = TServerSocket(unix_socket=unix_socket)
         if certfile:
@@ -116,9 +312,18 @@ def make_server(host="localhost", port=9090, unix_socket=None,
     else:
         raise ValueError("Either host/port or unix_socket must be provided.")
 
-    server = TThreadedServer(processor, server_socket,
-                             iprot_factory=proto_factory,
-                             itrans_factory=trans_factory)
+    if server_mode == 'pooled':
+        server = TPooledServer(
+            processor, server_socket,
+            iprot_factory=proto_factory,
+            itrans_factory=trans_factory,
+            pool_size=pool_size or thrift_settings.get('pool_size', 10),
+            queue_size=queue_size or thrift_settings.get('queue_size', 100)
+        )
+    else:
+        server = TThreadedServer(processor, server_socket,
+                                 iprot_factory=proto_factory,
+                                 itrans_factory=trans_factory)
 
     try:
         return server
@@ -128,15 +333,190 @@ def make_server(host="localhost", port=9090, unix_socket=None,
         exit()
 
 
+def get_admission_processor(processor, max_in_flight, max_queue_wait=None):
+    """Wraps a processor to reject calls once `max_in_flight` are running.
+    Rejected calls raise the exception named by the `rejection_exception`
+    setting, if the function declares it in the Thrift file.
+
+    :param processor: TProcessor to wrap
+    :param max_in_flight: Number of calls that can run at once
+    :param max_queue_wait: Milliseconds a call waits for a free slot
+    :return: TAdmissionProcessor
+    """
+    thrift_settings = settings.MANIFOLD['default']
+    if max_queue_wait is None:
+        max_queue_wait = thrift_settings.get('max_queue_wait', 0)
+
+    rejection_exception = thrift_settings.get('rejection_exception')
+    if rejection_exception:
+        rejection_exception = getattr(load_module(), rejection_exception)
+
+    return TAdmissionProcessor(
+        processor,
+        AdmissionController(max_in_flight, max_queue_wait / 1000),
+        rejection_exception=rejection_exception
+    )
+
+
+def make_async_server(host="localhost", port=9090, unix_socket=None,
+                      proto_factory=None, framed=None, executor=None,
+                      client_timeout=None):
+    """Creates a Thrift RPC server that runs on an asyncio event loop
+
+    Handler functions defined with `async def` are awaited on the loop, and
+    regular handler functions are run in `executor`, or the loop's default
+    executor if not given. The protocol and transport are read from the
+    `default` MANIFOLD settings if not given.
+    """
+    _init_django()
+
+    if proto_factory is None:
+        proto_factory = get_memory_protocol_factory()
+    if framed is None:
+        transport = _get_choice('default', 'transport', TRANSPORTS, 'buffered')
+        framed = transport == 'framed'
+
+    processor = get_rpc_application()
+
+    if not unix_socket and not (host and port):
+        raise ValueError("Either host/port or unix_socket must be provided.")
+
+    return TAsyncServer(processor, host=host, port=port,
+                        unix_socket=unix_socket, proto_factory=proto_factory,
+                        framed=framed, executor=executor,
+                        client_timeout=client_timeout)
+
+
 def make_client(key='default'):
-    """Creates a client to call functions with
+    """Creates a client to call functions with. If the key has multiple
+    `endpoints`, the client connects to one of them at random.
 
     :param key: Settings key to create client with
     :return: Thriftpy client
     """
     _init_django()
 
+    host, port = random.choice(get_endpoints(key))
+    proto_factory = _get_client_protocol_factory(
+        key, get_protocol_factory(key)
+    )
+    return thrift_client(load_service(key), host=host, port=port,
+                         proto_factory=proto_factory,
+                         trans_factory=get_transport_factory(key))
+
+
+def get_endpoints(key='default'):
+    """Reads the service hosts for a settings key, either from its
+    `endpoints` list, or its single `host` and `port`
+
+    :param key: Settings key to read endpoints from
+    :return: List of host and port tuples
+    """
     thrift_settings = settings.MANIFOLD[key]
-    host = thrift_settings.get('host', '127.0.0.1')
-    port = thrift_settings.get('port', 9090)
-    return thrift_client(load_service(key), host=host, port=port)
+    if 'endpoints' in thrift_settings:
+        return [parse_endpoint(item) for item in thrift_settings['endpoints']]
+    return [(
+        thrift_settings.get('host', '127.0.0.1'),
+        thrift_settings.get('port', 9090)
+    )]
+
+
+def _build_client_pool(key, host, port):
+    pool_settings = settings.MANIFOLD[key].get('client_pool', {})
+    return ClientPool(
+        load_service(key),
+        host=host,
+        port=port,
+        proto_factory=_get_client_protocol_factory(
+            key, get_protocol_factory(key)
+        ),
+        trans_factory=get_transport_factory(key),
+        max_size=pool_settings.get('max_size', 10),
+        idle_timeout=pool_settings.get('idle_timeout', 60),
+        checkout_timeout=pool_settings.get('checkout_timeout'),
+        timeout=pool_settings.get('timeout', 3000)
+    )
+
+
+def get_client_pool(key='default'):
+    """Gets the shared connection pool for a settings key, creating it
+    on first use. Pool options are read from the key's `client_pool` dict.
+
+    :param key: Settings key to create the pool with
+    :return: ClientPool
+    """
+    _init_django()
+
+    with _client_pools_lock:
+        if key not in _client_pools:
+            host, port = get_endpoints(key)[0]
+            _client_pools[key] = _build_client_pool(key, host, port)
+        return _client_pools[key]
+
+
+def get_load_balancer(key='default'):
+    """Gets the shared load balancer over every endpoint of a settings key,
+    creating it on first use. Options are read from the key's
+    `load_balancer` dict, and each endpoint gets its own connection pool.
+
+    :param key: Settings key to create the load balancer with
+    :return: LoadBalancer
+    """
+    _init_django()
+
+    with _client_pools_lock:
+        if key not in _load_balancers:
+            balancer_settings = settings.MANIFOLD[key].get('load_balancer', {})
+            pools = [
+                _build_client_pool(key, host, port)
+                for host, port in get_endpoints(key)
+            ]
+            _load_balancers[key] = LoadBalancer(
+                pools,
+                policy=balancer_settings.get('policy', 'p2c'),
+                max_failures=balancer_settings.get('max_failures', 1),
+                ejection_time=balancer_settings.get('ejection_time', 30),
+                hedge_functions=balancer_settings.get('hedge_functions', ()),
+                hedge_delay=balancer_settings.get('hedge_delay', 50) / 1000
+            )
+        return _load_balancers[key]
+
+
+def make_pooled_client(key='default'):
+    """Creates a thread-safe client that checks a connection out of a
+    shared pool for every call. If the key has multiple `endpoints`,
+    calls are load balanced across them.
+
+    :param key: Settings key to create client with
+    :return: PooledClient or BalancedClient
+    """
+    if 'endpoints' in settings.MANIFOLD[key]:
+        return BalancedClient(get_load_balancer(key))
+    return PooledClient(get_client_pool(key))
+
+
+def make_async_client(key='default'):
+    """Creates an awaitable client to call functions with from asyncio code.
+    Connection options are read from the key's `client_pool` dict. If the
+    key has multiple `endpoints`, the client connects to one at random.
+
+    :param key: Settings key to create client with
+    :return: AsyncClient
+    """
+    _init_django()
+
+    pool_settings = settings.MANIFOLD[key].get('client_pool', {})
+    transport = _get_choice(key, 'transport', TRANSPORTS, 'buffered')
+    host, port = random.choice(get_endpoints(key))
+    return AsyncClient(
+        load_service(key),
+        host=host,
+        port=port,
+        proto_factory=_get_client_protocol_factory(
+            key, get_memory_protocol_factory(key)
+        ),
+        framed=transport == 'framed',
+        max_connections=pool_settings.get('max_size', 10),
+        idle_timeout=pool_settings.get('idle_timeout', 60),
+        timeout=pool_settings.get('timeout', 3000) / 1000
+    )
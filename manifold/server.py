@@ -0,0 +1,317 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import logging
+import os
+import queue
+import selectors
+import signal
+import socket
+import threading
+import time
+
+from thriftpy.server import TServer
+from thriftpy.transport import TTransportException
+
+logger = logging.getLogger(__name__)
+
+
+class _Connection:
+    """A client connection and the transports/protocols wrapped around it
+    """
+
+    def __init__(self, server, client):
+        self.client = client
+        self.itrans = server.itrans_factory.get_transport(client)
+        self.otrans = server.otrans_factory.get_transport(client)
+        self.iprot = server.iprot_factory.get_protocol(self.itrans)
+        self.oprot = server.oprot_factory.get_protocol(self.otrans)
+
+    def fileno(self):
+        return self.client.sock.fileno()
+
+    def close(self):
+        self.itrans.close()
+        self.otrans.close()
+
+
+class TPooledServer(TServer):  # pylint: disable=too-many-instance-attributes
+    """Thrift server that serves every connection from a fixed pool of
+    worker threads, instead of starting a thread per connection.
+
+    Idle connections are watched by a single selector thread. Once a
+    connection has a request waiting, it is put on a bounded queue that
+    the workers pull from, so the number of threads stays the same no matter
+    how many clients keep their connections open.
+    """
+
+    def __init__(self, *args, pool_size=10, queue_size=100, **kwargs):
+        self.daemon = kwargs.pop('daemon', True)
+        super().__init__(*args, **kwargs)
+
+        if pool_size < 1:
+            raise ValueError('pool_size must be at least 1.')
+
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        self.closed = False
+
+        self._ready = queue.Queue(maxsize=queue_size)
+        self._pending = queue.Queue()
+        # Created when serving, so forked workers never share them
+        self._selector = None
+        self._wakeup_recv = self._wakeup_send = None
+        self._threads = []
+
+    def _start_thread(self, target, name):
+        thread = threading.Thread(target=target, name=name)
+        thread.daemon = self.daemon
+        thread.start()
+        self._threads.append(thread)
+
+    def _wakeup(self):
+        """Interrupts the selector so it picks up pending connections
+        """
+        if self._wakeup_send is None:
+            return
+        try:
+            self._wakeup_send.send(b'\0')
+        except OSError:  # pragma: no cover
+            pass
+
+    def _watch(self, connection):
+        """Hands an idle connection back to the selector thread
+        """
+        self._pending.put(connection)
+        self._wakeup()
+
+    def _select_loop(self):
+        """Waits for idle connections to become readable, and queues
+        them up for the worker pool
+        """
+        self._selector.register(self._wakeup_recv, selectors.EVENT_READ)
+        while not self.closed:
+            for key, _ in self._selector.select():
+                if key.fileobj is self._wakeup_recv:
+                    self._wakeup_recv.recv(4096)
+                    continue
+                self._selector.unregister(key.fileobj)
+                # Blocks once the queue is full, which stops new
+                # requests from being picked up until a worker frees up
+                self._ready.put(key.fileobj)
+
+            while not self._pending.empty():
+                connection = self._pending.get_nowait()
+                try:
+                    self._selector.register(connection, selectors.EVENT_READ)
+                except (ValueError, OSError):
+                    connection.close()
+
+    def _work_loop(self):
+        """Processes a single request from each ready connection
+        """
+        while True:
+            connection = self._ready.get()
+            if connection is None:
+                return
+
+            try:
+                self.processor.process(connection.iprot, connection.oprot)
+            except TTransportException:
+                connection.close()
+                continue
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception(exc)
+                connection.close()
+                continue
+
+            self._watch(connection)
+
+    def serve(self):
+        """Starts the worker pool and selector, then accepts connections
+        until the server is closed
+        """
+        self.trans.listen()
+
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._start_thread(self._select_loop, 'manifold-selector')
+        for index in range(self.pool_size):
+            self._start_thread(self._work_loop, f'manifold-worker-{index}')
+
+        while not self.closed:
+            try:
+                client = self.trans.accept()
+            except Exception as exc:  # pylint: disable=broad-except
+                if self.closed:
+                    break
+                logger.exception(exc)
+                continue
+
+            self._watch(_Connection(self, client))
+
+    def close(self):
+        """Stops accepting connections and shuts down the worker pool
+        """
+        self.closed = True
+        self._wakeup()
+        for _ in range(self.pool_size):
+            self._ready.put(None)
+        self.trans.close()
+
+
+class _InheritedServerSocket:
+    """Server socket that was already bound and listened to by the
+    prefork master, and is shared by every worker process
+    """
+
+    def __init__(self, trans):
+        self.trans = trans
+        self.sock = trans.sock
+
+    def listen(self):
+        pass
+
+    def accept(self):
+        return self.trans.accept()
+
+    def close(self):
+        # Only close this process' file descriptor. Shutting the socket
+        # down would stop every other worker from accepting too.
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+
+class _StopServer(BaseException):
+    """Raised from signal handlers to stop serving
+    """
+
+
+def _raise_stop(*_):
+    raise _StopServer()
+
+
+class TPreforkServer:
+    """Serves a Thrift server from multiple forked worker processes.
+
+    The master process binds the server socket once, then forks `workers`
+    processes that each serve the wrapped server and accept connections
+    from the shared socket. Workers that exit are restarted, and on
+    SIGINT / SIGTERM every worker is given `graceful_timeout` seconds to
+    finish its in-flight requests before it is killed.
+    """
+
+    # Workers that exit faster than this are restarted after a delay
+    min_worker_lifetime = 1
+
+    def __init__(self, server, workers=2, graceful_timeout=10):
+        if workers < 1:
+            raise ValueError('workers must be at least 1.')
+
+        self.server = server
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.pids = {}
+
+    def serve(self):
+        """Forks the workers, and restarts them as they exit until the
+        master is told to stop
+        """
+        self.server.trans.listen()
+        self.server.trans = _InheritedServerSocket(self.server.trans)
+
+        signal.signal(signal.SIGTERM, _raise_stop)
+        signal.signal(signal.SIGINT, _raise_stop)
+
+        try:
+            for _ in range(self.workers):
+                self._spawn()
+
+            while True:
+                pid, status = os.wait()
+                if pid not in self.pids:  # pragma: no cover
+                    continue
+                lifetime = time.time() - self.pids.pop(pid)
+                logger.warning(
+                    'RPC worker %s exited with status %s, restarting it',
+                    pid, status
+                )
+                if lifetime < self.min_worker_lifetime:
+                    time.sleep(self.min_worker_lifetime)
+                self._spawn()
+        except _StopServer:
+            pass
+        finally:
+            self.stop()
+
+    def _spawn(self):
+        """Forks a new worker process
+        """
+        pid = os.fork()
+        if pid:
+            self.pids[pid] = time.time()
+            return
+
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, _raise_stop)
+            self.server.serve()
+        except _StopServer:
+            pass
+        except BaseException as exc:  # pylint: disable=broad-except
+            logger.exception(exc)
+            exit_code = 1
+        finally:
+            self._close_worker()
+            os._exit(exit_code)  # pylint: disable=protected-access
+
+    def _close_worker(self):
+        """Stops a worker's server and waits for in-flight requests
+        """
+        self.server.close()
+        deadline = time.time() + self.graceful_timeout
+        for thread in threading.enumerate():
+            if thread is threading.current_thread():
+                continue
+            thread.join(max(deadline - time.time(), 0))
+
+    def stop(self):
+        """Gracefully stops all workers, killing any that do not exit
+        within `graceful_timeout`
+        """
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:  # pragma: no cover
+                pass
+
+        deadline = time.time() + self.graceful_timeout
+        while self.pids and time.time() < deadline:
+            for pid in list(self.pids):
+                finished, _ = os.waitpid(pid, os.WNOHANG)
+                if finished:
+                    self.pids.pop(pid)
+            time.sleep(0.05)
+
+        for pid in self.pids:
+            logger.warning('RPC worker %s did not stop, killing it', pid)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.pids.clear()
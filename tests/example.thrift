@@ -39,4 +39,5 @@ service ExampleService {
     void pong(),
     ContainedStruct simple(1: InnerStruct val) throws (1: ExampleException exc),
     ContainedStruct complex(1: ContainedStruct val) throws (1: ExampleException exc),
+    list<InnerStruct> listInner(1: i16 count),
 }
@@ -64,3 +64,11 @@ def handle_complex(val):
 @handler.map_function('multiVarArgument')
 def handle_multi_var(int1, int2):
     return int1 == int2
+
+
+@handler.map_function('listInner')
+def handle_list_inner(count):
+    module = load_module()
+
+    for index in range(count):
+        yield module.InnerStruct(val=index)
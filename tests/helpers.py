@@ -0,0 +1,173 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import asyncio
+import functools
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from manifold.file import load_module
+from manifold.handler import ServiceHandler
+
+
+def free_port():
+    """Finds an unused local port to serve tests from
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _serve(server, is_listening):
+    thread = threading.Thread(target=server.serve)
+    thread.daemon = True
+    thread.start()
+
+    for _ in range(100):
+        if is_listening():
+            return
+        time.sleep(0.01)
+    raise RuntimeError('Server did not start listening.')  # pragma: no cover
+
+
+def start_server(server):
+    """Serves `server` in a background thread until it is listening
+    """
+    _serve(server, lambda: server.trans.sock is not None)
+
+
+def start_async_server(server):
+    """Serves a TAsyncServer in a background thread until it is listening
+    """
+    _serve(server, lambda: server.server is not None)
+
+
+def manifold_settings(**options):
+    """Builds MANIFOLD settings with extra `default` options for tests
+    """
+    default = {
+        'file': 'tests/example.thrift',
+        'service': 'ExampleService',
+        'host': '127.0.0.1',
+        'port': free_port()
+    }
+    default.update(options)
+    return {'default': default}
+
+
+def multiplexed_settings():
+    """Builds MANIFOLD settings serving both test services from one port
+    """
+    manifold = manifold_settings(multiplexed=True)
+    manifold['non-default'] = {
+        'file': 'tests/secondary.thrift',
+        'service': 'DummyService',
+        'host': '127.0.0.1',
+        'port': manifold['default']['port'],
+        'multiplexed': True
+    }
+    return manifold
+
+
+def call_concurrently(func, args):
+    """Calls `func` from a thread for each tuple of arguments in `args`
+    :return: List of each call's result, or the exception it raised
+    """
+    def call(arg):
+        try:
+            return func(*arg)
+        except Exception as exc:  # pylint: disable=broad-except
+            return exc
+
+    with ThreadPoolExecutor(max_workers=len(args)) as executor:
+        return list(executor.map(call, args))
+
+
+# pylint: disable=W0612
+def build_handler(delay=0, coroutines=False, **options):
+    """Builds a handler for the test services.
+
+    `pingPong` and `simple` record their arguments in `handler.calls`, and
+    `pong` and every item of `listInner` record their thread in
+    `handler.threads`. `simple` raises an ExampleException for negative
+    values.
+
+    :param delay: Seconds `pingPong` and `simple` take to return
+    :param coroutines: Whether `pingPong`, `simple`, `listInner`, and
+                       `deadFunction` are `async def` functions, in which
+                       case `listInner` returns a generator
+    :param options: Options to map `pingPong` and `simple` with, such as
+                    `cache` or `coalesce`
+    :return: ServiceHandler
+    """
+    handler = ServiceHandler()
+    handler.configured = True
+    handler.calls = []
+    handler.threads = []
+
+    def ping_pong(val):
+        handler.calls.append(val)
+        return val == 5
+
+    def simple(val):
+        handler.calls.append(val.val)
+        module = load_module()
+        if val.val < 0:
+            raise module.ExampleException(error=f'Bad {val.val}')
+        return module.ContainedStruct(innerStruct=val)
+
+    def list_inner(count):
+        module = load_module()
+        for index in range(count):
+            handler.threads.append(threading.get_ident())
+            yield module.InnerStruct(val=index)
+
+    def dead_function():
+        return None
+
+    def wrap(func, seconds=0):
+        if coroutines:
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                await asyncio.sleep(seconds)
+                return func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            time.sleep(seconds)
+            return func(*args, **kwargs)
+
+        return wrapper if seconds else func
+
+    handler.map_function('pingPong', **options)(wrap(ping_pong, delay))
+    handler.map_function('simple', **options)(wrap(simple, delay))
+    handler.map_function('listInner')(wrap(list_inner))
+    handler.map_function('deadFunction', key='non-default')(
+        wrap(dead_function)
+    )
+
+    @handler.map_function('multiVarArgument')
+    def handle_multi_var(val1, val2):
+        return val1 == val2
+
+    @handler.map_function('pong')
+    def handle_pong():
+        handler.threads.append(threading.get_ident())
+
+    return handler
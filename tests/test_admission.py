@@ -0,0 +1,195 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import asyncio
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from thriftpy.thrift import TApplicationException
+
+from manifold import rpc
+from manifold.admission import AdmissionController, TAdmissionProcessor
+from manifold.file import load_module
+
+from tests.helpers import (
+    build_handler, call_concurrently, manifold_settings, start_server
+)
+
+
+class AdmissionControllerTestSuite(TestCase):
+
+    def test_invalid_max_in_flight(self):
+        with self.assertRaises(ValueError):
+            AdmissionController(0)
+
+    def test_rejects_over_limit(self):
+        controller = AdmissionController(2)
+        self.assertTrue(controller.acquire())
+        self.assertTrue(controller.acquire())
+        self.assertFalse(controller.acquire())
+
+        controller.release()
+        self.assertTrue(controller.acquire())
+        self.assertEqual(controller.stats, {
+            'max_in_flight': 2,
+            'max_queue': None,
+            'in_flight': 2,
+            'waiting': 0,
+            'admitted': 3,
+            'rejected': 1,
+        })
+
+    def test_waits_for_free_slot(self):
+        controller = AdmissionController(1, max_queue_wait=1)
+        controller.acquire()
+        threading.Timer(0.1, controller.release).start()
+
+        start = time.time()
+        self.assertTrue(controller.acquire())
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_max_queue(self):
+        controller = AdmissionController(1, max_queue_wait=None, max_queue=0)
+        controller.acquire()
+        self.assertFalse(controller.acquire())
+        self.assertFalse(controller.try_acquire())
+
+    def test_queue_wait_expires(self):
+        controller = AdmissionController(1, max_queue_wait=0.05)
+        controller.acquire()
+
+        start = time.time()
+        self.assertFalse(controller.acquire())
+        self.assertGreaterEqual(time.time() - start, 0.05)
+        self.assertEqual(controller.stats['rejected'], 1)
+
+    def run_async(self, coro):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    def test_async_waits_for_free_slot(self):
+        controller = AdmissionController(1, max_queue_wait=1)
+        controller.acquire()
+        threading.Timer(0.1, controller.release).start()
+
+        start = time.time()
+        self.assertTrue(self.run_async(controller.acquire_async()))
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(controller.stats['in_flight'], 1)
+        self.assertEqual(controller.stats['waiting'], 0)
+
+    def test_async_queue_wait_expires(self):
+        controller = AdmissionController(1, max_queue_wait=0.05)
+        controller.acquire()
+
+        self.assertFalse(self.run_async(controller.acquire_async()))
+        self.assertEqual(controller.stats['rejected'], 1)
+        self.assertEqual(controller.stats['waiting'], 0)
+
+        controller.release()
+        self.assertEqual(controller.stats['in_flight'], 0)
+
+    def test_async_wait_cancelled(self):
+        controller = AdmissionController(1, max_queue_wait=None)
+        controller.acquire()
+
+        async def cancel_after_admission():
+            task = asyncio.ensure_future(controller.acquire_async())
+            await asyncio.sleep(0.05)
+            self.assertEqual(controller.stats['waiting'], 1)
+            # The slot is handed over, but the call is cancelled before
+            # it gets to run
+            controller.release()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        self.run_async(cancel_after_admission())
+        self.assertEqual(controller.stats['in_flight'], 0)
+        self.assertEqual(controller.stats['waiting'], 0)
+
+
+@mock.patch('manifold.rpc.handler', build_handler(delay=0.3))
+class AdmissionServerTestSuite(TestCase):
+
+    def start_server(self):
+        server = rpc.make_server(
+            host='127.0.0.1', port=settings.MANIFOLD['default']['port']
+        )
+        start_server(server)
+        self.addCleanup(server.close)
+        return server
+
+    def call_server(self, function, *args):
+        def call():
+            client = rpc.make_client()
+            try:
+                return getattr(client, function)(*args)
+            finally:
+                client.close()
+
+        return call_concurrently(call, [()] * 3)
+
+    @override_settings(MANIFOLD=manifold_settings())
+    def test_unlimited_by_default(self):
+        server = self.start_server()
+        self.assertNotIsInstance(server.processor, TAdmissionProcessor)
+
+    @override_settings(MANIFOLD=manifold_settings(max_in_flight=1))
+    def test_rejects_with_application_exception(self):
+        server = self.start_server()
+        results = self.call_server('pingPong', 5)
+
+        rejected = [
+            item for item in results
+            if isinstance(item, TApplicationException)
+        ]
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(len(rejected), 2)
+        self.assertEqual(server.processor.stats['rejected'], 2)
+        self.assertEqual(server.processor.stats['admitted'], 1)
+
+    @override_settings(MANIFOLD=manifold_settings(
+        max_in_flight=1, max_queue_wait=2000
+    ))
+    def test_queued_calls_admitted(self):
+        server = self.start_server()
+        results = self.call_server('pingPong', 5)
+        self.assertEqual(results, [True] * 3)
+        self.assertEqual(server.processor.stats['rejected'], 0)
+
+    @override_settings(MANIFOLD=manifold_settings(
+        max_in_flight=1, rejection_exception='ExampleException'
+    ))
+    def test_rejects_with_declared_exception(self):
+        self.start_server()
+        module = load_module()
+
+        results = self.call_server('simple', module.InnerStruct(val=1))
+        rejected = [
+            item for item in results
+            if isinstance(item, module.ExampleException)
+        ]
+        self.assertEqual(len(rejected), 2)
+
+        # Functions that do not declare it get a TApplicationException
+        results = self.call_server('pingPong', 5)
+        self.assertEqual(results.count(True), 1)
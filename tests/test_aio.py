@@ -0,0 +1,227 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from thriftpy.rpc import make_client as thrift_client
+from thriftpy.thrift import TProcessor
+from thriftpy.transport import TFramedTransportFactory
+
+from manifold import rpc
+from manifold.aio import AsyncClient, TAsyncServer
+from manifold.file import load_module, load_service
+
+from tests.helpers import build_handler, free_port, start_async_server
+
+
+class AsyncServerTestSuite(TestCase):
+
+    def setUp(self):
+        self.port = free_port()
+        handler = build_handler(delay=0.2, coroutines=True)
+        processor = TProcessor(load_service(), handler)
+        self.server = TAsyncServer(processor, host='127.0.0.1', port=self.port)
+        start_async_server(self.server)
+
+    def tearDown(self):
+        self.server.close()
+
+    def make_client(self):
+        return thrift_client(load_service(), host='127.0.0.1', port=self.port)
+
+    def test_make_async_server(self):
+        server = rpc.make_async_server()
+        self.assertIsInstance(server, TAsyncServer)
+
+    def test_make_async_server_no_address(self):
+        with self.assertRaises(ValueError):
+            rpc.make_async_server(host=None)
+
+    def test_async_and_sync_handlers(self):
+        client = self.make_client()
+        self.assertTrue(client.pingPong(5))
+        self.assertFalse(client.pingPong(4))
+        self.assertTrue(client.multiVarArgument(2, 2))
+        self.assertFalse(client.multiVarArgument(2, 3))
+        self.assertEqual(
+            [item.val for item in client.listInner(3)], [0, 1, 2]
+        )
+        client.close()
+
+    def test_thrift_exception(self):
+        client = self.make_client()
+        module = load_module()
+        with self.assertRaises(module.ExampleException) as context:
+            client.simple(module.InnerStruct(val=-3))
+        self.assertEqual(context.exception.error, 'Bad -3')
+        client.close()
+
+    def test_concurrent_slow_calls(self):
+        def call(_):
+            client = self.make_client()
+            try:
+                return client.pingPong(5)
+            finally:
+                client.close()
+
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            results = list(executor.map(call, range(20)))
+
+        self.assertTrue(all(results))
+        # Twenty calls of 0.2 seconds each would take four seconds serially
+        self.assertLess(time.time() - start, 2)
+
+    def test_framed_transport(self):
+        port = free_port()
+        handler = build_handler(delay=0.2, coroutines=True)
+        processor = TProcessor(load_service(), handler)
+        server = TAsyncServer(
+            processor, host='127.0.0.1', port=port, framed=True
+        )
+        start_async_server(server)
+
+        client = thrift_client(
+            load_service(), host='127.0.0.1', port=port,
+            trans_factory=TFramedTransportFactory()
+        )
+        try:
+            self.assertTrue(client.pingPong(5))
+            self.assertTrue(client.multiVarArgument(1, 1))
+        finally:
+            client.close()
+            server.close()
+
+
+class AsyncClientTestSuite(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.port = free_port()
+        handler = build_handler(delay=0.2, coroutines=True)
+        processor = TProcessor(load_service(), handler)
+        cls.server = TAsyncServer(processor, host='127.0.0.1', port=cls.port)
+        start_async_server(cls.server)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.client = AsyncClient(load_service(), port=self.port)
+
+    def tearDown(self):
+        self.client.close()
+        self.loop.close()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_calls(self):
+        self.assertTrue(self.run_async(self.client.pingPong(5)))
+        self.assertFalse(self.run_async(self.client.pingPong(val=4)))
+        self.assertTrue(self.run_async(self.client.multiVarArgument(3, 3)))
+        self.assertIsNone(self.run_async(self.client.pong()))
+
+    def test_thrift_exception(self):
+        module = load_module()
+        with self.assertRaises(module.ExampleException):
+            self.run_async(self.client.simple(module.InnerStruct(val=-1)))
+        # The connection is still healthy, so it is kept for reuse
+        idle = self.client._idle  # pylint: disable=protected-access
+        self.assertEqual(len(idle), 1)
+
+    def test_concurrent_calls_reuse_connections(self):
+        self.client.max_connections = 5
+
+        async def call_many():
+            return await asyncio.gather(
+                *[self.client.pingPong(5) for _ in range(20)]
+            )
+
+        start = time.time()
+        results = self.run_async(call_many())
+        self.assertTrue(all(results))
+        # Four rounds of five concurrent calls
+        self.assertLess(time.time() - start, 2)
+        idle = self.client._idle  # pylint: disable=protected-access
+        self.assertEqual(len(idle), 5)
+
+    def test_call_timeout(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            self.run_async(self.client.call('pingPong', 5, timeout=0.05))
+        # The reply may still arrive, so the connection is not reused
+        idle = self.client._idle  # pylint: disable=protected-access
+        self.assertEqual(len(idle), 0)
+        self.assertTrue(self.run_async(self.client.pingPong(5)))
+
+    def test_connect_timeout(self):
+        async def open_connection(*_):
+            await asyncio.sleep(10)
+
+        self.client.max_connections = 1
+        with mock.patch('asyncio.open_connection', open_connection):
+            start = time.time()
+            with self.assertRaises(asyncio.TimeoutError):
+                self.run_async(self.client.call('pong', timeout=0.05))
+            self.assertLess(time.time() - start, 1)
+        # The timed out call gave its slot back
+        self.assertIsNone(self.run_async(self.client.pong()))
+
+    def test_invalid_calls(self):
+        with self.assertRaises(AttributeError):
+            self.client.notAFunction()
+        with self.assertRaises(TypeError):
+            self.run_async(self.client.pingPong(1, 2))
+        with self.assertRaises(TypeError):
+            self.run_async(self.client.pingPong(value=1))
+        self.assertIn('pingPong', dir(self.client))
+
+    def test_make_async_client(self):
+        port = free_port()
+        handler = build_handler(delay=0.2, coroutines=True)
+        processor = TProcessor(load_service(), handler)
+        server = TAsyncServer(
+            processor, host='127.0.0.1', port=port, framed=True,
+            proto_factory=rpc.ASYNC_PROTOCOLS['compact']()
+        )
+        start_async_server(server)
+
+        manifold = {
+            'default': {
+                'file': 'tests/example.thrift',
+                'service': 'ExampleService',
+                'port': port,
+                'protocol': 'compact',
+                'transport': 'framed',
+                'client_pool': {'max_size': 2, 'timeout': 1000}
+            }
+        }
+        try:
+            with override_settings(MANIFOLD=manifold):
+                client = rpc.make_async_client()
+            self.assertEqual(client.max_connections, 2)
+            self.assertEqual(client.timeout, 1)
+            self.assertTrue(self.run_async(client.pingPong(5)))
+            client.close()
+        finally:
+            server.close()
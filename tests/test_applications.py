@@ -0,0 +1,291 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import asyncio
+import io
+import json
+import threading
+import time
+from unittest import mock
+
+from django.test import Client, TestCase, override_settings
+
+from manifold import applications, http
+
+from tests.helpers import build_handler
+
+
+def deny_pong(_environ, name):
+    if name == 'pong':
+        return '403 Forbidden', {'response': 'error', 'error': 'Denied.'}
+    return None
+
+
+class WSGIApplicationTestSuite(TestCase):
+
+    def call(self, app, name, data=None, method='POST'):
+        body = json.dumps(data).encode() if data is not None else b''
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': f'/{name}',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+        }
+        started = []
+
+        def start_response(status, headers):
+            started.append((status, dict(headers)))
+
+        content = b''.join(app(environ, start_response))
+        status, headers = started[0]
+        self.assertEqual(headers['Content-Type'], 'application/json')
+        self.assertEqual(int(headers['Content-Length']), len(content))
+        return status, content
+
+    def test_served_from_http(self):
+        self.assertIs(http.rpc_application, applications.rpc_application)
+        self.assertIs(http.asgi_application, applications.asgi_application)
+        self.assertIs(http.WSGIApplication, applications.WSGIApplication)
+        self.assertIs(http.ASGIApplication, applications.ASGIApplication)
+        with self.assertRaises(AttributeError):
+            http.notAnApplication  # pylint: disable=pointless-statement
+
+    def test_calls(self):
+        app = applications.WSGIApplication()
+        self.assertEqual(
+            self.call(app, 'pingPong', {'val': 5}),
+            ('200 OK', b'{"return": true, "response": "ok"}')
+        )
+        self.assertEqual(
+            self.call(app, 'pong'),
+            ('200 OK', b'{"return": null, "response": "ok"}')
+        )
+        _, content = self.call(app, 'simple', {'val': {}})
+        self.assertEqual(
+            json.loads(content)['exceptionType'], 'ExampleException'
+        )
+
+    def test_same_responses_as_views(self):
+        app = applications.WSGIApplication()
+        for name, data in (('pingPong', None), ('pingPong', {'value': 5}),
+                           ('multiVarArgument', {'val1': 1, 'val2': 2})):
+            response = Client().post(
+                f'/{name}', json.dumps(data) if data else '',
+                content_type='application/json'
+            )
+            self.assertEqual(
+                self.call(app, name, data)[1], response.content
+            )
+
+    def test_errors(self):
+        app = applications.WSGIApplication()
+        status, content = self.call(app, 'notAFunction')
+        self.assertEqual(status, '404 Not Found')
+        self.assertEqual(json.loads(content), {
+            'response': 'error',
+            'error': 'Unknown RPC function "notAFunction".'
+        })
+        status, _ = self.call(app, 'pong', method='GET')
+        self.assertEqual(status, '405 Method Not Allowed')
+
+    def test_hooks(self):
+        app = applications.WSGIApplication(
+            hooks=['tests.test_applications.deny_pong']
+        )
+        self.assertEqual(
+            self.call(app, 'pong'),
+            ('403 Forbidden', b'{"response": "error", "error": "Denied."}')
+        )
+        self.assertEqual(self.call(app, 'pingPong', {'val': 5})[0], '200 OK')
+
+    def test_batch_path(self):
+        manifold = {
+            'default': {
+                'file': 'tests/example.thrift',
+                'service': 'ExampleService',
+                'http_batch_path': 'batch'
+            }
+        }
+        app = applications.WSGIApplication()
+        with override_settings(MANIFOLD=manifold):
+            status, content = self.call(
+                app, 'batch', [{'function': 'pingPong', 'args': {'val': 4}}]
+            )
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(
+            json.loads(content), [{'return': False, 'response': 'ok'}]
+        )
+
+
+async def deny_pong_async(scope, name):
+    return deny_pong(scope, name)
+
+
+class ASGIApplicationTestSuite(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    async def request(self, app, name, data=None, method='POST'):
+        body = json.dumps(data).encode() if data is not None else b''
+        scope = {'type': 'http', 'method': method, 'path': f'/{name}'}
+        messages = [
+            {'type': 'http.request', 'body': body[:2], 'more_body': True},
+            {'type': 'http.request', 'body': body[2:]},
+        ]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await app(scope, receive, send)
+        self.assertEqual(len(sent), 2)
+        start, response = sent[0], sent[1]
+        headers = dict(start['headers'])
+        self.assertEqual(headers[b'content-type'], b'application/json')
+        self.assertEqual(
+            int(headers[b'content-length']), len(response['body'])
+        )
+        return start['status'], response['body']
+
+    def call(self, app, name, data=None, method='POST'):
+        return self.loop.run_until_complete(
+            self.request(app, name, data, method)
+        )
+
+    def test_same_responses_as_wsgi(self):
+        asgi_app = applications.ASGIApplication()
+        wsgi_app = applications.WSGIApplication()
+        environ = {'REQUEST_METHOD': 'POST', 'wsgi.input': io.BytesIO()}
+        statuses = []
+        for name, data in (('pingPong', {'val': 5}), ('pingPong', None),
+                           ('pong', None), ('simple', {'val': {}}),
+                           ('multiVarArgument', {'value': 1}),
+                           ('notAFunction', None)):
+            body = json.dumps(data).encode() if data is not None else b''
+            environ.update(
+                PATH_INFO=f'/{name}', CONTENT_LENGTH=str(len(body)),
+                **{'wsgi.input': io.BytesIO(body)}
+            )
+            statuses.clear()
+            expected = b''.join(wsgi_app(
+                environ, lambda status, _: statuses.append(status)
+            ))
+            self.assertEqual(
+                self.call(asgi_app, name, data),
+                (int(statuses[0][:3]), expected)
+            )
+
+    @mock.patch('manifold.applications.handler',
+                build_handler(delay=0.2, coroutines=True))
+    def test_async_handlers(self):
+        app = applications.ASGIApplication()
+
+        async def call_many():
+            return await asyncio.gather(*[
+                self.request(app, 'pingPong', {'val': val})
+                for val in (5, 4, 5, 4, 5)
+            ])
+
+        start = time.time()
+        results = self.loop.run_until_complete(call_many())
+        self.assertLess(time.time() - start, 0.6)
+        self.assertEqual([json.loads(body)['return'] for _, body in results],
+                         [True, False, True, False, True])
+
+        _, body = self.call(app, 'simple', {'val': {'val': -1}})
+        self.assertEqual(json.loads(body), {
+            'response': 'error',
+            'exception': {'error': 'Bad -1'},
+            'exceptionType': 'ExampleException'
+        })
+
+    @mock.patch('manifold.applications.handler',
+                build_handler(delay=0.2, coroutines=True))
+    def test_sync_handlers_in_threads(self):
+        app = applications.ASGIApplication(workers=2)
+        self.assertEqual(
+            self.call(app, 'pong'), (200, b'{"return": null, "response": "ok"}')
+        )
+        self.assertNotEqual(
+            applications.handler.threads, [threading.get_ident()]
+        )
+
+    def test_iterators_read_in_threads(self):
+        # Generators, and generators returned by `async def` handlers
+        for handler in (build_handler(), build_handler(coroutines=True)):
+            with mock.patch('manifold.applications.handler', handler):
+                app = applications.ASGIApplication(workers=2)
+                _, body = self.call(app, 'listInner', {'count': 2})
+            self.assertEqual(
+                json.loads(body)['return'], [{'val': 0}, {'val': 1}]
+            )
+            self.assertEqual(len(handler.threads), 2)
+            self.assertNotIn(threading.get_ident(), handler.threads)
+
+    def test_errors_and_hooks(self):
+        app = applications.ASGIApplication(hooks=[deny_pong_async])
+        self.assertEqual(self.call(app, 'pong', method='GET')[0], 405)
+        self.assertEqual(self.call(app, 'notAFunction')[0], 404)
+        self.assertEqual(
+            self.call(app, 'pong'),
+            (403, b'{"response": "error", "error": "Denied."}')
+        )
+
+    @mock.patch('manifold.applications.handler',
+                build_handler(delay=0.2, coroutines=True))
+    def test_batch_path(self):
+        manifold = {
+            'default': {
+                'file': 'tests/example.thrift',
+                'service': 'ExampleService',
+                'http_batch_path': 'batch'
+            }
+        }
+        app = applications.ASGIApplication()
+        calls = [{'function': 'pingPong', 'args': {'val': 5}},
+                 {'function': 'pong'}, {'function': 'notAFunction'}]
+        with override_settings(MANIFOLD=manifold):
+            status, body = self.call(app, 'batch', calls)
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)[:2], [
+            {'return': True, 'response': 'ok'},
+            {'return': None, 'response': 'ok'},
+        ])
+        self.assertEqual(json.loads(body)[2]['response'], 'error')
+
+    def test_lifespan(self):
+        messages = [{'type': 'lifespan.startup'},
+                    {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        self.loop.run_until_complete(applications.ASGIApplication()(
+            {'type': 'lifespan'}, receive, send
+        ))
+        self.assertEqual(
+            sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+        )
@@ -0,0 +1,291 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import time
+
+from django.test import TestCase, override_settings
+from thriftpy.server import TThreadedServer
+from thriftpy.thrift import TProcessor
+from thriftpy.transport import TServerSocket, TTransportException
+
+from manifold import rpc
+from manifold.balancer import BalancedClient, LoadBalancer, parse_endpoint
+from manifold.file import load_module, load_service
+from manifold.pool import ClientPool
+
+from tests.helpers import build_handler, free_port, start_server
+
+
+def make_pools(*ports):
+    return [ClientPool(load_service(), port=port) for port in ports]
+
+
+class LoadBalancerTestSuite(TestCase):
+
+    def test_parse_endpoint(self):
+        self.assertEqual(parse_endpoint('10.0.0.1:9091'), ('10.0.0.1', 9091))
+        self.assertEqual(
+            parse_endpoint({'host': 'rpc', 'port': 9092}), ('rpc', 9092)
+        )
+        with self.assertRaises(ValueError):
+            parse_endpoint('10.0.0.1')
+
+    def test_invalid_balancer(self):
+        with self.assertRaises(ValueError):
+            LoadBalancer([])
+        with self.assertRaises(ValueError):
+            LoadBalancer(make_pools(1), policy='round_robin')
+
+    def test_least_requests(self):
+        balancer = LoadBalancer(make_pools(1, 2, 3), policy='least_requests')
+        first = balancer.choose()
+        second = balancer.choose()
+        third = balancer.choose()
+        self.assertEqual(len({first, second, third}), 3)
+
+        balancer.record(second)
+        self.assertIs(balancer.choose(), second)
+
+    def test_power_of_two_choices(self):
+        balancer = LoadBalancer(make_pools(1, 2, 3), policy='p2c')
+        busy = balancer.endpoints[0]
+        busy.outstanding = 100
+        for _ in range(20):
+            endpoint = balancer.choose()
+            # The busiest endpoint can never win a pair of choices
+            self.assertIsNot(endpoint, busy)
+            balancer.record(endpoint)
+
+    def test_ejection(self):
+        balancer = LoadBalancer(
+            make_pools(1, 2), policy='least_requests', max_failures=2
+        )
+        failing, healthy = balancer.endpoints
+
+        failing.outstanding += 2
+        balancer.record(failing, TTransportException())
+        self.assertTrue(failing.is_available(time.time()))
+        balancer.record(failing, TTransportException())
+        self.assertFalse(failing.is_available(time.time()))
+
+        for _ in range(5):
+            endpoint = balancer.choose()
+            self.assertIs(endpoint, healthy)
+            balancer.record(endpoint)
+
+        # Once the ejection is over, the endpoint is tried again
+        failing.ejected_until = time.time() - 1
+        healthy.outstanding = 1
+        self.assertIs(balancer.choose(), failing)
+
+    def test_service_exceptions_do_not_eject(self):
+        balancer = LoadBalancer(make_pools(1))
+        endpoint = balancer.choose()
+        balancer.record(endpoint, load_module().ExampleException())
+        self.assertEqual(endpoint.failures, 0)
+        self.assertTrue(endpoint.is_available(time.time()))
+
+    def test_all_ejected_still_chosen(self):
+        balancer = LoadBalancer(make_pools(1, 2))
+        for endpoint in balancer.endpoints:
+            endpoint.ejected_until = time.time() + 60
+        self.assertIn(balancer.choose(), balancer.endpoints)
+
+
+class BalancedClientTestSuite(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ports = [free_port(), free_port()]
+        cls.servers = [
+            rpc.make_server(host='127.0.0.1', port=port) for port in cls.ports
+        ]
+        for server in cls.servers:
+            start_server(server)
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers:
+            server.close()
+        super().tearDownClass()
+
+    def test_calls_spread_across_endpoints(self):
+        balancer = LoadBalancer(make_pools(*self.ports))
+        client = BalancedClient(balancer)
+        for _ in range(20):
+            self.assertTrue(client.pingPong(5))
+        for endpoint in balancer.endpoints:
+            self.assertGreater(endpoint.pool.size, 0)
+            self.assertEqual(endpoint.outstanding, 0)
+        balancer.close()
+
+    def test_dead_endpoint_ejected(self):
+        dead_port = free_port()
+        balancer = LoadBalancer(make_pools(dead_port, *self.ports))
+        client = BalancedClient(balancer)
+        for _ in range(10):
+            self.assertTrue(client.pingPong(5))
+
+        dead = balancer.endpoints[0]
+        self.assertFalse(dead.is_available(time.time()))
+        self.assertEqual(dead.pool.size, 0)
+        balancer.close()
+
+    def test_thrift_exception_raised(self):
+        module = load_module()
+        client = BalancedClient(LoadBalancer(make_pools(*self.ports)))
+        with self.assertRaises(module.ExampleException):
+            client.complex(module.ContainedStruct(
+                innerStruct=module.InnerStruct(val=1)
+            ))
+        with self.assertRaises(AttributeError):
+            client.notAFunction()
+        self.assertIn('pingPong', dir(client))
+
+    def test_make_pooled_client_with_endpoints(self):
+        manifold = {
+            'default': {
+                'file': 'tests/example.thrift',
+                'service': 'ExampleService',
+                'endpoints': [f'127.0.0.1:{port}' for port in self.ports],
+                'load_balancer': {'policy': 'least_requests'}
+            }
+        }
+        with override_settings(MANIFOLD=manifold):
+            client = rpc.make_pooled_client()
+            self.assertIsInstance(client, BalancedClient)
+            self.assertIs(client.balancer, rpc.get_load_balancer())
+            self.assertEqual(client.balancer.policy, 'least_requests')
+            self.assertEqual(len(client.balancer.endpoints), 2)
+            self.assertTrue(client.pingPong(5))
+
+            single = rpc.make_client()
+            self.assertTrue(single.pingPong(5))
+            single.close()
+
+        client.balancer.close()
+        rpc._load_balancers.clear()  # pylint: disable=protected-access
+
+
+def serve_replica(delay):
+    """Serves `pingPong` from a replica that takes `delay` seconds to reply
+    """
+    port = free_port()
+    server = TThreadedServer(
+        TProcessor(load_service(), build_handler(delay=delay)),
+        TServerSocket(host='127.0.0.1', port=port),
+        daemon=True
+    )
+    start_server(server)
+    return port
+
+
+class HedgedRequestTestSuite(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.slow_port = serve_replica(0.5)
+        cls.fast_port = serve_replica(0)
+
+    def make_balancer(self, *ports):
+        return LoadBalancer(
+            make_pools(*ports), policy='least_requests',
+            hedge_functions=['pingPong'], hedge_delay=0.05
+        )
+
+    def test_hedge_wins_over_slow_replica(self):
+        balancer = self.make_balancer(self.slow_port, self.fast_port)
+        slow, fast = balancer.endpoints
+        # Make sure the original call goes to the slow replica
+        fast.outstanding += 1
+
+        start = time.time()
+        self.assertTrue(balancer.call('pingPong', 5))
+        self.assertLess(time.time() - start, 0.4)
+        fast.outstanding -= 1
+
+        self.assertEqual(
+            balancer.hedge_stats, {'calls': 1, 'hedged': 1, 'hedge_wins': 1}
+        )
+        self.assertEqual(slow.outstanding, 1)
+        balancer.close()
+
+    def test_fast_reply_not_hedged(self):
+        balancer = self.make_balancer(self.slow_port, self.fast_port)
+        slow, _ = balancer.endpoints
+        slow.outstanding += 1
+
+        self.assertTrue(balancer.call('pingPong', 5))
+        self.assertEqual(
+            balancer.hedge_stats, {'calls': 1, 'hedged': 0, 'hedge_wins': 0}
+        )
+        balancer.close()
+
+    def test_failed_hedge_waits_for_original(self):
+        balancer = self.make_balancer(self.slow_port, free_port())
+        _, dead = balancer.endpoints
+        dead.outstanding += 1
+
+        self.assertTrue(balancer.call('pingPong', 5))
+        self.assertEqual(
+            balancer.hedge_stats, {'calls': 1, 'hedged': 1, 'hedge_wins': 0}
+        )
+        balancer.close()
+
+    def test_busy_endpoint_not_waited_for(self):
+        balancer = self.make_balancer(self.slow_port, self.fast_port)
+        slow, fast = balancer.endpoints
+        fast.pool.max_size = 1
+        held = fast.pool.acquire()
+        fast.outstanding += 1
+
+        start = time.time()
+        self.assertTrue(balancer.call('pingPong', 5))
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(balancer.hedge_stats['hedge_wins'], 0)
+        self.assertEqual(slow.outstanding, 0)
+
+        fast.pool.finish(held)
+        balancer.close()
+
+    def test_single_endpoint_not_hedged(self):
+        balancer = self.make_balancer(self.slow_port)
+
+        self.assertTrue(balancer.call('pingPong', 5))
+        self.assertEqual(
+            balancer.hedge_stats, {'calls': 1, 'hedged': 0, 'hedge_wins': 0}
+        )
+        balancer.close()
+
+    def test_hedge_settings(self):
+        manifold = {
+            'default': {
+                'file': 'tests/example.thrift',
+                'service': 'ExampleService',
+                'endpoints': [f'127.0.0.1:{self.fast_port}'],
+                'load_balancer': {
+                    'hedge_functions': ['pingPong'],
+                    'hedge_delay': 20
+                }
+            }
+        }
+        with override_settings(MANIFOLD=manifold):
+            balancer = rpc.get_load_balancer()
+        self.assertEqual(balancer.hedge_functions, {'pingPong'})
+        self.assertEqual(balancer.hedge_delay, 0.02)
+        balancer.close()
+        rpc._load_balancers.clear()  # pylint: disable=protected-access
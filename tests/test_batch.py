@@ -0,0 +1,134 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import asyncio
+
+from django.test import TestCase
+
+from manifold.batch import Batcher
+from manifold.handler import ServiceHandler
+
+from tests.helpers import call_concurrently
+
+
+# pylint: disable=W0612
+class BatchFunctionTestSuite(TestCase):
+
+    def setUp(self):
+        self.handler = ServiceHandler()
+        self.batches = []
+
+    def map_multi_var(self, **kwargs):
+        @self.handler.map_batch_function('multiVarArgument', **kwargs)
+        def handle_multi_var(calls):
+            self.batches.append(calls)
+            return [int1 == int2 for int1, int2 in calls]
+
+    def test_concurrent_calls_batched(self):
+        self.map_multi_var(window=100)
+        args = [(1, 1), (1, 2)] * 5
+        results = call_concurrently(self.handler.multiVarArgument, args)
+
+        self.assertEqual(results, [True, False] * 5)
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(sorted(self.batches[0]), sorted(args))
+
+    def test_single_call(self):
+        self.map_multi_var(window=1)
+        self.assertTrue(self.handler.multiVarArgument(3, 3))
+        self.assertEqual(self.batches, [[(3, 3)]])
+
+    def test_max_batch_size(self):
+        self.map_multi_var(window=100, max_batch_size=4)
+        results = call_concurrently(
+            self.handler.multiVarArgument, [(1, 1)] * 8
+        )
+
+        self.assertEqual(results, [True] * 8)
+        self.assertTrue(all(len(batch) <= 4 for batch in self.batches))
+        self.assertGreaterEqual(len(self.batches), 2)
+
+    def test_exceptions(self):
+        @self.handler.map_batch_function('pingPong', window=100)
+        def handle_ping_pong(calls):
+            return [
+                ValueError('Bad value') if val < 0 else val == 5
+                for val, in calls
+            ]
+
+        results = call_concurrently(self.handler.pingPong, [(5,), (-1,)])
+        self.assertTrue(results[0])
+        self.assertIsInstance(results[1], ValueError)
+
+        @self.handler.map_batch_function('pong', window=1)
+        def handle_pong(calls):
+            raise RuntimeError('Database is down')
+
+        with self.assertRaises(RuntimeError):
+            self.handler.pong()
+
+        @self.handler.map_batch_function('simple', window=1)
+        def handle_simple(_calls):
+            return []
+
+        with self.assertRaises(ValueError):
+            self.handler.simple(None)
+
+    def test_invalid_results_fail_every_call(self):
+        @self.handler.map_batch_function('pingPong', window=100)
+        def handle_ping_pong(_calls):
+            return None
+
+        results = call_concurrently(self.handler.pingPong, [(5,)] * 3)
+        self.assertTrue(all(isinstance(item, TypeError) for item in results))
+
+    def test_iterator_results(self):
+        @self.handler.map_batch_function('pingPong', window=100)
+        def handle_ping_pong(calls):
+            return (val == 5 for val, in calls)
+
+        results = call_concurrently(self.handler.pingPong, [(5,), (4,)])
+        self.assertEqual(results, [True, False])
+
+    def test_invalid_max_batch_size(self):
+        with self.assertRaises(ValueError):
+            Batcher(lambda calls: calls, max_batch_size=0)
+
+    def test_mapping_listed(self):
+        self.map_multi_var()
+        mappings = self.handler.get_current_mappings()
+        self.assertEqual(
+            mappings['multiVarArgument'].__name__, 'handle_multi_var'
+        )
+
+    def test_async_batch_function(self):
+        @self.handler.map_batch_function('pingPong', window=50)
+        async def handle_ping_pong(calls):
+            self.batches.append(calls)
+            await asyncio.sleep(0)
+            return [val == 5 for val, in calls]
+
+        async def call_many():
+            return await asyncio.gather(
+                *[self.handler.pingPong(val) for val in (5, 4, 5)]
+            )
+
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(call_many())
+        finally:
+            loop.close()
+        self.assertEqual(results, [True, False, True])
+        self.assertEqual(self.batches, [[(5,), (4,), (5,)]])
@@ -0,0 +1,154 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import asyncio
+import json
+import time
+
+from django.test import RequestFactory, TestCase
+
+from manifold.cache import LocalCache, ResultCache
+from manifold.file import load_module
+from manifold.http import wrap_thrift_function
+
+from tests.helpers import build_handler
+
+
+class LocalCacheTestSuite(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LocalCache(max_size=2)
+        cache.set('a', 1, None)
+        cache.set('b', 2, None)
+        cache.get('a')
+        cache.set('c', 3, None)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNot(cache.get('b'), 2)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_entries_expire(self):
+        cache = LocalCache()
+        cache.set('a', 1, 0.05)
+        self.assertEqual(cache.get('a'), 1)
+        time.sleep(0.1)
+        self.assertIsNot(cache.get('a'), 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            LocalCache(max_size=0)
+        with self.assertRaises(ValueError):
+            ResultCache('pingPong', backend='redis')
+
+
+class ResultCacheTestSuite(TestCase):
+
+    def test_results_cached(self):
+        handler = build_handler(cache={'ttl': 60})
+        self.assertTrue(handler.pingPong(5))
+        self.assertTrue(handler.pingPong(val=5))
+        self.assertFalse(handler.pingPong(4))
+
+        self.assertEqual(handler.calls, [5, 4])
+        self.assertEqual(
+            handler.get_cache('pingPong').stats, {'hits': 1, 'misses': 2}
+        )
+
+    def test_struct_arguments(self):
+        handler = build_handler(cache={})
+        module = load_module()
+
+        first = handler.simple(module.InnerStruct(val=1))
+        second = handler.simple(module.InnerStruct(val=1))
+        handler.simple(module.InnerStruct(val=2))
+
+        self.assertIs(first, second)
+        self.assertEqual(len(handler.calls), 2)
+
+    def test_exceptions_not_cached(self):
+        handler = build_handler(cache={})
+        module = load_module()
+
+        for _ in range(2):
+            with self.assertRaises(module.ExampleException):
+                handler.simple(module.InnerStruct(val=-1))
+        self.assertEqual(len(handler.calls), 2)
+
+    def test_ttl(self):
+        handler = build_handler(cache={'ttl': 0.05})
+        handler.pingPong(5)
+        time.sleep(0.1)
+        handler.pingPong(5)
+        self.assertEqual(handler.calls, [5, 5])
+
+    def test_invalidation(self):
+        handler = build_handler(cache={})
+        cache = handler.get_cache('pingPong')
+
+        handler.pingPong(5)
+        handler.pingPong(4)
+        cache.invalidate(val=5)
+        handler.pingPong(5)
+        handler.pingPong(4)
+        self.assertEqual(handler.calls, [5, 4, 5])
+
+        cache.clear()
+        handler.pingPong(4)
+        self.assertEqual(handler.calls, [5, 4, 5, 4])
+
+        with self.assertRaises(KeyError):
+            handler.get_cache('pong')
+
+    def test_django_backend(self):
+        handler = build_handler(cache={'backend': 'django'})
+        cache = handler.get_cache('pingPong')
+        cache.clear()
+
+        handler.pingPong(5)
+        handler.pingPong(5)
+        self.assertEqual(handler.calls, [5])
+
+        cache.clear()
+        handler.pingPong(5)
+        cache.invalidate(5)
+        handler.pingPong(5)
+        self.assertEqual(handler.calls, [5, 5, 5])
+
+    def test_async_function(self):
+        handler = build_handler(coroutines=True, cache={'ttl': 60})
+        loop = asyncio.new_event_loop()
+        try:
+            for _ in range(2):
+                self.assertTrue(loop.run_until_complete(handler.pingPong(5)))
+        finally:
+            loop.close()
+        self.assertEqual(handler.calls, [5])
+
+    def test_http_path(self):
+        handler = build_handler(cache={})
+        view = wrap_thrift_function('pingPong', handler.pingPong)
+
+        for _ in range(2):
+            request = RequestFactory().post(
+                '/pingPong', json.dumps({'val': 5}),
+                content_type='application/json'
+            )
+            response = view(request)
+            self.assertEqual(
+                response.content, b'{"return": true, "response": "ok"}'
+            )
+        self.assertEqual(handler.calls, [5])
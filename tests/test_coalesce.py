@@ -0,0 +1,93 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import asyncio
+import json
+
+from django.test import RequestFactory, TestCase
+
+from manifold.file import load_module
+from manifold.http import wrap_thrift_function
+
+from tests.helpers import build_handler, call_concurrently
+
+
+class SingleFlightTestSuite(TestCase):
+
+    def test_identical_calls_share_execution(self):
+        handler = build_handler(delay=0.2, coalesce=True)
+        results = call_concurrently(handler.pingPong, [(5,)] * 10)
+
+        self.assertEqual(results, [True] * 10)
+        self.assertEqual(handler.calls, [5])
+
+    def test_different_arguments_run_separately(self):
+        handler = build_handler(delay=0.2, coalesce=True)
+        results = call_concurrently(handler.pingPong, [(5,), (4,)] * 5)
+
+        self.assertEqual(results, [True, False] * 5)
+        self.assertEqual(sorted(handler.calls), [4, 5])
+
+    def test_later_calls_run_again(self):
+        handler = build_handler(delay=0.2, coalesce=True)
+        handler.pingPong(5)
+        handler.pingPong(5)
+        self.assertEqual(handler.calls, [5, 5])
+
+    def test_exception_shared(self):
+        handler = build_handler(delay=0.2, coalesce=True)
+        module = load_module()
+        results = call_concurrently(
+            handler.simple, [(module.InnerStruct(val=-1),) for _ in range(5)]
+        )
+
+        self.assertTrue(all(
+            isinstance(item, module.ExampleException) for item in results
+        ))
+        self.assertEqual(handler.calls, [-1])
+
+    def test_async_function(self):
+        handler = build_handler(delay=0.1, coroutines=True, coalesce=True)
+        async def call_many():
+            return await asyncio.gather(
+                *[handler.pingPong(5) for _ in range(5)], handler.pingPong(4)
+            )
+
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(call_many())
+            self.assertTrue(loop.run_until_complete(handler.pingPong(5)))
+        finally:
+            loop.close()
+
+        self.assertEqual(results, [True] * 5 + [False])
+        self.assertEqual(handler.calls, [5, 4, 5])
+
+    def test_http_views(self):
+        handler = build_handler(delay=0.2, coalesce=True)
+        view = wrap_thrift_function('pingPong', handler.pingPong)
+
+        def post():
+            request = RequestFactory().post(
+                '/pingPong', json.dumps({'val': 5}),
+                content_type='application/json'
+            )
+            return view(request).content
+
+        results = call_concurrently(post, [()] * 5)
+        self.assertEqual(
+            results, [b'{"return": true, "response": "ok"}'] * 5
+        )
+        self.assertEqual(handler.calls, [5])
@@ -0,0 +1,166 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import gzip
+import io
+import json
+import unittest
+import zlib
+from unittest import mock
+
+from django.test import RequestFactory, TestCase, override_settings
+
+from manifold import applications, compression, http
+from manifold.compression import Compressor
+from manifold.handler import ServiceHandler
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BODY = json.dumps({'return': [{'val': i} for i in range(200)]}).encode()
+
+
+def compression_settings(**options):
+    return {
+        'default': {
+            'file': 'tests/example.thrift',
+            'service': 'ExampleService',
+            'http_compression': options
+        }
+    }
+
+
+class CompressorTestSuite(TestCase):
+
+    def test_negotiate(self):
+        compressor = Compressor(encodings=('gzip', 'deflate'))
+        self.assertEqual(compressor.negotiate('gzip, deflate'), 'gzip')
+        self.assertEqual(
+            compressor.negotiate('gzip;q=0.5, deflate'), 'deflate'
+        )
+        self.assertEqual(compressor.negotiate('br, *'), 'gzip')
+        self.assertEqual(compressor.negotiate('gzip;q=0, *'), 'deflate')
+        self.assertIsNone(compressor.negotiate('br'))
+        self.assertIsNone(compressor.negotiate(None))
+        self.assertIsNone(compressor.negotiate('identity'))
+
+    def test_compress(self):
+        compressor = Compressor(min_size=100, level=9)
+        body, encoding = compressor.compress(BODY, 'gzip')
+        self.assertEqual(encoding, 'gzip')
+        self.assertEqual(gzip.decompress(body), BODY)
+
+        body, encoding = compressor.compress(BODY, 'deflate')
+        self.assertEqual(encoding, 'deflate')
+        self.assertEqual(zlib.decompress(body), BODY)
+
+    def test_small_bodies_not_compressed(self):
+        compressor = Compressor(min_size=len(BODY) + 1)
+        self.assertEqual(compressor.compress(BODY, 'gzip'), (BODY, None))
+
+        # Compressing would only make random data larger
+        data = bytes(range(256)) * 2
+        compressor = Compressor(min_size=0)
+        self.assertEqual(
+            compressor.compress(zlib.compress(data), 'deflate'),
+            (zlib.compress(data), None)
+        )
+
+    @unittest.skipIf(zstandard is None, 'zstandard is not installed')
+    def test_zstd(self):
+        body, encoding = Compressor().compress(BODY, 'gzip, zstd')
+        self.assertEqual(encoding, 'zstd')
+        self.assertEqual(
+            zstandard.ZstdDecompressor().decompress(body), BODY
+        )
+
+    def test_missing_library(self):
+        with mock.patch.dict(compression.ENCODINGS, {
+                'zstd': (compression.ENCODINGS['zstd'][0], None)}):
+            compressor = Compressor()
+        self.assertEqual(compressor.encodings, ['gzip', 'deflate'])
+        self.assertEqual(compressor.negotiate('zstd, gzip'), 'gzip')
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            Compressor(level=0)
+        with self.assertRaises(ValueError):
+            Compressor(encodings=('br',))
+
+
+# pylint: disable=W0612
+class HTTPCompressionTestSuite(TestCase):
+
+    def setUp(self):
+        handler = ServiceHandler()
+
+        @handler.map_function('pong')
+        def handle_pong():
+            return 'x' * 2000
+
+        self.handler = handler
+
+    def call_view(self, accept_encoding='gzip'):
+        view = http.wrap_thrift_function('pong', self.handler.pong)
+        return view(RequestFactory().post(
+            '/pong', HTTP_ACCEPT_ENCODING=accept_encoding
+        ))
+
+    def test_view(self):
+        with override_settings(MANIFOLD=compression_settings(min_size=500)):
+            response = self.call_view()
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(json.loads(gzip.decompress(response.content)), {
+            'return': 'x' * 2000, 'response': 'ok'
+        })
+
+    def test_view_threshold(self):
+        with override_settings(MANIFOLD=compression_settings(min_size=5000)):
+            response = self.call_view()
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(json.loads(response.content)['response'], 'ok')
+
+    def test_off_by_default(self):
+        response = self.call_view()
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertFalse(response.has_header('Vary'))
+
+    @mock.patch('manifold.applications.handler')
+    def test_wsgi_application(self, mocked_handler):
+        mocked_handler.get_current_mappings.return_value = {
+            'pong': self.handler.pong
+        }
+        environ = {
+            'REQUEST_METHOD': 'POST',
+            'PATH_INFO': '/pong',
+            'HTTP_ACCEPT_ENCODING': 'deflate',
+            'wsgi.input': io.BytesIO(),
+        }
+        started = []
+        with override_settings(MANIFOLD=compression_settings(min_size=500)):
+            content = b''.join(applications.WSGIApplication()(
+                environ, lambda status, headers: started.append(headers)
+            ))
+
+        headers = dict(started[0])
+        self.assertEqual(headers['Content-Encoding'], 'deflate')
+        self.assertEqual(int(headers['Content-Length']), len(content))
+        self.assertEqual(json.loads(zlib.decompress(content)), {
+            'return': 'x' * 2000, 'response': 'ok'
+        })
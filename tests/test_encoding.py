@@ -0,0 +1,176 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import datetime
+import decimal
+import json
+import unittest
+from unittest import mock
+
+from django.test import RequestFactory, TestCase, override_settings
+
+from manifold import encoding
+from manifold.encoding import (
+    CBORCodec, JSONCodec, MessagePackCodec, get_binary_codec, get_json_codec,
+    parse_accept
+)
+from manifold.handler import ServiceHandler
+from manifold.http import wrap_thrift_function
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def json_settings(backend):
+    return {
+        'default': {
+            'file': 'tests/example.thrift',
+            'service': 'ExampleService',
+            'json_backend': backend
+        }
+    }
+
+
+class JSONCodecTestSuite(TestCase):
+
+    data = {
+        'return': [{'val': 1}, {'val': 'é'}],
+        'when': datetime.date(2018, 1, 2),
+        'price': decimal.Decimal('1.50'),
+        'response': 'ok'
+    }
+
+    def test_stdlib_matches_json_response(self):
+        codec = JSONCodec()
+        self.assertEqual(codec.dumps(self.data), (
+            b'{"return": [{"val": 1}, {"val": "\\u00e9"}], '
+            b'"when": "2018-01-02", "price": "1.50", "response": "ok"}'
+        ))
+        self.assertEqual(codec.loads(b'{"val": [1, 2]}'), {'val': [1, 2]})
+
+    @unittest.skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson(self):
+        codec = JSONCodec('orjson')
+        self.assertEqual(codec.backend, 'orjson')
+        encoded = codec.dumps(self.data)
+        self.assertIsInstance(encoded, bytes)
+        self.assertEqual(json.loads(encoded), json.loads(
+            JSONCodec().dumps(self.data)
+        ))
+        self.assertEqual(codec.dumps({1: True}), b'{"1":true}')
+        self.assertEqual(codec.loads(b'{"val": 5}'), {'val': 5})
+
+    def test_invalid_json(self):
+        for backend in ('json', 'orjson'):
+            codec = get_json_codec(backend)
+            with self.assertRaises(ValueError):
+                codec.loads(b'{"val": ')
+            with self.assertRaises(ValueError):
+                codec.loads(b'\xff')
+
+    @mock.patch('importlib.import_module', side_effect=ImportError)
+    def test_missing_backend_falls_back(self, _):
+        with self.assertLogs('manifold.encoding', level='WARNING'):
+            codec = JSONCodec('ujson')
+        self.assertEqual(codec.backend, 'json')
+        self.assertEqual(codec.dumps([1]), b'[1]')
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            JSONCodec('simplejson')
+
+    def test_codecs_shared(self):
+        self.assertIs(get_json_codec('orjson'), get_json_codec('orjson'))
+
+
+class BinaryCodecTestSuite(TestCase):
+
+    data = {
+        'return': [{'val': 1}, {'val': 'é', 'flag': True}, None, 1.5],
+        'when': datetime.date(2018, 1, 2),
+        'response': 'ok'
+    }
+    decoded = dict(data, when='2018-01-02')
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_message_pack(self):
+        codec = MessagePackCodec()
+        self.assertEqual(codec.loads(codec.dumps(self.data)), self.decoded)
+        self.assertEqual(codec.loads(codec.dumps({1: 2})), {1: 2})
+        with self.assertRaises(ValueError):
+            codec.loads(b'\xc1')
+        with self.assertRaises(ValueError):
+            codec.loads(b'\x81')
+
+    @unittest.skipIf(cbor2 is None, 'cbor2 is not installed')
+    def test_cbor(self):
+        codec = CBORCodec()
+        # CBOR has its own tag for dates
+        self.assertEqual(codec.loads(codec.dumps(self.data)), self.data)
+        with self.assertRaises(ValueError):
+            codec.loads(b'\x81')
+
+    def test_missing_library(self):
+        with mock.patch.dict(encoding.BINARY_CODECS, {
+                'application/cbor': (CBORCodec, None)}):
+            self.assertIsNone(get_binary_codec('application/cbor'))
+
+    def test_parse_accept(self):
+        self.assertEqual(parse_accept(None), [])
+        self.assertEqual(parse_accept('*/*'), ['*/*'])
+        self.assertEqual(
+            parse_accept(
+                'application/json;q=0.5, application/CBOR, '
+                'application/msgpack;q=0.9, text/html;q=0'
+            ),
+            ['application/cbor', 'application/msgpack', 'application/json']
+        )
+
+
+# pylint: disable=W0612
+class JSONBackendHTTPTestSuite(TestCase):
+
+    def test_views_use_backend(self):
+        handler = ServiceHandler()
+
+        @handler.map_function('pingPong')
+        def handle_ping_pong(val):
+            return val == 5
+
+        view = wrap_thrift_function('pingPong', handler.pingPong)
+        backends = [('json', b'{"return": true, "response": "ok"}')]
+        if orjson is not None:
+            backends.append(('orjson', b'{"return":true,"response":"ok"}'))
+
+        for backend, expected in backends:
+            with override_settings(MANIFOLD=json_settings(backend)):
+                response = view(RequestFactory().post(
+                    '/pingPong', b'{"val": 5}',
+                    content_type='application/json'
+                ))
+            self.assertEqual(response.content, expected)
+            self.assertEqual(response['Content-Type'], 'application/json')
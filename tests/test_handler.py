@@ -13,11 +13,18 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest import mock
 
 from django.test import TestCase
+from thriftpy.thrift import TApplicationException
 
-from manifold.handler import ServiceHandler
+from manifold.handler import ServiceHandler, read_iterator_async
+
+from tests.helpers import call_concurrently
 
 
 # pylint: disable=W0612
@@ -58,6 +65,24 @@ class ServiceHandlerTests(TestCase):
 
         self.assertEqual(handler.test_call(), "Hello World")
 
+    @mock.patch('manifold.handler.agent')
+    def test_new_relic_transaction_named(self, mocked_agent):
+        handler = ServiceHandler()
+
+        @handler.map_function('test_call')
+        def test_function():
+            return "Hello World"
+
+        mocked_agent.set_transaction_name.assert_not_called()
+        self.assertEqual(handler.test_call(), "Hello World")
+        mocked_agent.set_transaction_name.assert_called_once_with('test_call')
+        self.assertEqual(handler.test_call.__name__, 'test_function')
+
+    def test_plain_attribute_access(self):
+        self.assertIs(
+            ServiceHandler.__getattribute__, object.__getattribute__
+        )
+
     @mock.patch("builtins.print", autospec=True, side_effect=print)
     def test_print_out_mappings(self, mocked_print):
 
@@ -87,3 +112,209 @@ class ServiceHandlerTests(TestCase):
 
         mappings = handler.get_current_mappings()
         self.assertEqual(expected, mappings)
+
+    def test_map_function_to_service_key(self):
+        handler = ServiceHandler()
+
+        @handler.map_function('test_call', key='non-default')
+        def test_function():
+            return "Hello World"
+
+        self.assertEqual(handler.get_current_mappings(), {})
+        self.assertEqual(handler.get_service_keys(), ['default', 'non-default'])
+
+        service_handler = handler.get_service_handler('non-default')
+        self.assertIs(
+            handler.get_service_handler('non-default'), service_handler
+        )
+        self.assertIs(handler.get_service_handler('default'), handler)
+        self.assertEqual(service_handler.test_call(), "Hello World")
+
+        with mock.patch("builtins.print") as mocked_print:
+            handler.print_current_mappings()
+        mocked_print.assert_called_once_with(
+            '* non-default:test_call -- tests.test_handler.test_function'
+        )
+
+    def test_http_cache_options(self):
+        handler = ServiceHandler()
+
+        @handler.map_function('pong', http_cache=True)
+        def handle_pong():
+            return None
+
+        @handler.map_function('pingPong', http_cache={'max_age': 5})
+        def handle_ping_pong(val):
+            return val == 5
+
+        self.assertEqual(handler.get_http_cache('pong'), {})
+        self.assertEqual(handler.get_http_cache('pingPong'), {'max_age': 5})
+        self.assertIsNone(handler.get_http_cache('simple'))
+
+        with self.assertRaises(ValueError):
+            handler.map_function('simple', http_cache={'ttl': 5})
+
+    def test_iterators_read_by_wrappers(self):
+        handler = ServiceHandler()
+
+        @handler.map_function('plain')
+        def plain():
+            yield 1
+
+        @handler.map_function('limited', max_concurrency=1)
+        def limited():
+            # The slot is held while the items are produced
+            yield handler.get_concurrency_limits()['limited']['in_flight']
+
+        @handler.map_function('coalesced', coalesce=True)
+        def coalesced():
+            yield from (1, 2)
+
+        @handler.map_function('cached', cache={'ttl': 10})
+        def cached():
+            yield from (1, 2)
+
+        self.assertNotIsInstance(handler.plain(), list)
+        self.assertEqual(handler.limited(), [1])
+        self.assertEqual(handler.coalesced(), [1, 2])
+        # A cached result has every item on each call
+        self.assertEqual(handler.cached(), [1, 2])
+        self.assertEqual(handler.cached(), [1, 2])
+
+    def test_async_iterators_read_by_wrappers(self):
+        handler = ServiceHandler()
+
+        @handler.map_function('cached', cache={'ttl': 10})
+        async def cached():
+            return iter([1, 2])
+
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(handler.cached()), [1, 2])
+            self.assertEqual(loop.run_until_complete(handler.cached()), [1, 2])
+        finally:
+            loop.close()
+
+    def test_read_iterator_async(self):
+        def names():
+            yield threading.current_thread().name
+
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(read_iterator_async(5)), 5)
+            # Not the loop's default executor, where sync handlers run
+            name, = loop.run_until_complete(read_iterator_async(names()))
+            self.assertTrue(name.startswith('manifold-iterators'))
+
+            with ThreadPoolExecutor(thread_name_prefix='given') as executor:
+                name, = loop.run_until_complete(
+                    read_iterator_async(names(), executor)
+                )
+            self.assertTrue(name.startswith('given'))
+        finally:
+            loop.close()
+
+
+# pylint: disable=W0612
+class ConcurrencyLimitTests(TestCase):
+
+    def test_unlimited_by_default(self):
+        handler = ServiceHandler()
+
+        @handler.map_function('test_call')
+        def test_function():
+            return "Hello World"
+
+        self.assertIs(handler.test_call, test_function)
+        self.assertEqual(handler.get_concurrency_limits(), {})
+
+    def test_calls_over_limit_rejected(self):
+        handler = ServiceHandler()
+
+        @handler.map_function('report', max_concurrency=1)
+        def report():
+            time.sleep(0.2)
+            return "Report"
+
+        @handler.map_function('pong')
+        def pong():
+            return "Pong"
+
+        results = call_concurrently(handler.report, [()] * 3)
+        self.assertEqual(results.count("Report"), 1)
+        self.assertTrue(all(
+            isinstance(item, TApplicationException)
+            for item in results if item != "Report"
+        ))
+        self.assertEqual(handler.pong(), "Pong")
+        self.assertEqual(handler.report.__name__, 'report')
+
+        limits = handler.get_concurrency_limits()
+        self.assertEqual(list(limits), ['report'])
+        self.assertEqual(limits['report']['max_in_flight'], 1)
+        self.assertEqual(limits['report']['in_flight'], 0)
+        self.assertEqual(limits['report']['rejected'], 2)
+
+    def test_queued_calls_wait(self):
+        handler = ServiceHandler()
+
+        @handler.map_function('report', max_concurrency=1, max_queue=2)
+        def report():
+            time.sleep(0.1)
+            return "Report"
+
+        results = call_concurrently(handler.report, [()] * 3)
+        self.assertEqual(results, ["Report"] * 3)
+
+    def test_queue_timeout(self):
+        handler = ServiceHandler()
+
+        @handler.map_function(
+            'report', max_concurrency=1, max_queue=1, queue_timeout=50
+        )
+        def report():
+            time.sleep(0.3)
+            return "Report"
+
+        results = call_concurrently(handler.report, [()] * 2)
+        self.assertEqual(results.count("Report"), 1)
+        self.assertTrue(any(
+            isinstance(item, TApplicationException) for item in results
+        ))
+
+    def test_async_function(self):
+        handler = ServiceHandler()
+
+        @handler.map_function('report', max_concurrency=1)
+        async def report():
+            await asyncio.sleep(0.1)
+            return "Report"
+
+        async def call_many():
+            return await asyncio.gather(
+                *[handler.report() for _ in range(3)],
+                return_exceptions=True
+            )
+
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(call_many())
+        finally:
+            loop.close()
+        self.assertEqual(results.count("Report"), 1)
+        self.assertEqual(
+            handler.get_concurrency_limits()['report']['rejected'], 2
+        )
+
+    def test_service_key_limits(self):
+        handler = ServiceHandler()
+
+        @handler.map_function('report', key='non-default', max_concurrency=2)
+        def report():
+            return "Report"
+
+        service_handler = handler.get_service_handler('non-default')
+        self.assertEqual(
+            service_handler.get_concurrency_limits()['report']['max_in_flight'],
+            2
+        )
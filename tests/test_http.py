@@ -1,8 +1,31 @@
+import asyncio
+import io
 import json
+import time
+import unittest
+from unittest import mock
 
-from django.test import TestCase, Client
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import URLResolver
+from django.urls.resolvers import RegexPattern
+from thriftpy.protocol.binary import TBinaryProtocolFactory
+from thriftpy.protocol.compact import TCompactProtocolFactory
+from thriftpy.thrift import TApplicationException
 
-from manifold import http
+from manifold import applications, encoding, http
+from manifold.aio import decode_reply, encode_call
+from manifold.file import load_module, load_service
+from manifold.handler import ServiceHandler
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 
 class HTTPTestSuite(TestCase):
@@ -10,7 +33,7 @@ class HTTPTestSuite(TestCase):
     client = Client()
 
     def test_urlpatterns_length(self):
-        self.assertEqual(len(http.urlpatterns), 5)
+        self.assertEqual(len(http.urlpatterns), 6)
 
     def test_no_args_call(self):
         response = self.client.post('/pong', {})
@@ -111,3 +134,612 @@ class HTTPTestSuite(TestCase):
             b'{"response": "error", "error": "\\"Expected '
             b'\'val2\' argument.\\""}'
         )
+
+
+class HTTPThriftTestSuite(TestCase):
+
+    def call(self, name, content_type='application/x-thrift',
+             proto_factory=TBinaryProtocolFactory(), path=None, **kwargs):
+        service = load_service()
+        body = encode_call(service, name, 0, proto_factory, kwargs=kwargs)
+        response = Client().post(
+            f'/{path or name}', body, content_type=content_type
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], content_type)
+        return decode_reply(service, name, response.content, proto_factory)
+
+    def test_binary(self):
+        self.assertTrue(self.call('pingPong', val=5))
+        self.assertFalse(self.call('multiVarArgument', val1=1, val2=2))
+        self.assertIsNone(self.call('pong'))
+
+        module = load_module()
+        result = self.call('simple', val=module.InnerStruct(val=1))
+        self.assertEqual(result.innerStruct.val, 234)
+        with self.assertRaises(module.ExampleException):
+            self.call('simple', val=module.InnerStruct())
+
+    def test_protocols(self):
+        self.assertTrue(self.call(
+            'pingPong', 'application/vnd.apache.thrift.compact',
+            TCompactProtocolFactory(), val=5
+        ))
+        self.assertTrue(self.call(
+            'pingPong', 'application/vnd.apache.thrift.binary', val=5
+        ))
+
+        manifold = {
+            'default': {
+                'file': 'tests/example.thrift',
+                'service': 'ExampleService',
+                'protocol': 'compact'
+            }
+        }
+        with override_settings(MANIFOLD=manifold):
+            self.assertTrue(self.call(
+                'pingPong', proto_factory=TCompactProtocolFactory(), val=5
+            ))
+
+    def test_wrong_function(self):
+        with self.assertRaises(TApplicationException) as caught:
+            self.call('pingPong', path='pong', val=5)
+        self.assertEqual(
+            caught.exception.type, TApplicationException.UNKNOWN_METHOD
+        )
+
+    def test_undeclared_exception(self):
+        def handle_ping_pong(val):
+            raise RuntimeError('Database is down')
+
+        view = http.wrap_thrift_function('pingPong', handle_ping_pong)
+        service = load_service()
+        proto_factory = TBinaryProtocolFactory()
+        response = view(RequestFactory().post(
+            '/pingPong',
+            encode_call(
+                service, 'pingPong', 0, proto_factory, kwargs={'val': 5}
+            ),
+            content_type='application/x-thrift'
+        ))
+
+        with self.assertRaises(TApplicationException) as caught:
+            decode_reply(service, 'pingPong', response.content, proto_factory)
+        self.assertEqual(
+            caught.exception.type, TApplicationException.INTERNAL_ERROR
+        )
+
+    def test_invalid_message(self):
+        # Headers of calls to "simple", for the bodies of its arguments
+        name = b'simple'.hex()
+        binary_call = '80010001' + '00000006' + name + '00000000'
+        compact_call = '822100' + '06' + name
+        bodies = {
+            'application/x-thrift': [
+                '8001', '800100017fffffff', b'not thrift'.hex(),
+                # Function name that is not UTF-8
+                '8001000100000002c32800000000',
+                # Field of a type that has no values
+                binary_call + '01000100',
+                # List of 2 ** 31 - 1 strings, and a string as long
+                binary_call + '0f00010b7fffffff00000001',
+                binary_call + '0b00017fffffff41',
+                binary_call[:-8] + '0000c7a3bcc6ad0e066f251f5b1014e1e291'
+                '7f6720a8976feefd18677e3a',
+            ],
+            'application/vnd.apache.thrift.compact': [
+                '82', '822100ff',
+                # Field of an unknown type
+                compact_call + '1dffffffff0f',
+                # Lists and strings longer than the message
+                compact_call + '19fcffffffffffffffff7f',
+                compact_call + '18ffffffff0761',
+                # Map of unknown types
+                compact_call + '1b01dd00',
+            ],
+        }
+        for content_type, messages in bodies.items():
+            for body in messages:
+                start = time.time()
+                response = Client().post(
+                    '/simple', bytes.fromhex(body), content_type=content_type
+                )
+                self.assertEqual(response.status_code, 400, body)
+                self.assertLess(time.time() - start, 1)
+
+    def test_limits(self):
+        module = load_module()
+        kwargs = {'val': module.InnerStruct(val=1)}
+        body = encode_call(
+            load_service(), 'simple', 0, TBinaryProtocolFactory(), kwargs=kwargs
+        )
+        manifold = {
+            'default': {
+                'file': 'tests/example.thrift',
+                'service': 'ExampleService',
+                'http_thrift_limits': {'max_size': len(body) - 1}
+            }
+        }
+        with override_settings(MANIFOLD=manifold):
+            response = Client().post(
+                '/simple', body, content_type='application/x-thrift'
+            )
+        self.assertEqual(response.status_code, 413)
+
+        manifold['default']['http_thrift_limits'] = {'max_depth': 1}
+        with override_settings(MANIFOLD=manifold):
+            response = Client().post(
+                '/simple', body, content_type='application/x-thrift'
+            )
+        self.assertEqual(response.status_code, 400)
+
+    def test_partial_limits(self):
+        module = load_module()
+        kwargs = {'val': module.InnerStruct(val=1)}
+        body = encode_call(
+            load_service(), 'simple', 0, TBinaryProtocolFactory(), kwargs=kwargs
+        )
+        # pylint: disable=protected-access
+        processor = http._FunctionProcessor(
+            load_service(), 'simple', http.handler.simple
+        )
+        with self.assertRaises(http.InvalidMessage):
+            http.call_thrift_message(
+                processor, TBinaryProtocolFactory(), body, {'max_depth': 1}
+            )
+        self.assertTrue(http.call_thrift_message(
+            processor, TBinaryProtocolFactory(), body, {'max_depth': 2}
+        ))
+
+    def test_json_still_default(self):
+        response = Client().post(
+            '/pingPong', json.dumps({'val': 5}),
+            content_type='application/json'
+        )
+        self.assertEqual(
+            response.content, b'{"return": true, "response": "ok"}'
+        )
+
+
+@unittest.skipIf(msgpack is None or cbor2 is None,
+                 'msgpack and cbor2 are not installed')
+class HTTPContentNegotiationTestSuite(TestCase):
+
+    def post(self, name, body, content_type, **headers):
+        return Client().post(
+            f'/{name}', body, content_type=content_type, **headers
+        )
+
+    def test_message_pack(self):
+        response = self.post(
+            'simple', msgpack.packb({'val': {'val': 1}}),
+            'application/msgpack'
+        )
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), {
+            'return': {
+                'some_string': 'Hello World', 'innerStruct': {'val': 234}
+            },
+            'response': 'ok'
+        })
+
+        response = self.post(
+            'pingPong', msgpack.packb({'val': 5}), 'application/x-msgpack'
+        )
+        self.assertEqual(
+            msgpack.unpackb(response.content),
+            {'return': True, 'response': 'ok'}
+        )
+
+    def test_accept(self):
+        response = self.post(
+            'pingPong', json.dumps({'val': 5}), 'application/json',
+            HTTP_ACCEPT='application/cbor'
+        )
+        self.assertEqual(response['Content-Type'], 'application/cbor')
+        self.assertEqual(
+            cbor2.loads(response.content), {'return': True, 'response': 'ok'}
+        )
+
+        response = self.post(
+            'pingPong', cbor2.dumps({'val': 5}), 'application/cbor',
+            HTTP_ACCEPT='application/msgpack;q=0.5, application/json'
+        )
+        self.assertEqual(
+            response.content, b'{"return": true, "response": "ok"}'
+        )
+
+    def test_errors_in_envelope(self):
+        response = self.post(
+            'pingPong', msgpack.packb({'value': 5}), 'application/msgpack'
+        )
+        self.assertEqual(msgpack.unpackb(response.content), {
+            'response': 'error', 'error': '"Expected \'val\' argument."'
+        })
+
+        response = self.post('pingPong', b'\xc1', 'application/msgpack')
+        self.assertEqual(
+            msgpack.unpackb(response.content)['error'],
+            'Invalid Thrift request.'
+        )
+
+    def test_library_not_installed(self):
+        with mock.patch.dict(encoding.BINARY_CODECS, {
+                'application/cbor': (encoding.CBORCodec, None)}):
+            response = self.post(
+                'pingPong', cbor2.dumps({'val': 5}), 'application/cbor'
+            )
+            self.assertEqual(response.status_code, 415)
+            self.assertEqual(json.loads(response.content), {
+                'response': 'error',
+                'error': 'Unsupported content type "application/cbor".'
+            })
+
+            response = self.post(
+                'pingPong', json.dumps({'val': 5}), 'application/json',
+                HTTP_ACCEPT='application/cbor, application/msgpack'
+            )
+            self.assertEqual(response['Content-Type'], 'application/msgpack')
+
+    def test_applications(self):
+        body = msgpack.packb({'val': 5})
+        environ = {
+            'REQUEST_METHOD': 'POST',
+            'PATH_INFO': '/pingPong',
+            'CONTENT_TYPE': 'application/msgpack',
+            'CONTENT_LENGTH': str(len(body)),
+            'HTTP_ACCEPT': 'application/cbor',
+            'wsgi.input': io.BytesIO(body),
+        }
+        headers = []
+        content = b''.join(applications.WSGIApplication()(
+            environ, lambda _, response_headers: headers.extend(
+                response_headers
+            )
+        ))
+        self.assertIn(('Content-Type', 'application/cbor'), headers)
+        self.assertEqual(
+            cbor2.loads(content), {'return': True, 'response': 'ok'}
+        )
+
+        scope = {
+            'type': 'http', 'method': 'POST', 'path': '/pingPong',
+            'headers': [(b'content-type', b'application/msgpack')],
+        }
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body}
+
+        async def send(message):
+            sent.append(message)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(
+                applications.ASGIApplication()(scope, receive, send)
+            )
+        finally:
+            loop.close()
+        self.assertIn(
+            (b'content-type', b'application/msgpack'), sent[0]['headers']
+        )
+        self.assertEqual(
+            msgpack.unpackb(sent[1]['body']),
+            {'return': True, 'response': 'ok'}
+        )
+
+
+# pylint: disable=W0612
+class HTTPConditionalTestSuite(TestCase):
+
+    def setUp(self):
+        self.handler = ServiceHandler()
+        self.handler.value = 5
+
+        @self.handler.map_function('pingPong', http_cache={'max_age': 10})
+        def handle_ping_pong(val):
+            return val == self.handler.value
+
+    def call(self, **headers):
+        view = http.wrap_thrift_function(
+            'pingPong', self.handler.pingPong,
+            http_cache=self.handler.get_http_cache('pingPong')
+        )
+        return view(RequestFactory().post(
+            '/pingPong', json.dumps({'val': 5}),
+            content_type='application/json', **headers
+        ))
+
+    def test_etag(self):
+        response = self.call()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'max-age=10')
+        self.assertEqual(response['Vary'], 'Accept')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+        self.assertEqual(self.call()['ETag'], etag)
+
+        response = self.call(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response['Cache-Control'], 'max-age=10')
+        self.assertEqual(response['Vary'], 'Accept')
+
+        self.assertEqual(
+            self.call(HTTP_IF_NONE_MATCH=f'"other", W/{etag}').status_code,
+            304
+        )
+        self.assertEqual(self.call(HTTP_IF_NONE_MATCH='*').status_code, 304)
+
+    def test_changed_response(self):
+        etag = self.call()['ETag']
+        self.handler.value = 4
+        response = self.call(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(
+            response.content, b'{"return": false, "response": "ok"}'
+        )
+
+    def test_errors_not_tagged(self):
+        view = http.wrap_thrift_function(
+            'pingPong', self.handler.pingPong, http_cache={'max_age': 10}
+        )
+        response = view(RequestFactory().post(
+            '/pingPong', json.dumps({'value': 5}),
+            content_type='application/json'
+        ))
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Cache-Control'))
+
+    def test_not_cacheable(self):
+        view = http.wrap_thrift_function('pingPong', self.handler.pingPong)
+        response = view(RequestFactory().post(
+            '/pingPong', json.dumps({'val': 5}),
+            content_type='application/json'
+        ))
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_compressed_etag_weak(self):
+        @self.handler.map_function('pong', http_cache=True)
+        def handle_pong():
+            return 'x' * 2000
+
+        view = http.wrap_thrift_function(
+            'pong', self.handler.pong, http_cache={}
+        )
+        manifold = {
+            'default': {
+                'file': 'tests/example.thrift',
+                'service': 'ExampleService',
+                'http_compression': {'min_size': 0}
+            }
+        }
+        with override_settings(MANIFOLD=manifold):
+            response = view(RequestFactory().post(
+                '/pong', HTTP_ACCEPT_ENCODING='gzip'
+            ))
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertTrue(response['ETag'].startswith('W/"'))
+            self.assertEqual(response['Vary'], 'Accept, Accept-Encoding')
+
+            response = view(RequestFactory().post(
+                '/pong', HTTP_ACCEPT_ENCODING='gzip',
+                HTTP_IF_NONE_MATCH=response['ETag']
+            ))
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+# pylint: disable=W0612
+class HTTPStreamingTestSuite(TestCase):
+
+    def setUp(self):
+        self.handler = ServiceHandler()
+        self.produced = []
+
+        @self.handler.map_function('pingPong')
+        def handle_ping_pong(val):
+            module = load_module()
+            for index in range(val):
+                self.produced.append(index)
+                if index == 3:
+                    raise module.ExampleException(error='Failed')
+                yield module.InnerStruct(val=index)
+
+        @self.handler.map_function('pong')
+        def handle_pong():
+            return iter([])
+
+    def call(self, name='pingPong', data=None, **headers):
+        view = http.wrap_thrift_function(name, getattr(self.handler, name))
+        return view(RequestFactory().post(
+            f'/{name}', json.dumps(data or {'val': 3}),
+            content_type='application/json', **headers
+        ))
+
+    def test_json_stream(self):
+        response = self.call()
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+        chunks = iter(response.streaming_content)
+        self.assertEqual(next(chunks), b'{"return": [')
+        self.assertEqual(next(chunks), b'{"val": 0}')
+        self.assertEqual(self.produced, [0])
+
+        content = b''.join(chunks)
+        self.assertEqual(
+            b'{"return": [{"val": 0}' + content,
+            b'{"return": [{"val": 0}, {"val": 1}, {"val": 2}], '
+            b'"response": "ok"}'
+        )
+
+        response = self.call('pong')
+        self.assertEqual(
+            b''.join(response.streaming_content),
+            b'{"return": [], "response": "ok"}'
+        )
+
+    def test_ndjson_stream(self):
+        response = self.call(HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(list(response.streaming_content), [
+            b'{"val": 0}\n', b'{"val": 1}\n', b'{"val": 2}\n',
+            b'{"response": "ok"}\n'
+        ])
+
+    def test_error_mid_stream(self):
+        response = self.call(data={'val': 5})
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), {
+            'return': [{'val': 0}, {'val': 1}, {'val': 2}],
+            'response': 'error',
+            'exception': {'error': 'Failed'},
+            'exceptionType': 'ExampleException'
+        })
+
+        response = self.call(
+            data={'val': 5}, HTTP_ACCEPT='application/x-ndjson'
+        )
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(json.loads(lines[-1])['exceptionType'],
+                         'ExampleException')
+
+    def test_read_into_list_elsewhere(self):
+        response = http.call_thrift_function(
+            'pingPong', self.handler.pingPong,
+            load_service().pingPong_args.thrift_spec, {'val': 2}
+        )
+        self.assertEqual(response, {
+            'return': [{'val': 0}, {'val': 1}], 'response': 'ok'
+        })
+
+        response = http.call_thrift_function(
+            'pingPong', self.handler.pingPong,
+            load_service().pingPong_args.thrift_spec, {'val': 5}
+        )
+        self.assertEqual(response['exceptionType'], 'ExampleException')
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_binary_codecs_not_streamed(self):
+        response = self.call(HTTP_ACCEPT='application/msgpack')
+        self.assertFalse(response.streaming)
+        self.assertEqual(msgpack.unpackb(response.content), {
+            'return': [{'val': 0}, {'val': 1}, {'val': 2}], 'response': 'ok'
+        })
+
+
+class HTTPBatchTestSuite(TestCase):
+
+    def post_batch(self, calls, workers=1):
+        view = http.wrap_batch_function(
+            http.handler.get_current_mappings(), workers=workers
+        )
+        request = RequestFactory().post(
+            '/batch', json.dumps(calls), content_type='application/json'
+        )
+        return json.loads(view(request).content)
+
+    def test_batch_calls(self):
+        calls = [
+            {'function': 'pingPong', 'args': {'val': 5}},
+            {'function': 'pong'},
+            {'function': 'multiVarArgument', 'args': {'val1': 1, 'val2': 1}},
+            {'function': 'pingPong', 'args': {'value': 5}},
+            {'function': 'simple', 'args': {'val': {}}},
+            {'function': 'notAFunction'},
+        ]
+        for workers in (1, 4):
+            results = self.post_batch(calls, workers=workers)
+            self.assertEqual(results[:4], [
+                {'return': True, 'response': 'ok'},
+                {'return': None, 'response': 'ok'},
+                {'return': True, 'response': 'ok'},
+                {'response': 'error', 'error': '"Expected \'val\' argument."'},
+            ])
+            self.assertEqual(results[4]['exceptionType'], 'ExampleException')
+            self.assertEqual(results[5]['response'], 'error')
+
+    def test_invalid_batch(self):
+        self.assertEqual(self.post_batch({'function': 'pong'}), {
+            'response': 'error',
+            'error': 'Expected a JSON array of calls.'
+        })
+
+    def test_invalid_function_names(self):
+        calls = [{'function': ['pong']}, {'function': {'name': 'pong'}},
+                 {'function': 5}, 'pong', {'function': 'pong'}]
+        for workers in (1, 4):
+            results = self.post_batch(calls, workers=workers)
+            self.assertEqual(results[:4], [{
+                'response': 'error',
+                'error': 'Expected a "function" mapped to an RPC call.'
+            }] * 4)
+            self.assertEqual(results[4], {'return': None, 'response': 'ok'})
+
+    def test_batch_route(self):
+        manifold = {
+            'default': {
+                'file': 'tests/example.thrift',
+                'service': 'ExampleService',
+                'http_batch_path': 'batch'
+            }
+        }
+        with override_settings(MANIFOLD=manifold):
+            patterns = http.build_urls()
+        self.assertEqual(len(patterns), 7)
+        self.assertEqual(str(patterns[0].pattern), 'batch')
+
+
+class HTTPDispatcherTestSuite(TestCase):
+
+    def build_urls(self, **options):
+        manifold = {
+            'default': {
+                'file': 'tests/example.thrift',
+                'service': 'ExampleService',
+                'http_dispatcher': True,
+                **options
+            }
+        }
+        with override_settings(MANIFOLD=manifold):
+            return http.build_urls()
+
+    def call(self, patterns, name, data=None):
+        match = URLResolver(RegexPattern(r'^/'), patterns).resolve(f'/{name}')
+        request = RequestFactory().post(
+            f'/{name}', json.dumps(data or {}),
+            content_type='application/json'
+        )
+        return match.func(request, *match.args, **match.kwargs)
+
+    def test_single_route(self):
+        patterns = self.build_urls()
+        self.assertEqual(len(patterns), 1)
+
+        response = self.call(patterns, 'pingPong', {'val': 5})
+        self.assertEqual(
+            response.content, b'{"return": true, "response": "ok"}'
+        )
+        response = self.call(patterns, 'pong')
+        self.assertEqual(
+            response.content, b'{"return": null, "response": "ok"}'
+        )
+
+    def test_unknown_function(self):
+        response = self.call(self.build_urls(), 'notAFunction')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.content), {
+            'response': 'error',
+            'error': 'Unknown RPC function "notAFunction".'
+        })
+
+    def test_batch_route_first(self):
+        patterns = self.build_urls(http_batch_path='batch')
+        response = self.call(patterns, 'batch', [{'function': 'pong'}])
+        self.assertEqual(
+            json.loads(response.content), [{'return': None, 'response': 'ok'}]
+        )
@@ -0,0 +1,150 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import tempfile
+
+import thriftpy
+from django.test import TestCase
+from thriftpy.protocol.binary import TBinaryProtocolFactory
+from thriftpy.protocol.compact import TCompactProtocolFactory
+
+from manifold.aio import encode_call
+from manifold.message import InvalidMessage, check_message
+
+CONTAINERS_THRIFT = """
+struct Item {
+    1: i16 val
+}
+
+struct Containers {
+    1: list<i32> ints,
+    2: map<string, list<Item>> items,
+    3: set<bool> flags,
+    4: binary data,
+    5: double ratio,
+    6: i64 total,
+    7: byte small,
+    8: bool done,
+    9: map<i16, i16> empty
+}
+
+service ContainerService {
+    void send(1: Containers containers)
+}
+"""
+
+PROTOCOLS = {
+    'binary': TBinaryProtocolFactory(),
+    'compact': TCompactProtocolFactory(),
+}
+
+
+def load_containers():
+    with tempfile.NamedTemporaryFile(
+            'w', suffix='.thrift', delete=False) as thrift_file:
+        thrift_file.write(CONTAINERS_THRIFT)
+    try:
+        return thriftpy.load(thrift_file.name, module_name='containers_thrift')
+    finally:
+        os.remove(thrift_file.name)
+
+
+class CheckMessageTestSuite(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        module = load_containers()
+        containers = module.Containers(
+            ints=list(range(20)),
+            items={'a': [module.Item(val=1)], 'b': []},
+            flags={True, False},
+            data=b'\x00\xff' * 10,
+            ratio=0.5,
+            total=2 ** 40,
+            small=-1,
+            done=False,
+            empty={}
+        )
+        cls.messages = {
+            protocol: encode_call(
+                module.ContainerService, 'send', 0, proto_factory,
+                args=(containers,)
+            )
+            for protocol, proto_factory in PROTOCOLS.items()
+        }
+
+    def test_valid_messages(self):
+        for protocol, body in self.messages.items():
+            check_message(body, protocol)
+
+    def test_truncated_messages(self):
+        for protocol, body in self.messages.items():
+            for end in range(len(body)):
+                with self.assertRaises(InvalidMessage):
+                    check_message(body[:end], protocol)
+
+    def test_limits(self):
+        for protocol, body in self.messages.items():
+            check_message(
+                body, protocol, max_string_length=20,
+                max_container_length=20, max_depth=5
+            )
+            with self.assertRaises(InvalidMessage):
+                check_message(body, protocol, max_string_length=19)
+            with self.assertRaises(InvalidMessage):
+                check_message(body, protocol, max_container_length=19)
+            with self.assertRaises(InvalidMessage):
+                check_message(body, protocol, max_depth=4)
+
+    def test_lengths_over_message(self):
+        header = b'\x80\x01\x00\x01\x00\x00\x00\x04send\x00\x00\x00\x00'
+        for body in (
+                # List of 1000 i32, holding a single one
+                header + b'\x0c\x00\x01\x0f\x00\x01\x08\x00\x00\x03\xe8\x00',
+                # String of 1000 bytes, holding a single one
+                header + b'\x0c\x00\x01\x0b\x00\x04\x00\x00\x03\xe8a',
+                # Struct that never ends
+                header + b'\x0c\x00\x01' * 100,
+                # Negative list length
+                header + b'\x0c\x00\x01\x0f\x00\x01\x08\xff\xff\xff\xff',
+        ):
+            with self.assertRaises(InvalidMessage):
+                check_message(body)
+
+    def test_invalid_types(self):
+        binary = b'\x80\x01\x00\x01\x00\x00\x00\x04send\x00\x00\x00\x00'
+        compact = b'\x82\x21\x00\x04send'
+        for protocol, body in (
+                ('binary', binary + b'\x01\x00\x01\x00'),
+                ('binary', binary + b'\x0f\x00\x01\x10\x00\x00\x00\x01'),
+                ('compact', compact + b'\x1d\x00'),
+                ('compact', compact + b'\x19\x1e\x00'),
+                ('compact', compact + b'\x1b\x01\x0d\x00\x00'),
+        ):
+            with self.assertRaises(InvalidMessage):
+                check_message(body, protocol)
+
+    def test_bad_headers(self):
+        for protocol, body in (
+                ('binary', b'\x80\x02\x00\x01\x00\x00\x00\x00'),
+                ('binary', b'\x80\x01\x00\x01\x00\x00\x00\x02\xc3\x28'),
+                ('compact', b'\x81\x21\x00\x00'),
+                ('compact', b'\x82\x22\x00\x00'),
+                ('compact', b'\x82\x21' + b'\xff' * 11),
+        ):
+            with self.assertRaises(InvalidMessage):
+                check_message(body, protocol)
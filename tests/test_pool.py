@@ -0,0 +1,137 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import TestCase, override_settings
+from thriftpy.transport import TTransportException
+
+from manifold import rpc
+from manifold.file import load_module, load_service
+from manifold.pool import (
+    ClientPool,
+    ClientPoolExhausted,
+    PooledClient,
+    is_connection_error,
+)
+
+from tests.helpers import free_port, manifold_settings, start_server
+
+
+class ClientPoolTestSuite(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.port = free_port()
+        cls.server = rpc.make_server(host='127.0.0.1', port=cls.port)
+        start_server(cls.server)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+        super().tearDownClass()
+
+    def make_pool(self, **kwargs):
+        return ClientPool(load_service(), port=self.port, **kwargs)
+
+    def test_invalid_max_size(self):
+        with self.assertRaises(ValueError):
+            self.make_pool(max_size=0)
+
+    def test_connection_reused(self):
+        pool = self.make_pool()
+        client = PooledClient(pool)
+        for _ in range(5):
+            self.assertTrue(client.pingPong(5))
+        self.assertEqual(pool.size, 1)
+        pool.close()
+        self.assertEqual(pool.size, 0)
+
+    def test_concurrent_calls_bounded(self):
+        pool = self.make_pool(max_size=2)
+        client = PooledClient(pool)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(client.pingPong, [5] * 40))
+        self.assertTrue(all(results))
+        self.assertLessEqual(pool.size, 2)
+        pool.close()
+
+    def test_checkout_timeout(self):
+        pool = self.make_pool(max_size=1, checkout_timeout=0.05)
+        connection = pool.acquire()
+        with self.assertRaises(ClientPoolExhausted):
+            pool.acquire()
+        pool.release(connection)
+        pool.close()
+
+    def test_thrift_exception_keeps_connection(self):
+        module = load_module()
+        pool = self.make_pool()
+        client = PooledClient(pool)
+        with self.assertRaises(module.ExampleException):
+            client.complex(module.ContainedStruct(
+                innerStruct=module.InnerStruct(val=1)
+            ))
+        self.assertEqual(pool.size, 1)
+        self.assertTrue(client.pingPong(5))
+        self.assertEqual(pool.size, 1)
+        pool.close()
+
+    def test_connection_error_discards(self):
+        pool = self.make_pool()
+        with self.assertRaises(TTransportException):
+            with pool.connection():
+                raise TTransportException()
+        self.assertEqual(pool.size, 0)
+
+    def test_stale_connections_replaced(self):
+        pool = self.make_pool(idle_timeout=10)
+
+        connection = pool.acquire()
+        connection.sock.close()
+        pool.release(connection)
+        self.assertIsNot(pool.acquire(), connection)
+        self.assertEqual(pool.size, 1)
+
+        connection = pool.acquire()
+        pool.release(connection)
+        connection.last_used -= 20
+        self.assertIsNot(pool.acquire(), connection)
+        pool.close()
+
+    def test_is_connection_error(self):
+        module = load_module()
+        self.assertTrue(is_connection_error(OSError()))
+        self.assertTrue(is_connection_error(TTransportException()))
+        self.assertFalse(is_connection_error(module.ExampleException()))
+
+    def test_unknown_function(self):
+        client = PooledClient(self.make_pool())
+        with self.assertRaises(AttributeError):
+            client.notAFunction()
+        self.assertIn('pingPong', dir(client))
+
+    def test_make_pooled_client(self):
+        settings = manifold_settings(
+            port=self.port, client_pool={'max_size': 3}
+        )
+        with override_settings(MANIFOLD=settings):
+            client = rpc.make_pooled_client()
+            self.assertTrue(client.pingPong(5))
+            self.assertIs(client.pool, rpc.get_client_pool())
+            self.assertEqual(client.pool.max_size, 3)
+            client.pool.close()
+            rpc._client_pools.clear()  # pylint: disable=protected-access
@@ -15,12 +15,20 @@ limitations under the License.
 """
 from unittest import mock
 
-from django.test import TestCase
-from thriftpy.thrift import TProcessor
+from django.conf import settings
+from django.test import TestCase, override_settings
+from thriftpy.protocol import TCompactProtocolFactory
+from thriftpy.thrift import TMultiplexedProcessor
+from thriftpy.transport import TFramedTransportFactory
 
 from manifold import rpc
 from manifold.file import load_service
 
+from tests.helpers import (
+    build_handler, manifold_settings, multiplexed_settings, start_async_server,
+    start_server
+)
+
 
 class RPCTestSuite(TestCase):
 
@@ -29,7 +37,7 @@ class RPCTestSuite(TestCase):
     def test_get_rpc_application(self):
         app = rpc.get_rpc_application()
         rpc.handler.configured = None
-        self.assertEqual(type(app), TProcessor)
+        self.assertEqual(type(app), rpc.TListProcessor)
 
     def test_make_server(self):
         self.assertIsNotNone(rpc.make_server())
@@ -42,5 +50,139 @@ class RPCTestSuite(TestCase):
         mocked_client.assert_called_with(
             load_service(),
             host='127.0.0.1',
-            port=9090
+            port=9090,
+            proto_factory=mock.ANY,
+            trans_factory=mock.ANY
+        )
+
+
+class ProtocolSettingsTestSuite(TestCase):
+
+    def test_default_factories(self):
+        self.assertIsInstance(
+            rpc.get_protocol_factory(), rpc.PROTOCOLS['binary']
+        )
+        self.assertIsInstance(
+            rpc.get_transport_factory(), rpc.TRANSPORTS['buffered']
+        )
+
+    @override_settings(MANIFOLD=manifold_settings(
+        protocol='compact', transport='framed'
+    ))
+    def test_configured_factories(self):
+        self.assertIsInstance(
+            rpc.get_protocol_factory(), TCompactProtocolFactory
+        )
+        self.assertIsInstance(
+            rpc.get_transport_factory(), TFramedTransportFactory
         )
+
+    @override_settings(MANIFOLD=manifold_settings(protocol='json'))
+    def test_invalid_protocol(self):
+        with self.assertRaises(ValueError):
+            rpc.get_protocol_factory()
+
+    @override_settings(MANIFOLD=manifold_settings(transport='zlib'))
+    def test_invalid_transport(self):
+        with self.assertRaises(ValueError):
+            rpc.get_transport_factory()
+
+    def assert_round_trip(self, server):
+        start_server(server)
+        client = rpc.make_client()
+        try:
+            self.assertTrue(client.pingPong(5))
+            self.assertFalse(client.multiVarArgument(1, 2))
+            self.assertEqual(
+                [item.val for item in client.listInner(3)], [0, 1, 2]
+            )
+        finally:
+            client.close()
+            server.close()
+
+    @override_settings(MANIFOLD=manifold_settings(
+        protocol='compact', transport='framed'
+    ))
+    def test_compact_framed_round_trip(self):
+        port = settings.MANIFOLD['default']['port']
+        self.assert_round_trip(rpc.make_server(host='127.0.0.1', port=port))
+
+    @override_settings(MANIFOLD=manifold_settings(protocol='accelerated'))
+    def test_accelerated_round_trip(self):
+        port = settings.MANIFOLD['default']['port']
+        self.assert_round_trip(rpc.make_server(host='127.0.0.1', port=port))
+
+    @override_settings(MANIFOLD=manifold_settings(
+        protocol='compact', transport='framed'
+    ))
+    def test_async_compact_framed_round_trip(self):
+        port = settings.MANIFOLD['default']['port']
+        server = rpc.make_async_server(host='127.0.0.1', port=port)
+        self.assertTrue(server.framed)
+        start_async_server(server)
+        client = rpc.make_client()
+        try:
+            self.assertTrue(client.pingPong(5))
+            self.assertEqual(len(client.listInner(3)), 3)
+        finally:
+            client.close()
+            server.close()
+
+
+@mock.patch('manifold.rpc.handler', build_handler())
+class MultiplexedTestSuite(TestCase):
+
+    def setUp(self):
+        # Each test serves from its own port, as closing is asynchronous
+        manifold = multiplexed_settings()
+        self.port = manifold['default']['port']
+        override = override_settings(MANIFOLD=manifold)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_get_multiplexed_name(self):
+        self.assertEqual(rpc.get_multiplexed_name(), 'default')
+        with override_settings(MANIFOLD=manifold_settings()):
+            self.assertIsNone(rpc.get_multiplexed_name())
+        with override_settings(MANIFOLD=manifold_settings(multiplexed='ping')):
+            self.assertEqual(rpc.get_multiplexed_name(), 'ping')
+
+    def test_get_rpc_application(self):
+        app = rpc.get_rpc_application()
+        self.assertIsInstance(app, TMultiplexedProcessor)
+        self.assertEqual(set(app.processors), {'default', 'non-default'})
+
+    def assert_services(self, server):
+        default = rpc.make_client()
+        secondary = rpc.make_client('non-default')
+        try:
+            self.assertTrue(default.pingPong(5))
+            self.assertFalse(default.pingPong(4))
+            self.assertEqual(len(default.listInner(3)), 3)
+            self.assertIsNone(secondary.deadFunction())
+        finally:
+            default.close()
+            secondary.close()
+            server.close()
+
+    def test_threaded_server(self):
+        server = rpc.make_server(host='127.0.0.1', port=self.port)
+        start_server(server)
+        self.assert_services(server)
+
+    @mock.patch('manifold.rpc.handler', build_handler(coroutines=True))
+    def test_async_server(self):
+        server = rpc.make_async_server(host='127.0.0.1', port=self.port)
+        start_async_server(server)
+        self.assert_services(server)
+
+    def test_pooled_client(self):
+        server = rpc.make_server(host='127.0.0.1', port=self.port)
+        start_server(server)
+        try:
+            client = rpc.make_pooled_client('non-default')
+            self.assertIsNone(client.deadFunction())
+            client.pool.close()
+        finally:
+            rpc._client_pools.clear()  # pylint: disable=protected-access
+            server.close()
@@ -0,0 +1,170 @@
+"""
+Copyright 2018 ACV Auctions
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import signal
+import threading
+import time
+import unittest
+
+from django.test import TestCase, override_settings
+from thriftpy.rpc import make_client as thrift_client
+from thriftpy.server import TThreadedServer
+
+from manifold import rpc
+from manifold.file import load_service
+from manifold.server import TPooledServer, TPreforkServer
+
+from tests.helpers import free_port, start_server
+
+
+class PooledServerTestSuite(TestCase):
+
+    def test_make_server_default_mode(self):
+        server = rpc.make_server()
+        self.assertIsInstance(server, TThreadedServer)
+
+    def test_make_server_pooled_mode(self):
+        server = rpc.make_server(server_mode='pooled', pool_size=3)
+        self.assertIsInstance(server, TPooledServer)
+        self.assertEqual(server.pool_size, 3)
+        self.assertEqual(server.queue_size, 100)
+
+    @override_settings(MANIFOLD={
+        'default': {
+            'file': 'tests/example.thrift',
+            'service': 'ExampleService',
+            'server_mode': 'pooled',
+            'pool_size': 4,
+            'queue_size': 8
+        }
+    })
+    def test_make_server_pooled_from_settings(self):
+        server = rpc.make_server()
+        self.assertIsInstance(server, TPooledServer)
+        self.assertEqual(server.pool_size, 4)
+        self.assertEqual(server.queue_size, 8)
+
+    def test_make_server_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            rpc.make_server(server_mode='forked')
+
+    def test_invalid_pool_size(self):
+        with self.assertRaises(ValueError):
+            TPooledServer(rpc.get_rpc_application(), None, pool_size=0)
+
+    def test_more_connections_than_workers(self):
+        port = free_port()
+        server = rpc.make_server(port=port, server_mode='pooled', pool_size=2)
+        start_server(server)
+
+        clients = [
+            thrift_client(load_service(), host='127.0.0.1', port=port)
+            for _ in range(10)
+        ]
+        try:
+            for _ in range(3):
+                for client in clients:
+                    self.assertTrue(client.pingPong(5))
+                    self.assertFalse(client.pingPong(4))
+            thread_names = [thread.name for thread in threading.enumerate()]
+            self.assertEqual(
+                len([n for n in thread_names if 'manifold-worker' in n]), 2
+            )
+        finally:
+            for client in clients:
+                client.close()
+            server.close()
+
+
+def worker_pids(pid):
+    """Reads the child process ids of `pid` from /proc
+    """
+    path = f'/proc/{pid}/task/{pid}/children'
+    with open(path, encoding='ascii') as children:
+        return set(int(child) for child in children.read().split())
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False  # pragma: no cover
+
+
+@unittest.skipUnless(
+    os.path.exists(f'/proc/{os.getpid()}/task/{os.getpid()}/children'),
+    'Requires /proc to find worker processes'
+)
+class PreforkServerTestSuite(TestCase):
+
+    def setUp(self):
+        self.port = free_port()
+        server = rpc.make_server(host='127.0.0.1', port=self.port)
+        prefork = TPreforkServer(server, workers=2, graceful_timeout=1)
+
+        self.master = os.fork()
+        if not self.master:  # pragma: no cover
+            try:
+                prefork.serve()
+            finally:
+                os._exit(0)  # pylint: disable=protected-access
+
+        wait_for(lambda: len(worker_pids(self.master)) == 2)
+
+    def tearDown(self):
+        if self.master:
+            os.kill(self.master, signal.SIGTERM)
+            os.waitpid(self.master, 0)
+
+    def call(self):
+        client = thrift_client(load_service(), host='127.0.0.1', port=self.port)
+        try:
+            return client.pingPong(5)
+        finally:
+            client.close()
+
+    def test_invalid_workers(self):
+        with self.assertRaises(ValueError):
+            TPreforkServer(rpc.make_server(), workers=0)
+
+    def test_workers_serve_shared_socket(self):
+        self.assertEqual(len(worker_pids(self.master)), 2)
+        for _ in range(10):
+            self.assertTrue(self.call())
+
+    def test_crashed_worker_restarted(self):
+        workers = worker_pids(self.master)
+        crashed = workers.pop()
+        os.kill(crashed, signal.SIGKILL)
+
+        self.assertTrue(wait_for(
+            lambda: len(worker_pids(self.master) - {crashed}) == 2
+        ))
+        self.assertNotIn(crashed, worker_pids(self.master))
+        self.assertTrue(self.call())
+
+    def test_graceful_shutdown(self):
+        workers = worker_pids(self.master)
+        os.kill(self.master, signal.SIGTERM)
+        _, status = os.waitpid(self.master, 0)
+        self.master = None
+
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+        for pid in workers:
+            with self.assertRaises(ProcessLookupError):
+                os.kill(pid, 0)